@@ -5,16 +5,15 @@ from .agentpy import *
 __all__ = [
     # '__version__',
     'Model',
-    'Agent',
-    # 'AgentList', 'AgentDList', 'AgentSet',
-    'AgentList', 'AgentSet',
-    # 'AgentIter', 'AgentDListIter', 'AttrIter',
-    'AgentIter', 'AttrIter',
-    'Grid', 'GridIter',
+    'Agent', 'CompactAgent',
+    'AgentList', 'AgentDList', 'AgentSet',
+    'AgentIter', 'AgentDListIter', 'AttrIter', 'AttrExpr',
+    'batched',
+    'Grid', 'GridIter', 'ArrayGrid', 'SparseGrid', 'DistanceField',
     'Space',
     'Network', 'AgentNode',
     'Experiment',
-    'DataDict',
+    'DataDict', 'PartitionedFrame',
     'Sample', 'Values', 'Range', 'IntRange',
     'gridplot', 'animate',
     'AttrDict',
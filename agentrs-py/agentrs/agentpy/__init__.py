@@ -12,33 +12,36 @@ Modified by Benedikt Arnarsson for use in dentalcaries project.
 __all__ = [
     # '__version__',
     'Model',
-    'Agent',
-    # 'AgentList', 'AgentDList', 'AgentSet',
-    'AgentList', 'AgentSet',
-    # 'AgentIter', 'AgentDListIter', 'AttrIter',
-    'AgentIter', 'AttrIter',
-    'Grid', 'GridIter',
+    'Agent', 'CompactAgent',
+    'AgentList', 'AgentDList', 'AgentSet',
+    'AgentIter', 'AgentDListIter', 'AttrIter', 'AttrExpr',
+    'batched',
+    'Grid', 'GridIter', 'ArrayGrid', 'SparseGrid', 'DistanceField',
     'Space',
     'Network', 'AgentNode',
     'Experiment',
-    'DataDict',
+    'DataDict', 'PartitionedFrame',
     'Sample', 'Values', 'Range', 'IntRange',
     'gridplot', 'animate',
     'AttrDict'
 ]
 
-from .agent import Agent
-from .datadict import DataDict
+from .agent import Agent, CompactAgent
+from .datadict import DataDict, PartitionedFrame
 from .experiment import Experiment
-from .grid import Grid, GridIter
+from .grid import ArrayGrid, DistanceField, Grid, GridIter, SparseGrid
 from .model import Model
 from .network import Network, AgentNode
 from .sample import IntRange, Range, Sample, Values
 from .sequences import (
+    AgentDList,
+    AgentDListIter,
     AgentIter,
     AgentList,
     AgentSet,
+    AttrExpr,
     AttrIter,
+    batched,
 )
 from .space import Space
 from .tools import AttrDict
@@ -3,6 +3,7 @@ Agentpy Agent Module
 Content: Agent Classes
 """
 
+from .columns import column_dtypes
 from .object import Object
 
 
@@ -25,3 +26,102 @@ class Agent(Object):
     def __init__(self, model, *args, **kwargs):
         super().__init__(model)
         self.setup(*args, **kwargs)
+
+
+def schema_fields(cls):
+    """ Returns the declared fields of a class and its parents. """
+    fields = {}
+    for base in reversed(cls.__mro__):
+        fields.update(base.__dict__.get('fields', {}))
+    return fields
+
+
+class _Schema(type):
+    """ Metaclass that turns the declared `fields` of a class into slots,
+    so that its instances are created without a `__dict__`. """
+
+    def __new__(mcs, name, bases, namespace, **kwargs):
+        if '__slots__' not in namespace:
+            inherited = {s for base in bases for c in base.__mro__
+                         for s in c.__dict__.get('__slots__', ())}
+            slots = list(namespace.get('fields', {}))
+            if namespace.get('columns'):
+                # Slot in the columnar store, which references agents weakly
+                slots += ['_store', '_slot', '__weakref__']
+            namespace['__slots__'] = tuple(
+                k for k in slots if k not in inherited)
+        namespace['type'] = name
+        cls = super().__new__(mcs, name, bases, namespace, **kwargs)
+        cls._defaults = schema_fields(cls)
+        return cls
+
+
+class CompactAgent(Object, metaclass=_Schema):
+    """ Template for an individual agent with a fixed set of attributes,
+    for models with large populations.
+
+    Attributes are declared in the class attribute `fields`,
+    as a dictionary of names and default values,
+    and are stored in slots instead of a `__dict__`.
+    The agent's type and parameters are looked up through its class
+    and model, and its log is only created when it is first used.
+    This reduces the memory per agent several times compared to
+    :class:`Agent`, which otherwise works the same way.
+    Assigning an attribute that has not been declared
+    raises an :class:`AttributeError`.
+
+    Arguments:
+        model (Model): The model instance.
+        **kwargs: Will be forwarded to :func:`Agent.setup`.
+
+    Attributes:
+        id (int): Unique identifier of the agent.
+        log (dict): Recorded variables of the agent.
+        type (str): Class name of the agent.
+        model (Model): The model instance.
+        p (AttrDict): The model parameters.
+        vars (list of str): Names of the agent's fields.
+
+    Examples:
+
+        Define an agent with two fields::
+
+            class Person(ap.CompactAgent):
+                fields = {'age': 0, 'state': 'susceptible'}
+
+                def setup(self):
+                    self.age = self.model.random.randint(0, 100)
+
+        Default values are shared between all agents,
+        and should therefore not be mutable objects like lists.
+    """
+
+    __slots__ = ('id', 'model', '_log')
+    fields: dict = {}
+    _var_ignore = ()
+
+    def __init__(self, model, *args, **kwargs):
+        super().__init__(model)
+        self.setup(*args, **kwargs)
+
+    def _init_object(self, model, obj_id):
+        self.id = obj_id
+        self.model = model
+        for k, v in self._defaults.items():
+            setattr(self, k, v)
+
+    @property
+    def p(self):
+        return self.model.p
+
+    @property
+    def log(self):
+        try:
+            return self._log
+        except AttributeError:
+            self._log = {}
+            return self._log
+
+    @property
+    def vars(self):
+        return list(column_dtypes(type(self))) + list(self._defaults)
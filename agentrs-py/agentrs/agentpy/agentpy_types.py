@@ -11,6 +11,7 @@ class ModelProtocol(Protocol, Generic[TParameter, TOutput]):
     """Protocol defining what is required of a model."""
     p: Any
     _logs: Any
+    _recorder: Any
     t: int
 
     @abstractmethod
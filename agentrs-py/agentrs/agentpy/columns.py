@@ -0,0 +1,174 @@
+"""
+Agentpy Columns Module
+Content: Columnar storage for numeric agent attributes
+"""
+
+import heapq
+import weakref
+from functools import partial
+
+import numpy as np
+
+
+def column_dtypes(cls):
+    """ Returns the declared columns of a class and its parents. """
+    dtypes = {}
+    for base in reversed(cls.__mro__):
+        dtypes.update(base.__dict__.get('columns', {}))
+    return dtypes
+
+
+class Column:
+    """ Descriptor that links an agent attribute
+    to the agent's slot in a :class:`ColumnStore`. """
+
+    def __init__(self, key):
+        self.key = key
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        return obj._store.data[self.key][obj._slot].item()
+
+    def __set__(self, obj, value):
+        obj._store.data[self.key][obj._slot] = value
+
+
+class ColumnSelection(np.ndarray):
+    """ Copy of the values of a column at scattered slots.
+    Items that are assigned, also through in-place operators,
+    are written back into the column.
+
+    Arguments:
+        column (numpy.ndarray): Array of a :class:`ColumnStore`.
+        slots (numpy.ndarray): Selected slots of the column.
+    """
+
+    def __new__(cls, column, slots):
+        obj = column[slots].view(cls)
+        obj._column, obj._slots = column, slots
+        return obj
+
+    def __array_finalize__(self, obj):
+        self._column, self._slots = None, None
+
+    def __repr__(self):
+        return repr(self.view(np.ndarray))
+
+    def __getitem__(self, key):
+        return self.view(np.ndarray)[key]
+
+    def __setitem__(self, key, value):
+        values = self.view(np.ndarray)
+        values[key] = value
+        self._write_back(key)
+
+    def _write_back(self, key=slice(None)):
+        if self._column is not None:
+            self._column[self._slots[key]] = self.view(np.ndarray)[key]
+
+    def __array_ufunc__(self, ufunc, method, *inputs, out=None, **kwargs):
+        # Compute with plain arrays and write back into selected outputs
+        def plain(x):
+            return x.view(np.ndarray) if isinstance(x, ColumnSelection) else x
+        inputs = tuple(plain(x) for x in inputs)
+        if out is not None:
+            kwargs['out'] = tuple(plain(x) for x in out)
+        result = getattr(ufunc, method)(*inputs, **kwargs)
+        if out is None:
+            return result
+        for x in out:
+            if isinstance(x, ColumnSelection):
+                x._write_back()
+        return out[0] if len(out) == 1 else out
+
+
+class ColumnStore:
+    """ Contiguous storage of the columnar attributes of one agent type.
+    Each attribute is kept in a separate :class:`numpy.ndarray`,
+    and each agent of the type is assigned a fixed slot in these arrays.
+    Agents are only referenced weakly: once an agent is garbage collected,
+    its slot is released and reused for the next new agent,
+    so that the arrays only grow with the number of living agents.
+    Stores are created automatically by the model
+    for agent types that declare `columns`.
+
+    Arguments:
+        dtypes (dict): Names of the attributes and their data types.
+        capacity (int, optional): Initial number of slots (default 64).
+
+    Attributes:
+        data (dict of numpy.ndarray): Arrays of each attribute,
+            including unused capacity at the end.
+        size (int): Number of slots that have been used so far,
+            including released slots that are waiting to be reused.
+    """
+
+    def __init__(self, dtypes, capacity=64):
+        self.dtypes = {k: np.dtype(v) for k, v in dtypes.items()}
+        self.data = {k: np.zeros(capacity, dtype=v)
+                     for k, v in self.dtypes.items()}
+        self.size = 0
+        self._refs = {}  # Slot : Weak reference to the agent
+        self._free = []  # Heap of released slots
+        self._capacity = capacity
+
+    def __repr__(self):
+        return f"ColumnStore ({len(self)} slots, {len(self.data)} columns)"
+
+    def __len__(self):
+        return len(self._refs)
+
+    def __getitem__(self, key):
+        """ Returns a view of the used slots of an attribute. """
+        return self.data[key][:self.size]
+
+    @property
+    def agents(self):
+        """ list: Agent that occupies each slot, or None if it is free. """
+        agents = [None] * self.size
+        for slot, ref in self._refs.items():
+            agents[slot] = ref()
+        return agents
+
+    def reserve(self, n):
+        """ Grows the arrays so that `n` more slots can be assigned.
+        Growing the arrays invalidates previously returned views. """
+        required = self.size + n - len(self._free)
+        if required <= self._capacity:
+            return
+        capacity = max(required, 2 * self._capacity)
+        for k, old in self.data.items():
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            self.data[k] = new
+        self._capacity = capacity
+
+    def _assign(self, obj):
+        if self._free:
+            slot = heapq.heappop(self._free)
+            for array in self.data.values():
+                array[slot] = 0
+        else:
+            slot = self.size
+            self.size += 1
+        self._refs[slot] = weakref.ref(obj, partial(self._release, slot))
+        return slot
+
+    def _release(self, slot, ref=None):
+        if self._refs.get(slot) is ref:
+            del self._refs[slot]
+            heapq.heappush(self._free, slot)
+
+    def add(self, obj):
+        """ Assigns a free slot to an object and returns it. """
+        self.reserve(1)
+        return self._assign(obj)
+
+    def extend(self, objs):
+        """ Assigns a free slot to each object of a sequence
+        and returns the slots as an array. Released slots are reused
+        first, and new slots are consecutive. """
+        objs = list(objs)
+        self.reserve(len(objs))
+        return np.array([self._assign(obj) for obj in objs], dtype=int)
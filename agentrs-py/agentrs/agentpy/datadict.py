@@ -36,6 +36,60 @@ def _last_exp_id(name, path):
     else:
         return None
 
+def _frame(obj):
+    """Return a dataframe, loading it first if it is partitioned."""
+    if isinstance(obj, PartitionedFrame):
+        return obj.load()
+    return obj
+
+#-------------------------------------------------------------#
+#                       Partitioned Data                      #
+#-------------------------------------------------------------#
+
+class PartitionedFrame:
+    """ Lazy handle to a dataframe that is stored on disk
+    as a sequence of Parquet partitions,
+    as created by :func:`Model.run` with the argument `stream`.
+    Data is only read when :func:`PartitionedFrame.load` is called.
+
+    Arguments:
+        paths (list of str or Path): Paths of the partitions.
+    """
+
+    def __init__(self, paths=()):
+        self.paths = [Path(p) for p in paths]
+
+    def __repr__(self):
+        n = len(self.paths)
+        return f"PartitionedFrame ({n} partition{'s' if n != 1 else ''})"
+
+    def __eq__(self, other):
+        if not isinstance(other, PartitionedFrame):
+            return False
+        return self.load().equals(other.load())
+
+    def __add__(self, other):
+        return PartitionedFrame(self.paths + other.paths)
+
+    @classmethod
+    def concat(cls, frames):
+        """ Combines multiple handles into one. """
+        return cls([p for f in frames for p in f.paths])
+
+    def load(self, columns=None):
+        """ Reads all partitions into a single :class:`pandas.DataFrame`,
+        sorted by its index.
+
+        Arguments:
+            columns (list of str, optional):
+                Columns to read (default all).
+        """
+        if not self.paths:
+            return pd.DataFrame()
+        df = pd.concat([pd.read_parquet(p, columns=columns)
+                        for p in self.paths])
+        return df.sort_index(kind='stable')
+
 #-------------------------------------------------------------#
 #                          Main Class                         #
 #-------------------------------------------------------------#
@@ -77,6 +131,10 @@ class DataDict(AttrDict):
                 rep += f" DataFrame with {lv} " \
                        f"variable{'s' if lv != 1 else ''} " \
                        f"and {rv} row{'s' if rv != 1 else ''}"
+            elif isinstance(v, PartitionedFrame):
+                lp = len(v.paths)
+                rep += f" PartitionedFrame with {lp} " \
+                       f"partition{'s' if lp != 1 else ''}"
             elif isinstance(v, DataDict):
                 rep += f"{v.__repr__(indent=True)}"
             elif isinstance(v, dict):
@@ -217,9 +275,9 @@ class DataDict(AttrDict):
             return None
 
         if len(vs.keys()) == 1:
-            return list(vs.values())[0]
+            return _frame(list(vs.values())[0])
         elif isinstance(vs, DataDict):
-            df_dict = dict(vs)
+            df_dict = {k: _frame(v) for k, v in vs.items()}
         else:
             raise ValueError('Invalid DataDict')
 
@@ -336,6 +394,7 @@ class DataDict(AttrDict):
                 output.to_csv(path_dir / f'{key}.csv')
             elif isinstance(output, DataDict):
                 for k, o in output.items():
+                    o = _frame(o)
                     if isinstance(o, pd.DataFrame):
                         o.to_csv(path_dir / f'{key}_{k}.csv')
                     elif isinstance(o, dict):
@@ -1,5 +1,31 @@
+from collections.abc import Mapping
+
 from .object import Object
 
+
+class _PositionsView(Mapping):
+    """ Read-only mapping from agents to their positions,
+    for environments that store positions in arrays. """
+
+    def __init__(self, env):
+        self._env = env
+
+    def __repr__(self):
+        return f"{type(self).__name__} ({len(self)} agents)"
+
+    def __getitem__(self, agent):
+        return self._env._position(agent)
+
+    def __iter__(self):
+        return iter(list(self._env._agents))
+
+    def __len__(self):
+        return len(self._env._agents)
+
+    def __contains__(self, agent):
+        return agent in self._env._rows
+
+
 class SpatialEnvironment(Object):
 
     def record_positions(self, label='p'):
@@ -4,15 +4,16 @@ Content: Experiment class
 """
 
 from datetime import datetime, timedelta
+from pathlib import Path
 import sys
 
 from joblib import Parallel, delayed
 import pandas as pd
 from tqdm import tqdm
 
-from .datadict import DataDict
+from .datadict import DataDict, PartitionedFrame
 from .sample import Sample
-from .tools import make_list, tqdm_joblib
+from .tools import AgentpyError, make_list, tqdm_joblib
 
 
 class Experiment:
@@ -130,22 +131,31 @@ class Experiment:
                 for sk, sv in values.items():
                     if all(isinstance(v, pd.DataFrame) for v in sv):
                         self.output[key][sk] = pd.concat(sv)
+                    elif all(isinstance(v, PartitionedFrame) for v in sv):
+                        self.output[key][sk] = PartitionedFrame.concat(sv)
                     else:
                         self.output[key][sk] = sv
             elif key != 'info':
                 self.output[key] = values
 
-    def _single_sim(self, run_id):
+    def _single_sim(self, run_id, stream=None):
         """Perform a single simulation."""
         sample_id = 0 if run_id[0] is None else run_id[0]
         parameters = self.sample[sample_id]
         model = self.model(parameters, _run_id=run_id, **self._model_kwargs)
-        results = model.run(display=False)
+        if stream is not None:
+            path, flush_every = stream
+            stream = path / f'run_{sample_id}_{run_id[1] or 0}'
+            results = model.run(display=False, stream=stream,
+                                flush_every=flush_every)
+        else:
+            results = model.run(display=False)
         if 'variables' in results and self.record is False:
             del results['variables']
         return results
 
-    def run(self, n_jobs=1, display=True, **kwargs):
+    def run(self, n_jobs=1, display=True, stream=None, flush_every=100,
+            **kwargs):
         """
         Perform the experiment.
 
@@ -166,6 +176,15 @@ class Experiment:
                 If none is passed, normal processing is used.
             display (bool, optional):
                 Display simulation progress (default True).
+            stream (str or Path, optional):
+                Directory to which recorded variables are streamed
+                (default None). Each run writes its Parquet partitions
+                to a subdirectory `run_{sample_id}_{iteration}`,
+                and the combined output holds a :class:`PartitionedFrame`
+                for each object type. The directory has to be empty
+                or not exist yet. See :func:`Model.run`.
+            flush_every (int, optional):
+                Number of steps between flushes to `stream` (default 100).
             **kwargs:
                 Additional keyword arguments for :func:`joblib.Parallel`.
 
@@ -189,11 +208,17 @@ class Experiment:
             print(f"Scheduled runs: {n_runs}")
         t0 = datetime.now()
         combined_output = {}
+        if stream is not None:
+            stream = (Path(stream), flush_every)
+            if stream[0].exists() and any(stream[0].iterdir()):
+                raise AgentpyError(
+                    f"Stream directory '{stream[0]}' is not empty. Partitions "
+                    "of earlier runs would be mixed with the new ones.")
 
         if n_jobs != 1:
             with tqdm_joblib(tqdm(desc="Experiment progress", total=self.n_runs)):
                 output_list = Parallel(n_jobs=n_jobs, **kwargs)(
-                    delayed(self._single_sim)(i) for i in self.run_ids
+                    delayed(self._single_sim)(i, stream) for i in self.run_ids
                 )
             for single_output in make_list(output_list):
                 self._add_single_output_to_combined(
@@ -204,7 +229,7 @@ class Experiment:
             i = -1
             for run_id in self.run_ids:
                 self._add_single_output_to_combined(
-                    self._single_sim(run_id), combined_output
+                    self._single_sim(run_id, stream), combined_output
                 )
                 if display:
                     i += 1
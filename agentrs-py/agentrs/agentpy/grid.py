@@ -3,13 +3,16 @@ Agentpy Grid Module
 Content: Class for discrete spatial environments
 """
 
+import functools
 import itertools
+import math
+import os
 import numpy as np
 import random as rd
 import collections.abc as abc
-import numpy.lib.recfunctions as rfs
-from .environment import SpatialEnvironment
-from .tools import make_list, make_matrix, AgentpyError, ListDict
+from scipy import ndimage
+from .environment import SpatialEnvironment, _PositionsView
+from .tools import make_list, make_matrix, AgentpyError, AttrDict
 from .sequences import AgentSet, AgentIter, AgentList
 
 
@@ -54,6 +57,181 @@ class _IterArea:
                 return iter(self.area)
 
 
+@functools.lru_cache(maxsize=None)
+def _offsets(ndim, distance, neighborhood):
+    """ Returns a read-only array with the offsets of all cells
+    in a neighborhood, including the center, in row-major order. """
+    ranges = [range(-distance, distance + 1)] * ndim
+    offsets = np.array(list(itertools.product(*ranges)), dtype=int)
+    offsets = offsets.reshape(-1, ndim)
+    if neighborhood == 'von_neumann':
+        offsets = offsets[np.abs(offsets).sum(axis=1) <= distance]
+    elif neighborhood != 'moore':
+        raise AgentpyError(f"Neighborhood '{neighborhood}' is not supported. "
+                           "Choose 'moore', 'von_neumann', "
+                           "or pass an array of offsets.")
+    offsets.flags.writeable = False
+    return offsets
+
+
+def _first_occurrences(cells):
+    """ Returns the unique values of an array in order of appearance. """
+    _, first = np.unique(cells, return_index=True)
+    return cells[np.sort(first)]
+
+
+class _EmptyCells(abc.Sequence):
+    """ Unoccupied positions of a grid, together with the number of
+    agents in each cell. Empty cells are kept as flat indices at the front
+    of a permutation of all cells, and a second array holds the place of
+    each cell in this permutation, so that cells can be added, removed,
+    and looked up in constant time. The order of positions is the same
+    as for a `ListDict` that receives the same updates.
+
+    Attributes:
+        counts (numpy.ndarray): Number of agents in each flat cell.
+    """
+
+    def __init__(self, shape):
+        n_cells = math.prod(shape)
+        self.shape = tuple(shape)
+        self.counts = np.zeros(n_cells, dtype=int)
+        self._cells = np.arange(n_cells)  # Empty cells first
+        self._places = np.arange(n_cells)  # Place of each cell in _cells
+        self._n = n_cells  # Number of empty cells
+
+    def __repr__(self):
+        return f"EmptyCells ({len(self)} positions)"
+
+    def __len__(self):
+        return self._n
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            cells = self._cells[:self._n][item]
+            pos = np.stack(np.unravel_index(cells, self.shape), axis=-1)
+            return list(map(tuple, pos.tolist()))
+        if item < 0:
+            item += self._n
+        if not 0 <= item < self._n:
+            raise IndexError("Index out of range.")
+        return self._position(self._cells[item])
+
+    def __iter__(self):
+        return iter(self[:])
+
+    def __contains__(self, position):
+        cell = self._cell(position)
+        return cell is not None and self._places[cell] < self._n
+
+    def _cell(self, position):
+        try:
+            return int(np.ravel_multi_index(tuple(position), self.shape))
+        except (ValueError, TypeError):
+            return None
+
+    def _position(self, cell):
+        return tuple(int(x) for x in np.unravel_index(cell, self.shape))
+
+    @property
+    def mask(self):
+        """ Boolean array with the shape of the grid
+        that is True for each empty cell. """
+        return (self._places < self._n).reshape(self.shape)
+
+    # Permutation of cells -------------------------------------------- #
+
+    def _swap(self, i, j):
+        a, b = self._cells[i], self._cells[j]
+        self._cells[i], self._cells[j] = b, a
+        self._places[a], self._places[b] = j, i
+
+    def _append(self, cell):
+        self._swap(self._places[cell], self._n)
+        self._n += 1
+
+    def _remove(self, cell):
+        self._n -= 1
+        self._swap(self._places[cell], self._n)
+
+    def append(self, position):
+        """ Marks a position as empty. """
+        cell = self._cell(position)
+        if self._places[cell] >= self._n:
+            self._append(cell)
+
+    def remove(self, position):
+        """ Marks an empty position as occupied. """
+        if position not in self:
+            raise KeyError(position)
+        self._remove(self._cell(position))
+
+    def replace(self, old_position, new_position):
+        """ Marks an empty position as occupied, and puts another
+        position into its place in the sequence. """
+        if old_position not in self:
+            raise KeyError(old_position)
+        if new_position not in self:
+            self._swap(self._places[self._cell(old_position)],
+                       self._places[self._cell(new_position)])
+
+    # Occupancy ------------------------------------------------------- #
+
+    def occupy(self, position):
+        """ Adds an agent to a position. """
+        cell = self._cell(position)
+        self.counts[cell] += 1
+        if self.counts[cell] == 1:
+            self._remove(cell)
+
+    def vacate(self, position):
+        """ Removes an agent from a position. """
+        cell = self._cell(position)
+        self.counts[cell] -= 1
+        if self.counts[cell] == 0:
+            self._append(cell)
+
+    def move(self, old_position, new_position):
+        """ Moves an agent from one position to another.
+        If the old position becomes empty and the new one was empty,
+        the old position takes the place of the new one. """
+        old, new = self._cell(old_position), self._cell(new_position)
+        if old == new:
+            return
+        self.counts[old] -= 1
+        self.counts[new] += 1
+        left, entered = self.counts[old] == 0, self.counts[new] == 1
+        if left and entered:
+            self._swap(self._places[old], self._places[new])
+        elif left:
+            self._append(old)
+        elif entered:
+            self._remove(new)
+
+    def update(self, vacated, occupied):
+        """ Removes an agent from each flat cell in `vacated`
+        and adds an agent to each flat cell in `occupied`. """
+        np.subtract.at(self.counts, vacated, 1)
+        np.add.at(self.counts, occupied, 1)
+        for cell in _first_occurrences(vacated).tolist():
+            if self.counts[cell] == 0 and self._places[cell] >= self._n:
+                self._append(cell)
+        for cell in _first_occurrences(occupied).tolist():
+            if self.counts[cell] > 0 and self._places[cell] < self._n:
+                self._remove(cell)
+
+    def first(self, k):
+        """ Returns the flat indices of the first `k` empty cells. """
+        return self._cells[:min(k, self._n)].copy()
+
+    def sample(self, k, rng):
+        """ Returns the flat indices of `k` different empty cells,
+        chosen at random with the generator `rng`. """
+        if k > self._n:
+            raise AgentpyError("Cannot add more agents than empty positions.")
+        return self._cells[rng.choice(self._n, size=k, replace=False)]
+
+
 class GridIter(AgentIter):
     """ Iterator over objects in :class:`Grid` that supports slicing.
 
@@ -122,28 +300,31 @@ class Grid(SpatialEnvironment):
             Iterator over all agents in the grid.
         positions (dict of Agent):
             Dictionary linking each agent instance to its position.
-        grid (numpy.rec.array):
-            Structured numpy record array with a field 'agents'
+        grid (AttrDict):
+            Arrays of each field of the grid, including the field 'agents'
             that holds an :class:`AgentSet` in each position.
+            Fields can be accessed as `grid.grid.key` or `grid.key`.
         shape (tuple of int):
             Length of each dimension.
         ndim (int):
             Number of dimensions.
         all (list):
             List of all positions in the grid.
-        empty (ListDict):
-            List of unoccupied positions, only available
+        empty (Sequence):
+            Sequence of unoccupied positions, only available
             if the Grid was initiated with `track_empty=True`.
+            Random empty positions are drawn in time proportional to
+            their number, using the model's :obj:`Model.nprandom`.
+        occupancy (numpy.ndarray):
+            Number of agents in each position.
     """
 
     @staticmethod
-    def _agent_field(field_name, shape, model):
-        # Prepare structured array filled with empty agent sets
-        array = np.empty(shape, dtype=[(field_name, object)])
-        it = np.nditer(array, flags=['refs_ok', 'multi_index'])
-        for _ in it:
-            array[it.multi_index] = AgentSet(model)
-        return array
+    def _agent_field(shape, model):
+        # Prepare object array filled with empty agent sets
+        array = np.empty(int(np.prod(shape)), dtype=object)
+        array[:] = [AgentSet(model) for _ in range(len(array))]
+        return array.reshape(shape)
 
     def __init__(self, model, shape, torus=False,
                  track_empty=False, check_border=True, **kwargs):
@@ -155,11 +336,14 @@ class Grid(SpatialEnvironment):
         self._torus = torus
 
         self.positions = {}
-        self.grid = np.rec.array(self._agent_field('agents', shape, model))
+        self.grid = AttrDict(agents=self._agent_field(shape, model))
         self.shape = tuple(shape)
         self.ndim = len(self.shape)
-        self.all = list(itertools.product(*[range(x) for x in shape]))
-        self.empty = ListDict(self.all) if track_empty else None
+        self._all = None
+        self._neighborhoods = {}  # Cached offsets of each neighborhood
+        self._kernels = {}  # Cached kernels and buffers of field operators
+        self._rules = {}  # Field : Transition rule
+        self.empty = _EmptyCells(self.shape) if track_empty else None
 
         self._set_var_ignore()
         self.setup(**kwargs)
@@ -168,6 +352,13 @@ class Grid(SpatialEnvironment):
     def agents(self):
         return GridIter(self.model, self.positions.keys(), self.grid.agents)
 
+    @property
+    def all(self):
+        """ List of all positions in the grid, created on first access. """
+        if self._all is None:
+            self._all = list(itertools.product(*[range(x) for x in self.shape]))
+        return self._all
+
     # Add and remove agents ------------------------------------------------- #
 
     def _add_agent(self, agent, position, field):
@@ -205,38 +396,52 @@ class Grid(SpatialEnvironment):
         """
 
         field = 'agents'
+        positions = self._choose_positions(agents, positions, random, empty)
+
+        if self._track_empty:
+            added = []
+            for agent, position in zip(agents, positions):
+                self._add_agent(agent, position, field)
+                added.append(self.positions[agent])
+            added = np.array(added, dtype=int).reshape(-1, self.ndim)
+            cells = self._flat(added)
+            self.empty.update(cells[:0], cells)
+        else:
+            for agent, position in zip(agents, positions):
+                self._add_agent(agent, position, field)
 
-        if empty and not self._track_empty:
+    def _choose_positions(self, agents, positions, random, empty):
+        """ Returns the positions for new agents,
+        as described in :func:`Grid.add_agents`. """
+
+        if empty and self.empty is None:
             raise AgentpyError(
                 "To use 'Grid.add_agents()' with 'empty=True', "
                 "Grid must be iniated with 'track_empty=True'.")
 
         # Choose positions
-        if positions:
+        if positions is not None and len(positions):
             pass
         elif random:
             n = len(agents)
             if empty:
-                positions = self.model.random.sample(self.empty, k=n)
+                if n > len(self.empty):
+                    raise AgentpyError(
+                        "Cannot add more agents than empty positions.")
+                cells = self.empty.sample(n, self.model.nprandom)
+                positions = list(map(tuple, self._unflat(cells).tolist()))
             else:
                 positions = self.model.random.choices(self.all, k=n)
         else:
             if empty:
-                positions = list(self.empty)  # Soft copy
+                positions = self.empty[:len(agents)]
             else:
                 positions = itertools.cycle(self.all)
 
         if empty and len(positions) < len(agents):
             raise AgentpyError("Cannot add more agents than empty positions.")
 
-        if self._track_empty:
-            for agent, position in zip(agents, positions):
-                self._add_agent(agent, position, field)
-                if position in self.empty:
-                    self.empty.remove(position)
-        else:
-            for agent, position in zip(agents, positions):
-                self._add_agent(agent, position, field)
+        return positions
 
     def remove_agents(self, agents):
         """ Removes agents from the environment. """
@@ -245,7 +450,7 @@ class Grid(SpatialEnvironment):
             self.grid.agents[pos].remove(agent)  # Remove agent from grid
             del self.positions[agent]  # Remove agent from position dict
             if self._track_empty:
-                self.empty.append(pos)  # Add position to free spots
+                self.empty.vacate(pos)  # Add position to free spots
 
     # Move and select agents ------------------------------------------------ #
 
@@ -273,23 +478,18 @@ class Grid(SpatialEnvironment):
         """
 
         pos_old = self.positions[agent]
-        if pos != pos_old:
 
-            # Grid options
-            if self._check_border:
-                pos = self._border_behavior(pos, self.shape, self._torus)
-            if self._track_empty:
-                if len(self.grid.agents[pos_old]) == 1:
-                    if pos in self.empty:
-                        self.empty.replace(pos, pos_old)
-                    else:
-                        self.empty.append(pos_old)
-                elif pos in self.empty:
-                    self.empty.remove(pos)
+        # Grid options
+        if self._check_border:
+            pos = self._border_behavior(pos, self.shape, self._torus)
+        if pos == pos_old:
+            return
+        if self._track_empty:
+            self.empty.move(pos_old, pos)
 
-            self.grid.agents[pos_old].remove(agent)
-            self.grid.agents[pos].add(agent)
-            self.positions[agent] = pos
+        self.grid.agents[pos_old].remove(agent)
+        self.grid.agents[pos].add(agent)
+        self.positions[agent] = pos
 
     def move_by(self, agent, path):
         """ Moves agent to new position, relative to current position.
@@ -301,53 +501,280 @@ class Grid(SpatialEnvironment):
         pos = [p + c for p, c in zip(self.positions[agent], path)]
         self.move_to(agent, tuple(pos))
 
-    def neighbors(self, agent, distance=1):
+    def move_agents(self, agents, positions, capacity=None,
+                    on_collision='stay'):
+        """ Moves multiple agents to new positions at once.
+        Border behavior is applied to all positions in one operation,
+        and the occupancy of cells and :obj:`Grid.empty`
+        are updated for the whole batch.
+
+        Arguments:
+            agents (Sequence of Agent): Agents to be moved.
+            positions (array of int):
+                New position of each agent, with one row per agent.
+            capacity (int, optional):
+                Maximum number of agents per cell (default None).
+                Only enforced for cells that agents move into.
+            on_collision (str, optional):
+                What to do if moves would exceed the capacity of a cell.
+                If 'stay' (default), agents stay at their current position,
+                with agents earlier in the sequence taking precedence.
+                Agents that stay may in turn block others from moving
+                into their cell. If 'error', an error is raised
+                and no agent is moved.
+
+        Returns:
+            numpy.ndarray: Boolean mask of the agents that have moved.
+        """
+        if on_collision not in ('stay', 'error'):
+            raise AgentpyError(f"Collision policy '{on_collision}' is not "
+                               "supported. Choose 'stay' or 'error'.")
+        agents = list(agents)
+        old = self._positions_of(agents)
+        new = np.array(positions, dtype=int).reshape(old.shape)
+        return self._move_agents(agents, old, new, capacity, on_collision)
+
+    def move_agents_by(self, agents, paths, capacity=None,
+                       on_collision='stay'):
+        """ Moves multiple agents relative to their current positions.
+        See :func:`Grid.move_agents`.
+
+        Arguments:
+            agents (Sequence of Agent): Agents to be moved.
+            paths (array of int): Relative change of position,
+                either one row per agent or a single row for all agents.
+
+        Returns:
+            numpy.ndarray: Boolean mask of the agents that have moved.
+        """
+        agents = list(agents)
+        old = self._positions_of(agents)
+        new = old + np.asarray(paths, dtype=int)
+        return self._move_agents(agents, old, new, capacity, on_collision)
+
+    def _move_agents(self, agents, old, new, capacity, on_collision):
+        if self._check_border:
+            shape = np.array(self.shape)
+            new = new % shape if self._torus else np.clip(new, 0, shape - 1)
+        old_cells = np.ravel_multi_index(tuple(old.T), self.shape)
+        new_cells = np.ravel_multi_index(tuple(new.T), self.shape)
+        moving = old_cells != new_cells
+        if capacity is not None:
+            moving = self._resolve_collisions(
+                old_cells, new_cells, moving, capacity, on_collision)
+        rows = np.flatnonzero(moving)
+        self._apply_moves(agents, rows, new, old_cells, new_cells)
+
+        if self._track_empty and len(rows):
+            self.empty.update(np.sort(old_cells[rows]),
+                              np.sort(new_cells[rows]))
+        return moving
+
+    def _resolve_collisions(self, old_cells, new_cells, moving,
+                            capacity, on_collision):
+        """ Returns which moves can be made without exceeding the capacity
+        of a cell, by repeatedly rejecting the last moves into full cells
+        until no cell that agents move into is over capacity. """
+        cells = np.unique(np.concatenate([old_cells, new_cells]))
+        source = np.searchsorted(cells, old_cells)
+        target = np.searchsorted(cells, new_cells)
+        others = self._occupancy(cells) - np.bincount(
+            source, minlength=len(cells))  # Agents outside of the batch
+        accepted = moving.copy()
+        while True:
+            final = np.where(accepted, target, source)
+            excess = others + np.bincount(final, minlength=len(cells)) \
+                - capacity
+            blocked = np.flatnonzero(accepted & (excess[target] > 0))
+            if not len(blocked):
+                return accepted
+            if on_collision == 'error':
+                raise AgentpyError(
+                    f"Moving agents would exceed the capacity of "
+                    f"{capacity} agents per cell.")
+            # Reject the last moves into each cell that is over capacity
+            blocked = blocked[np.lexsort((-blocked, target[blocked]))]
+            groups = target[blocked]
+            rank = np.arange(len(blocked)) - np.searchsorted(groups, groups)
+            accepted[blocked[rank < excess[groups]]] = False
+
+    def _cell_position(self, cell):
+        return tuple(int(x) for x in np.unravel_index(cell, self.shape))
+
+    def _positions_of(self, agents):
+        """ Returns an array with the position of each agent. """
+        pos = np.array([self.positions[a] for a in agents], dtype=int)
+        return pos.reshape(len(agents), self.ndim)
+
+    def _flat(self, positions):
+        """ Returns the flat index of each position in an array. """
+        return np.ravel_multi_index(tuple(positions.T), self.shape)
+
+    def _unflat(self, cells):
+        """ Returns the position of each flat index as an array. """
+        pos = np.stack(np.unravel_index(cells, self.shape), axis=-1)
+        return pos.reshape(-1, self.ndim)
+
+    @property
+    def occupancy(self):
+        """ Array with the number of agents in each position.
+        If empty cells are tracked, this is a read-only view
+        of counts that are kept up to date with each move.
+
+        Examples:
+
+            Select the targets that still have room for an agent::
+
+                free = grid.occupancy[tuple(targets.T)] < capacity
+        """
+        if self._track_empty:
+            counts = self.empty.counts.reshape(self.shape).view()
+            counts.flags.writeable = False
+            return counts
+        return self.attr_grid(None, reduce='count')
+
+    def _occupancy(self, cells):
+        """ Returns the number of agents in each cell of a flat index. """
+        if self._track_empty:
+            return self.empty.counts[cells]
+        sets = self.grid.agents.reshape(-1)[cells]
+        return np.fromiter(map(len, sets), dtype=int, count=len(sets))
+
+    def _apply_moves(self, agents, rows, new, old_cells, new_cells):
+        field = self.grid.agents.reshape(-1)
+        for i in rows.tolist():
+            agent = agents[i]
+            field[old_cells[i]].remove(agent)
+            field[new_cells[i]].add(agent)
+            self.positions[agent] = tuple(new[i].tolist())
+
+    def _neighborhood(self, distance, neighborhood):
+        """ Returns the offsets of a neighborhood, and whether cells
+        have to be deduplicated because offsets wrap around the torus. """
+        if not isinstance(neighborhood, str):
+            offsets = np.asarray(neighborhood, dtype=int).reshape(-1, self.ndim)
+            return offsets, self._wraps(offsets)
+        key = (distance, neighborhood)
+        if key not in self._neighborhoods:
+            offsets = _offsets(self.ndim, distance, neighborhood)
+            self._neighborhoods[key] = (offsets, self._wraps(offsets))
+        return self._neighborhoods[key]
+
+    def _wraps(self, offsets):
+        if not self._torus:
+            return False
+        wrapped = offsets % np.array(self.shape)
+        return len(np.unique(wrapped, axis=0)) < len(offsets)
+
+    def _neighbor_cells(self, pos, offsets, wraps):
+        """ Returns the positions around `pos` as an array of rows. """
+        cells = np.asarray(pos) + offsets
+        shape = np.array(self.shape)
+        if self._torus:
+            cells %= shape
+            if wraps:  # Cells would be visited multiple times
+                cells = np.unique(cells, axis=0)
+        else:
+            cells = cells[np.all((cells >= 0) & (cells < shape), axis=1)]
+        return cells
+
+    def neighbors(self, agent, distance=1, neighborhood='moore'):
         """ Select neighbors of an agent within a given distance.
+        The offsets of each neighborhood are computed once per grid.
 
         Arguments:
             agent (Agent): Instance of the agent.
             distance (int, optional):
-                Number of cells to cover in each direction,
-                including diagonally connected cells (default 1).
+                Number of cells to cover in each direction (default 1).
+            neighborhood (str or array, optional):
+                Shape of the neighborhood. If 'moore' (default),
+                diagonally connected cells are included.
+                If 'von_neumann', only cells within a Manhattan distance
+                of `distance` are included. Custom neighborhoods can be
+                passed as an array of offsets with one row per cell,
+                in which case `distance` is ignored.
 
         Returns:
-            AgentIter: Iterator over the selected neighbors.
+            AgentIter: Iterator over the selected neighbors,
+            which can be iterated over multiple times.
         """
+        offsets, wraps = self._neighborhood(distance, neighborhood)
+        cells = self._neighbor_cells(self.positions[agent], offsets, wraps)
+        agents = [a for cell in self.grid.agents[tuple(cells.T)]
+                  for a in cell if a is not agent]
+        return AgentIter(self.model, agents)
+
+    def _agent_positions(self):
+        """ Returns a list of all agents and an array of their positions. """
+        agents = list(self.positions.keys())
+        pos = np.array(list(self.positions.values()), dtype=int)
+        return agents, pos.reshape(len(agents), self.ndim)
+
+    def neighbors_all(self, distance=1, neighborhood='moore'):
+        """ Selects the neighbors of all agents at once.
+        See :func:`Grid.neighbors` for the arguments.
 
-        pos = self.positions[agent]
+        Returns:
+            tuple: An :class:`AgentList` of all agents in the grid,
+            and two integer arrays `indptr` and `indices` in compressed
+            sparse row format: the neighbors of the i-th agent are the
+            agents at the positions `indices[indptr[i]:indptr[i+1]]`.
+
+        Examples:
 
-        # TODO Change method upon initiation
-        # Case 1: Toroidal
+            Count the infected neighbors of each agent::
+
+                agents, indptr, indices = grid.neighbors_all()
+                infected = np.asarray(agents.state == 'infected')
+                owners = np.repeat(np.arange(len(agents)), np.diff(indptr))
+                counts = np.bincount(owners, weights=infected[indices],
+                                     minlength=len(agents))
+        """
+        agents, pos = self._agent_positions()
+        offsets, wraps = self._neighborhood(distance, neighborhood)
+        n, k = len(agents), len(offsets)
+        if n == 0:
+            return AgentList(self.model), np.zeros(1, dtype=int), \
+                np.zeros(0, dtype=int)
+        shape = np.array(self.shape)
+
+        # Group agents by cell
+        cell = np.ravel_multi_index(tuple(pos.T), self.shape)
+        order = np.argsort(cell, kind='stable')
+        cells, start, counts = np.unique(
+            cell[order], return_index=True, return_counts=True)
+
+        # Cells around each agent
+        around = pos[:, None, :] + offsets[None, :, :]
         if self._torus:
-            slices = [(p-distance, p+distance+1) for p in pos]
-            new_slices = []
-            for (x_from, x_to), x_max in zip(slices, self.shape):
-                if distance >= x_max//2 :
-                    sl_tupl = [(0, x_max)]
-                elif x_to > x_max:
-                    sl_tupl = [(x_from, x_max), (0, x_to - x_max)]
-                elif x_from < 0:
-                    sl_tupl = [(x_max + x_from, x_max), (0, x_to)]
-                else:
-                    sl_tupl = [(x_from, x_to)]
-                new_slices.append(sl_tupl)
-            areas = []
-            for slices in itertools.product(*new_slices):
-                slices = tuple(slice(*sl) for sl in slices)
-                areas.append(self.grid.agents[slices])
-            # TODO Exclude in every area inefficient
-            area_iters = [_IterArea(area, exclude=agent) for area in areas]
-            # TODO Can only be iterated on once
-            return AgentIter(self.model,
-                             itertools.chain.from_iterable(area_iters))
-
-        # Case 2: Non-toroidal
+            around %= shape
+            valid = np.ones((n, k), dtype=bool)
         else:
-            slices = tuple(slice(p-distance if p-distance >= 0 else 0,
-                                  p+distance+1) for p in pos)
-            area = self.grid.agents[slices]
-            # Iterator over all agents in area, exclude original agent
-            return AgentIter(self.model, _IterArea(area, exclude=agent))
+            valid = np.all((around >= 0) & (around < shape), axis=2)
+            around[~valid] = 0
+        around = np.ravel_multi_index(tuple(np.moveaxis(around, 2, 0)),
+                                      self.shape)
+        if wraps:  # Visit each cell only once, in row-major order
+            around.sort(axis=1)
+            valid[:, 1:] &= around[:, 1:] != around[:, :-1]
+
+        # Look up the agents in each of these cells
+        idx = np.searchsorted(cells, around).clip(max=len(cells) - 1)
+        found = valid & (cells[idx] == around)
+        n_found = np.where(found, counts[idx], 0).ravel()
+        first = start[idx].ravel()
+        owner = np.repeat(np.arange(n * k), n_found)
+        offset = np.arange(len(owner)) - np.repeat(
+            np.cumsum(n_found) - n_found, n_found)
+        neighbor = order[first[owner] + offset]
+        agent = owner // k
+
+        # Exclude each agent itself
+        keep = neighbor != agent
+        neighbor, agent = neighbor[keep], agent[keep]
+        indptr = np.zeros(n + 1, dtype=int)
+        np.cumsum(np.bincount(agent, minlength=n), out=indptr[1:])
+        return AgentList(self.model, agents), indptr, neighbor
 
     # Fields and attributes ------------------------------------------------- #
 
@@ -361,29 +788,85 @@ class Grid(SpatialEnvironment):
         """
         return np.vectorize(func)(self.grid[field])
 
-    def attr_grid(self, attr_key, otypes='f', field='agents'):
+    def attr_grid(self, attr_key, otypes='f', field='agents', reduce=None,
+                  fill=None):
         """ Returns a grid with the value of the attribute of the agent
-        in each position, using :class:`numpy.vectorize`.
-        Positions with no agent will contain `numpy.nan`.
-        Should only be used for grids with zero or one agents per cell.
+        in each position. Values are scattered directly from the positions
+        of the agents, so that the time needed depends on the number of
+        agents rather than the number of cells.
+        Positions with no agent will contain `fill`.
+        If there are multiple agents in a position,
+        their values can be combined with `reduce`.
         Other kinds of attribute grids can be created with :func:`Grid.apply`.
 
         Arguments:
             attr_key (str): Name of the attribute.
             otypes (str or list of dtypes, optional):
                 Data type of returned grid (default float).
-                For more information, see :class:`numpy.vectorize`.
             field (str, optional): Field to use (default 'agents').
+            reduce (str, optional): How to combine the values
+                of multiple agents in the same position.
+                If None (default), the value of one of these agents is used,
+                which should only be relied on for grids
+                with zero or one agents per cell.
+                Options are 'sum', 'mean', 'max', 'min', and 'count'.
+                For 'sum' and 'count', empty positions contain zero,
+                and `attr_key` is ignored for 'count'.
+            fill (optional): Value of positions with no agent.
+                If None (default), `numpy.nan` is used for float types
+                and zero for other types, such as integers.
         """
+        dtype = np.dtype(otypes if isinstance(otypes, str) else otypes[0])
+        if fill is None:
+            fill = np.nan if dtype.kind in 'fcO' else 0
+
+        if field != 'agents':
+            f = np.vectorize(
+                lambda x: getattr(next(iter(x)), attr_key) if x else fill,
+                otypes=otypes)
+            return f(self.grid[field])
+
+        agents, pos = self._agent_positions()
+        n_cells = int(np.prod(self.shape))
+        cells = np.ravel_multi_index(tuple(pos.T), self.shape)
+        if reduce == 'count':
+            return np.bincount(cells, minlength=n_cells).reshape(self.shape)
+
+        values = np.asarray(
+            getattr(AgentList(self.model, agents), attr_key)) \
+            if agents else np.zeros(0)
+        if reduce is None:
+            grid = np.full(n_cells, fill, dtype=dtype)
+            grid[cells] = values
+        elif reduce == 'sum':
+            grid = np.bincount(cells, weights=values, minlength=n_cells)
+            grid = grid.astype(dtype, copy=False)
+        elif reduce in ('mean', 'max', 'min'):
+            if reduce == 'mean':
+                grid = np.bincount(cells, weights=values, minlength=n_cells)
+                counts = np.bincount(cells, minlength=n_cells)
+                occupied = counts > 0
+                grid[occupied] /= counts[occupied]
+            else:
+                ufunc = np.maximum if reduce == 'max' else np.minimum
+                grid = np.full(n_cells,
+                               -np.inf if reduce == 'max' else np.inf)
+                ufunc.at(grid, cells, values)
+                occupied = np.zeros(n_cells, dtype=bool)
+                occupied[cells] = True
+            grid = np.where(occupied, grid, 0).astype(dtype, copy=False)
+            grid[~occupied] = fill
+        else:
+            raise AgentpyError(f"Reduction '{reduce}' is not supported. Choose "
+                               "'sum', 'mean', 'max', 'min', or 'count'.")
+        return grid.reshape(self.shape)
 
-        f = np.vectorize(
-            lambda x: getattr(next(iter(x)), attr_key) if x else np.nan,
-            otypes=otypes)
-        return f(self.grid[field])
-
-    def add_field(self, key, values=None):
+    def add_field(self, key, values=None, dtype=None, filename=None):
         """
         Add an attribute field to the grid.
+        Each field is stored as a separate :class:`numpy.ndarray`
+        with the shape of the grid, which can be accessed without copies
+        as `grid.key` or `grid.grid.key`.
 
         Arguments:
             key (str):
@@ -391,20 +874,48 @@ class Grid(SpatialEnvironment):
             values (optional):
                 Single value or :class:`numpy.ndarray`
                 of values (default None).
-        """
+            dtype (numpy.dtype, optional):
+                Data type of the field.
+                If none is given, it is inferred from `values`.
+            filename (str, optional):
+                Path of a `.npy` file in which the field is stored
+                as a :class:`numpy.memmap`, so that large fields don't have
+                to be held in memory. If the file exists and no `values` are
+                passed, the field is loaded from it. Otherwise, the file is
+                created and filled with `values`.
+
+        Examples:
 
-        if not isinstance(values, (np.ndarray, list)):
-            values = np.full(np.prod(self.shape), fill_value=values)
-        if len(values.shape) > 1:
-            values = values.reshape(-1)
+            Load a large landscape from disk::
 
-        # Create attribute as a numpy field
-        self.grid = rfs.append_fields(
-            self.grid, key, values, usemask=False, asrecarray=True
-            ).reshape(self.grid.shape)
+                grid.add_field('elevation', filename='elevation.npy')
+        """
+        if filename is not None:
+            array = self._memmap_field(filename, values, dtype)
+        elif isinstance(values, (np.ndarray, list)):
+            array = np.array(values, dtype=dtype).reshape(self.shape)
+        else:
+            array = np.full(self.shape, fill_value=values, dtype=dtype)
+        self.grid[key] = array
 
         # Create attribute as reference to field
-        setattr(self, key, self.grid[key])
+        setattr(self, key, array)
+
+    def _memmap_field(self, filename, values, dtype):
+        if values is None and os.path.exists(filename):
+            array = np.load(filename, mmap_mode='r+')
+            if array.shape != self.shape:
+                raise AgentpyError(
+                    f"Field in '{filename}' has shape {array.shape}, "
+                    f"but the grid has shape {self.shape}.")
+            return array
+        if dtype is None:
+            dtype = np.asarray(values).dtype
+        array = np.lib.format.open_memmap(
+            filename, mode='w+', dtype=dtype, shape=self.shape)
+        array[...] = np.reshape(values, self.shape) \
+            if isinstance(values, (np.ndarray, list)) else values
+        return array
 
     def del_field(self, key):
         """
@@ -413,7 +924,882 @@ class Grid(SpatialEnvironment):
         Arguments:
             key (str): Name of the field.
         """
-
-        self.grid = rfs.drop_fields(
-            self.grid, key, usemask=False, asrecarray=True)
+        del self.grid[key]
         delattr(self, key)
+
+    # Field operators ----------------------------------------------------- #
+
+    def _mode(self):
+        """ Returns the border mode of :mod:`scipy.ndimage` filters. """
+        return 'wrap' if self._torus else 'constant'
+
+    def _kernel(self, neighborhood):
+        """ Returns a kernel with ones for the neighbors of the center,
+        and the number of neighbors of each cell within the border. """
+        if neighborhood not in self._kernels:
+            offsets = _offsets(self.ndim, 1, neighborhood)
+            kernel = np.zeros((3,) * self.ndim, dtype=int)
+            kernel[tuple((offsets + 1).T)] = 1
+            kernel[(1,) * self.ndim] = 0
+            counts = ndimage.correlate(
+                np.ones(self.shape), kernel, mode=self._mode(), cval=0)
+            self._kernels[neighborhood] = (kernel, counts)
+        return self._kernels[neighborhood]
+
+    def _buffer(self, dtype, name=None):
+        """ Returns a reusable array with the shape of the grid. """
+        key = ('buffer', name, np.dtype(dtype).str)
+        if key not in self._kernels:
+            self._kernels[key] = np.empty(self.shape, dtype=dtype)
+        return self._kernels[key]
+
+    def diffuse(self, key, rate, neighborhood='moore'):
+        """ Diffuses the values of a field in-place.
+        Each cell passes the share `rate` of its value to its neighbors,
+        in equal parts. At the border of a grid that is not a torus,
+        the parts for cells outside of the grid remain in the cell,
+        so that the sum of the field does not change.
+
+        Arguments:
+            key (str): Name of a field with floating point values.
+            rate (float): Share of each value that is passed on,
+                between 0 and 1.
+            neighborhood (str, optional):
+                Either 'moore' (default) or 'von_neumann'.
+                See :func:`Grid.neighbors`.
+
+        Examples:
+
+            Spread and evaporate pheromones in each step::
+
+                grid.diffuse('pheromone', 0.5)
+                grid.decay('pheromone', 0.1)
+        """
+        field = self.grid[key]
+        kernel, counts = self._kernel(neighborhood)
+        share = rate / kernel.sum()
+        inflow = self._buffer(field.dtype)
+        ndimage.correlate(field, kernel, output=inflow,
+                          mode=self._mode(), cval=0)
+        field *= 1 - share * counts
+        inflow *= share
+        field += inflow
+
+    def decay(self, key, rate):
+        """ Reduces the values of a field in-place by the share `rate`. """
+        self.grid[key] *= 1 - rate
+
+    def convolve(self, key, kernel, out=None):
+        """ Convolves a field with a kernel.
+        Cells outside of the grid are treated as zero,
+        unless the grid is a torus.
+
+        Arguments:
+            key (str): Name of the field.
+            kernel (array): Kernel with the same number of dimensions
+                as the grid, see :func:`scipy.ndimage.convolve`.
+            out (str or numpy.ndarray, optional): Field or array
+                into which the result is written. Can be `key` itself.
+                If none is given, a new array is returned.
+
+        Returns:
+            numpy.ndarray: The convolved field.
+        """
+        field = self.grid[key]
+        target = self.grid[out] if isinstance(out, str) else out
+        if target is field:
+            result = self._buffer(field.dtype)
+            ndimage.convolve(field, kernel, output=result,
+                             mode=self._mode(), cval=0)
+            np.copyto(field, result)
+            return field
+        return ndimage.convolve(field, kernel, output=target,
+                                mode=self._mode(), cval=0)
+
+    def gradient(self, key):
+        """ Returns the gradient of a field, as one array per dimension,
+        calculated through central differences. On a torus, differences
+        wrap around the border. Otherwise, one-sided differences
+        are used at the border, see :func:`numpy.gradient`. """
+        field = self.grid[key]
+        if not self._torus:
+            gradient = np.gradient(field)
+            return gradient if self.ndim > 1 else [gradient]
+        return [(np.roll(field, -1, axis=i) - np.roll(field, 1, axis=i)) / 2
+                for i in range(self.ndim)]
+
+    def argmax_neighbor(self, key, agents, neighborhood='moore'):
+        """ Finds the position with the highest value of a field
+        in the neighborhood of each agent, including the agent's own position.
+        Ties are resolved in favor of the first position in row-major order.
+
+        Arguments:
+            key (str): Name of the field.
+            agents (Sequence of Agent): The agents.
+            neighborhood (str, optional):
+                Either 'moore' (default) or 'von_neumann'.
+
+        Returns:
+            numpy.ndarray: The selected position of each agent,
+            which can be passed to :func:`Grid.move_agents`.
+
+        Examples:
+
+            Let all ants move uphill on a pheromone trail::
+
+                targets = grid.argmax_neighbor('pheromone', ants)
+                grid.move_agents(ants, targets)
+        """
+        agents = list(agents)
+        field = self.grid[key]
+        offsets, _ = self._neighborhood(1, neighborhood)
+        shape = np.array(self.shape)
+        cells = self._positions_of(agents)[:, None, :] + offsets
+        if self._torus:
+            cells %= shape
+            values = field[tuple(np.moveaxis(cells, 2, 0))]
+        else:
+            inside = np.all((cells >= 0) & (cells < shape), axis=2)
+            values = field[tuple(np.moveaxis(cells.clip(0, shape - 1), 2, 0))]
+            values = np.where(inside, values, -np.inf)
+        best = np.argmax(values, axis=1)
+        return cells[np.arange(len(agents)), best]
+
+    # Cellular automata --------------------------------------------------- #
+
+    def add_rule(self, key, rule, neighborhood='moore', state=None):
+        """ Adds a transition rule for the values of a field,
+        which will be applied by :func:`Grid.apply_rules`.
+        A field can have one rule, which replaces earlier rules.
+        Models without agents can use :class:`ArrayGrid`,
+        which does not create an agent set for each cell.
+
+        Arguments:
+            key (str): Name of the field.
+            rule (function): Function that takes the current values of
+                the field and the sum of the values of each cell's neighbors,
+                and returns the new values of the field as an array.
+            neighborhood (str or array, optional): Either 'moore' (default)
+                or 'von_neumann', or a kernel with the weight of each
+                neighbor, which is correlated with the field.
+            state (optional): If given, the rule receives the number of
+                neighbors whose value is equal to `state`,
+                instead of the sum of their values.
+
+        Examples:
+
+            Conway's Game of Life::
+
+                grid.add_field('alive', 0, dtype='int8')
+                grid.add_rule('alive', lambda alive, n:
+                              (n == 3) | (alive == 1) & (n == 2), state=1)
+                grid.apply_rules()
+        """
+        if key not in self.grid:
+            raise AgentpyError(f"Grid has no field '{key}'.")
+        if isinstance(neighborhood, str):
+            kernel = self._kernel(neighborhood)[0]
+        else:
+            kernel = np.asarray(neighborhood)
+            if kernel.ndim != self.ndim:
+                raise AgentpyError(f"Kernel has {kernel.ndim} dimensions, "
+                                   f"but grid has {self.ndim}.")
+        self._rules[key] = (rule, kernel, state)
+
+    def remove_rule(self, key):
+        """ Removes the transition rule of a field. """
+        del self._rules[key]
+
+    def apply_rules(self, steps=1):
+        """ Updates all fields that have a transition rule.
+        In each step, the new values of all fields are calculated
+        from the current values before any of them is written,
+        so that all cells change synchronously. Rules can therefore
+        read other fields of the grid, e.g. to model interacting layers.
+        See :func:`Grid.add_rule`.
+
+        Arguments:
+            steps (int, optional): Number of updates (default 1).
+        """
+        mode = self._mode()
+        for _ in range(steps):
+            new = []
+            for key, (rule, kernel, state) in self._rules.items():
+                field = self.grid[key]
+                if state is None:
+                    values = field
+                    dtype = np.result_type(field.dtype, kernel.dtype)
+                else:
+                    values = (field == state).view(np.uint8)
+                    dtype = np.result_type(int, kernel.dtype)
+                neighbors = self._buffer(dtype, key)
+                ndimage.correlate(values, kernel, output=neighbors,
+                                  mode=mode, cval=0)
+                new.append((field, rule(field, neighbors)))
+            for field, values in new:
+                np.copyto(field, values)
+
+    def state_counts(self, key, n_states=0):
+        """ Returns the number of cells in each state of a field
+        with non-negative integer values, as an array whose position
+        `i` holds the number of cells with the value `i`.
+
+        Arguments:
+            key (str): Name of the field.
+            n_states (int, optional): Minimum length of the array.
+        """
+        field = self.grid[key]
+        if field.dtype.kind not in 'biu':
+            raise AgentpyError(f"Field '{key}' does not contain integers.")
+        return np.bincount(field.ravel(), minlength=n_states)
+
+    def record_states(self, key, n_states=0, label=None):
+        """ Records the number of cells in each state of a field,
+        see :func:`Grid.state_counts`.
+
+        Arguments:
+            key (str): Name of the field.
+            n_states (int, optional): Minimum number of states to record.
+            label (str, optional): Name under which to record each count
+                (default `key`). The state will be added to the name
+                (e.g. alive0, alive1).
+        """
+        label = key if label is None else label
+        for state, count in enumerate(self.state_counts(key, n_states)):
+            self.record(f'{label}{state}', int(count))
+
+    # Distance fields ----------------------------------------------------- #
+
+    def _cell_mask(self, cells, name):
+        """ Returns a flat boolean array of the cells given as the name of
+        a field, a boolean array with the shape of the grid,
+        or a sequence of positions. """
+        if isinstance(cells, str):
+            return np.asarray(self.grid[cells], dtype=bool).reshape(-1)
+        cells = np.asarray(cells)
+        if cells.dtype == bool:
+            if cells.shape != self.shape:
+                raise AgentpyError(f"Mask of {name} has shape {cells.shape}, "
+                                   f"but the grid has shape {self.shape}.")
+            return cells.reshape(-1)
+        mask = np.zeros(math.prod(self.shape), dtype=bool)
+        mask[self._flat(cells.astype(int).reshape(-1, self.ndim))] = True
+        return mask
+
+    def distance_field(self, sources, obstacles=None, neighborhood='moore'):
+        """ Returns the number of steps from each cell to the nearest source,
+        together with the next step towards it, as a :class:`DistanceField`.
+        Distances are calculated by a breadth-first search that starts from
+        all sources at once and expands the whole frontier in each step.
+        The result is cached and only calculated again
+        if the sources or obstacles have changed.
+
+        Arguments:
+            sources (str or array): Cells from which distances are measured,
+                given as the name of a field whose non-zero cells are sources,
+                a boolean array with the shape of the grid,
+                or a sequence of positions.
+            obstacles (str or array, optional): Cells that cannot be entered,
+                given in the same way as `sources`.
+            neighborhood (str, optional): Cells that can be reached in one
+                step. Either 'moore' (default) or 'von_neumann'.
+
+        Returns:
+            DistanceField: Distances and next steps of each cell.
+
+        Examples:
+
+            Move all agents one step towards the nearest exit::
+
+                field = grid.distance_field('exit', obstacles='wall')
+                grid.move_agents(agents, field.steps(agents))
+        """
+        source_mask = self._cell_mask(sources, 'sources')
+        blocked = np.zeros_like(source_mask) if obstacles is None \
+            else self._cell_mask(obstacles, 'obstacles')
+        key = ('distance', neighborhood,
+               sources if isinstance(sources, str) else None,
+               obstacles if isinstance(obstacles, str) else None)
+        cached = self._kernels.get(key)
+        if cached is not None and np.array_equal(cached[0], source_mask) \
+                and np.array_equal(cached[1], blocked):
+            return cached[2]
+
+        offsets = _offsets(self.ndim, 1, neighborhood)
+        offsets = offsets[np.any(offsets != 0, axis=1)]
+        distance = self._breadth_first(source_mask, blocked, offsets)
+        field = DistanceField(self, distance.reshape(self.shape),
+                              self._next_steps(distance, offsets))
+        self._kernels[key] = (source_mask.copy(), blocked.copy(), field)
+        return field
+
+    def _neighbors_of_cells(self, cells, offsets):
+        """ Returns the flat neighbors of each cell, with one column
+        per offset, and a mask of neighbors within the grid. """
+        shape = np.array(self.shape)
+        pos = self._unflat(cells)[:, None, :] + offsets
+        if self._torus:
+            pos %= shape
+            valid = np.ones(pos.shape[:2], dtype=bool)
+        else:
+            valid = np.all((pos >= 0) & (pos < shape), axis=2)
+            pos[~valid] = 0
+        return np.ravel_multi_index(tuple(np.moveaxis(pos, 2, 0)),
+                                    self.shape), valid
+
+    def _breadth_first(self, sources, blocked, offsets):
+        distance = np.full(len(sources), -1, dtype=int)
+        frontier = np.flatnonzero(sources & ~blocked)
+        distance[frontier] = 0
+        step = 0
+        while len(frontier):
+            step += 1
+            cells, valid = self._neighbors_of_cells(frontier, offsets)
+            cells = cells[valid]
+            cells = np.unique(cells[(distance[cells] == -1) & ~blocked[cells]])
+            distance[cells] = step
+            frontier = cells
+        return distance
+
+    def _next_steps(self, distance, offsets):
+        """ Returns the first neighbor of each cell that is one step
+        closer to a source, or the cell itself if there is none. """
+        steps = np.arange(len(distance))
+        todo = np.flatnonzero(distance > 0)
+        chunk = 2 ** 16
+        for start in range(0, len(todo), chunk):
+            cells = todo[start:start + chunk]
+            neighbors, valid = self._neighbors_of_cells(cells, offsets)
+            closer = valid & (distance[neighbors] == distance[cells, None] - 1)
+            steps[cells] = neighbors[np.arange(len(cells)),
+                                     np.argmax(closer, axis=1)]
+        return steps.reshape(self.shape)
+
+
+class DistanceField:
+    """ Distances to the nearest source in a grid,
+    created by :func:`Grid.distance_field`.
+
+    Attributes:
+        distance (numpy.ndarray): Number of steps from each cell
+            to the nearest source, or -1 if no source can be reached.
+        next (numpy.ndarray): Flat index of the neighboring cell
+            that is one step closer to a source. Sources and cells
+            from which no source can be reached point to themselves.
+    """
+
+    def __init__(self, grid, distance, next_):
+        self.grid = grid
+        self.distance = distance
+        self.next = next_
+        self.distance.flags.writeable = False
+        self.next.flags.writeable = False
+
+    def __repr__(self):
+        reachable = int(np.count_nonzero(self.distance >= 0))
+        return f"DistanceField ({reachable} reachable cells)"
+
+    def step(self, position):
+        """ Returns the next position on a shortest path
+        from `position` towards the nearest source. """
+        return self.grid._cell_position(self.next[tuple(position)])
+
+    def steps(self, agents):
+        """ Returns an array with the next position
+        of each agent, see :func:`Grid.move_agents`. """
+        pos = self.grid._positions_of(list(agents))
+        return self.grid._unflat(self.next[tuple(pos.T)])
+
+
+class _ArrayArea:
+    """ Slicable area of an :class:`ArrayGrid`, which returns
+    the agents within the selected cells. """
+
+    def __init__(self, grid):
+        self.grid = grid
+
+    def __getitem__(self, item):
+        grid = self.grid
+        item = item if isinstance(item, tuple) else (item,)
+        pos = grid._pos[:len(grid._agents)]
+        mask = np.ones(len(pos), dtype=bool)
+        for dim, sl in enumerate(item):
+            if isinstance(sl, slice):
+                idx = np.arange(grid.shape[dim])[sl]
+                mask &= np.isin(pos[:, dim], idx)
+            else:
+                mask &= pos[:, dim] == sl
+        return [grid._agents[i] for i in np.flatnonzero(mask).tolist()]
+
+
+class ArrayGrid(Grid):
+    """ Grid that stores agent positions in arrays instead of one
+    :class:`AgentSet` per cell. Memory and construction time therefore
+    scale with the number of agents rather than the number of cells,
+    which makes this class suitable for large and sparsely populated grids.
+    It can be used in the same way as :class:`Grid`.
+
+    Positions are kept in an integer array with one row per agent.
+    The agents of each cell are linked through two further arrays
+    that hold the next and previous row in the same cell.
+    These links are only built once the agents of a cell are looked up,
+    e.g. through :func:`ArrayGrid.neighbors`.
+    Attribute fields are stored as separate arrays in `grid`.
+
+    Arguments:
+        model (Model): The model instance.
+        shape (tuple of int): Size of the grid.
+        torus (bool, optional): Whether to connect borders (default False).
+        track_empty (bool, optional):
+            Whether to keep track of empty cells (default False).
+            Note that this requires memory for each cell.
+        check_border (bool, optional):
+            Ensure that agents stay within border (default True).
+        **kwargs: Will be forwarded to :func:`Grid.setup`.
+
+    Attributes:
+        agents (GridIter): Iterator over all agents in the grid.
+        positions (Mapping of Agent):
+            Read-only mapping from each agent to its position.
+        grid (AttrDict): Attribute fields of the grid.
+        shape (tuple of int): Length of each dimension.
+        ndim (int): Number of dimensions.
+        all (list): List of all positions in the grid.
+        empty (Sequence): Sequence of unoccupied positions, only available
+            if the grid was initiated with `track_empty=True`.
+    """
+
+    def __init__(self, model, shape, torus=False,
+                 track_empty=False, check_border=True, **kwargs):
+
+        SpatialEnvironment.__init__(self, model)
+        self._init_storage(shape, torus, track_empty, check_border)
+        self.empty = _EmptyCells(self.shape) if track_empty else None
+
+        self._set_var_ignore()
+        self.setup(**kwargs)
+
+    def _init_storage(self, shape, torus, track_empty, check_border):
+        self._track_empty = track_empty
+        self._check_border = check_border
+        self._torus = torus
+
+        self.grid = AttrDict()
+        self.shape = tuple(shape)
+        self.ndim = len(self.shape)
+        self._all = None
+        self._neighborhoods = {}  # Cached offsets of each neighborhood
+        self._kernels = {}  # Cached kernels and buffers of field operators
+        self._rules = {}  # Field : Transition rule
+
+        self._agents = []  # Agent of each row
+        self._rows = {}  # Agent : Row
+        self._pos = np.empty((16, self.ndim), dtype=int)
+        self._cell = np.empty(16, dtype=int)  # Flat index of each row
+        self._counts = {}  # Flat index : Number of agents
+        self._head = None  # Flat index : First row (built on demand)
+        self._next = None
+        self._prev = None
+
+    @property
+    def agents(self):
+        return GridIter(self.model, self._agents, _ArrayArea(self))
+
+    @property
+    def positions(self):
+        return _PositionsView(self)
+
+    def _position(self, agent):
+        return tuple(self._pos[self._rows[agent]].tolist())
+
+    # Storage of rows and links ------------------------------------------- #
+
+    def _reserve(self, n):
+        """ Grows the row arrays so that `n` more agents fit. """
+        required = len(self._agents) + n
+        capacity = len(self._cell)
+        if required <= capacity:
+            return
+        capacity = max(required, 2 * capacity)
+        for key in ['_pos', '_cell', '_next', '_prev']:
+            old = getattr(self, key)
+            if old is not None:
+                new = np.empty((capacity,) + old.shape[1:], dtype=old.dtype)
+                new[:len(self._agents)] = old[:len(self._agents)]
+                setattr(self, key, new)
+
+    def _links(self):
+        """ Builds the linked lists of each cell, if necessary. """
+        if self._head is None:
+            n = len(self._agents)
+            self._next = np.full(len(self._cell), -1, dtype=int)
+            self._prev = np.full(len(self._cell), -1, dtype=int)
+            rows = np.argsort(self._cell[:n], kind='stable')
+            cells = self._cell[rows]
+            same = cells[1:] == cells[:-1]  # Consecutive rows in a cell
+            self._next[rows[:-1][same]] = rows[1:][same]
+            self._prev[rows[1:][same]] = rows[:-1][same]
+            first = np.ones(n, dtype=bool)
+            first[1:] = ~same
+            self._head = dict(zip(cells[first].tolist(),
+                                  rows[first].tolist()))
+
+    def _link(self, row, cell):
+        first = self._head.get(cell, -1)
+        self._next[row] = first
+        self._prev[row] = -1
+        if first != -1:
+            self._prev[first] = row
+        self._head[cell] = row
+
+    def _unlink(self, row, cell):
+        prev, next_ = self._prev[row], self._next[row]
+        if prev != -1:
+            self._next[prev] = next_
+        elif next_ != -1:
+            self._head[cell] = next_
+        else:
+            del self._head[cell]
+        if next_ != -1:
+            self._prev[next_] = prev
+
+    def _cell_rows(self, cell):
+        """ Returns the rows of the agents in a cell. """
+        self._links()
+        rows = []
+        row = self._head.get(cell, -1)
+        while row != -1:
+            rows.append(row)
+            row = self._next[row]
+        return rows
+
+    # Add and remove agents ----------------------------------------------- #
+
+    def add_agents(self, agents, positions=None, random=False, empty=False):
+        """ Adds agents to the grid environment.
+        See :func:`Grid.add_agents`. """
+        agents = list(agents)
+        pos, cells = self._choose_cells(agents, positions, random, empty)
+
+        n, k = len(self._agents), len(agents)
+        self._reserve(k)
+        self._pos[n:n+k] = pos
+        self._cell[n:n+k] = cells
+        for row, (agent, cell) in enumerate(zip(agents, cells.tolist()), n):
+            self._agents.append(agent)
+            self._rows[agent] = row
+            self._counts[cell] = self._counts.get(cell, 0) + 1
+            if self._head is not None:
+                self._link(row, cell)
+
+        if self._track_empty:
+            self.empty.update(cells[:0], cells)
+
+    def _choose_cells(self, agents, positions, random, empty):
+        """ Returns the positions of new agents as an array,
+        together with their flat indices. """
+        if positions is None or not len(positions):
+            # Choose cells without creating a list of all positions
+            k = len(agents)
+            if empty:
+                if self.empty is None:
+                    raise AgentpyError(
+                        "To use 'Grid.add_agents()' with 'empty=True', "
+                        "Grid must be iniated with 'track_empty=True'.")
+                if k > len(self.empty):
+                    raise AgentpyError(
+                        "Cannot add more agents than empty positions.")
+                cells = self.empty.sample(k, self.model.nprandom) \
+                    if random else self.empty.first(k)
+            else:
+                n_cells = int(np.prod(self.shape))
+                if random:
+                    cells = self.model.nprandom.integers(n_cells, size=k)
+                else:
+                    cells = np.arange(k) % n_cells
+            return self._unflat(cells), np.asarray(cells, dtype=int)
+        positions = self._choose_positions(agents, positions, random, False)
+        positions = list(itertools.islice(positions, len(agents)))
+        pos = np.array(positions, dtype=int).reshape(-1, self.ndim)
+        return pos, self._flat(pos)
+
+    def remove_agents(self, agents):
+        """ Removes agents from the environment. """
+        for agent in make_list(agents):
+            row = self._rows.pop(agent)
+            cell = int(self._cell[row])
+            position = self._position_of_row(row)
+            self._counts[cell] -= 1
+            if not self._counts[cell]:
+                del self._counts[cell]
+            if self._track_empty:
+                self.empty.vacate(position)
+            if self._head is not None:
+                self._unlink(row, cell)
+
+            # Move last row into the free row
+            last = len(self._agents) - 1
+            moved = self._agents.pop()
+            if row != last:
+                self._agents[row] = moved
+                self._rows[moved] = row
+                self._pos[row] = self._pos[last]
+                self._cell[row] = self._cell[last]
+                if self._head is not None:
+                    prev, next_ = self._prev[last], self._next[last]
+                    self._prev[row], self._next[row] = prev, next_
+                    if prev != -1:
+                        self._next[prev] = row
+                    else:
+                        self._head[int(self._cell[row])] = row
+                    if next_ != -1:
+                        self._prev[next_] = row
+
+    def _position_of_row(self, row):
+        return tuple(self._pos[row].tolist())
+
+    # Move and select agents ---------------------------------------------- #
+
+    def move_to(self, agent, pos):
+        """ Moves agent to new position.
+
+        Arguments:
+            agent (Agent): Instance of the agent.
+            pos (tuple of int): New position of the agent.
+        """
+        row = self._rows[agent]
+        pos_old = self._position_of_row(row)
+        pos = tuple(pos)
+        if self._check_border:
+            pos = self._border_behavior(pos, self.shape, self._torus)
+        if pos == pos_old:
+            return
+        cell_old = int(self._cell[row])
+        cell = int(np.ravel_multi_index(pos, self.shape))
+
+        if self._track_empty:
+            self.empty.move(pos_old, pos)
+
+        self._counts[cell_old] -= 1
+        if not self._counts[cell_old]:
+            del self._counts[cell_old]
+        self._counts[cell] = self._counts.get(cell, 0) + 1
+        if self._head is not None:
+            self._unlink(row, cell_old)
+            self._link(row, cell)
+        self._pos[row] = pos
+        self._cell[row] = cell
+
+    def neighbors(self, agent, distance=1, neighborhood='moore'):
+        """ Select neighbors of an agent within a given distance.
+        See :func:`Grid.neighbors`.
+
+        Returns:
+            AgentIter: Iterator over the selected neighbors.
+        """
+        offsets, wraps = self._neighborhood(distance, neighborhood)
+        pos = self._pos[self._rows[agent]]
+        cells = self._flat(self._neighbor_cells(pos, offsets, wraps))
+        rows = []
+        for cell in cells.tolist():
+            if cell in self._counts:
+                rows.extend(self._cell_rows(cell))
+        agents = [self._agents[row] for row in rows
+                  if self._agents[row] is not agent]
+        return AgentIter(self.model, agents)
+
+    def _agent_positions(self):
+        return list(self._agents), self._pos[:len(self._agents)]
+
+    def _positions_of(self, agents):
+        rows = np.fromiter((self._rows[a] for a in agents), dtype=int,
+                           count=len(agents))
+        return self._pos[rows]
+
+    def _occupancy(self, cells):
+        if self._track_empty:
+            return self.empty.counts[cells]
+        counts = self._counts
+        return np.fromiter((counts.get(c, 0) for c in cells.tolist()),
+                           dtype=int, count=len(cells))
+
+    def _apply_moves(self, agents, rows, new, old_cells, new_cells):
+        if not len(rows):
+            return
+        slots = np.fromiter((self._rows[agents[i]] for i in rows.tolist()),
+                            dtype=int, count=len(rows))
+        self._pos[slots] = new[rows]
+        self._cell[slots] = new_cells[rows]
+        counts = self._counts
+        for cells, sign in ((old_cells[rows], -1), (new_cells[rows], 1)):
+            cells, n = np.unique(cells, return_counts=True)
+            for cell, k in zip(cells.tolist(), n.tolist()):
+                counts[cell] = counts.get(cell, 0) + sign * k
+                if not counts[cell]:
+                    del counts[cell]
+        self._head = None  # Links are rebuilt on demand
+
+    # Fields and attributes ----------------------------------------------- #
+
+    def apply(self, func, field='agents'):
+        """ Applies a function to each grid position,
+        end returns an `numpy.ndarray` of return values.
+        See :func:`Grid.apply`. For the field 'agents',
+        the function receives a list of the agents in each cell.
+        """
+        if field != 'agents':
+            return np.vectorize(func)(self.grid[field])
+        cells = np.empty(int(np.prod(self.shape)), dtype=object)
+        for i in range(len(cells)):
+            cells[i] = []
+        for agent, cell in zip(self._agents, self._cell.tolist()):
+            cells[cell].append(agent)
+        return np.vectorize(func)(cells.reshape(self.shape))
+
+
+class _DerivedEmptyCells:
+    """ Unoccupied positions of a :class:`SparseGrid`.
+    Positions are derived from the occupied cells when they are requested,
+    instead of being stored for each cell. """
+
+    def __init__(self, grid):
+        self._grid = grid
+        self._n_cells = math.prod(grid.shape)
+
+    def __repr__(self):
+        return f"EmptyCells ({len(self)} positions)"
+
+    def __len__(self):
+        return self._n_cells - len(self._grid._counts)
+
+    def __contains__(self, position):
+        position = tuple(position)
+        if len(position) != self._grid.ndim or not all(
+                0 <= x < n for x, n in zip(position, self._grid.shape)):
+            return False
+        cell = int(np.ravel_multi_index(position, self._grid.shape))
+        return cell not in self._grid._counts
+
+    def __iter__(self):
+        chunk = 2 ** 16
+        for start in range(0, self._n_cells, chunk):
+            cells = np.arange(start, min(start + chunk, self._n_cells))
+            cells = cells[self._free(cells)]
+            yield from map(tuple, self._grid._unflat(cells).tolist())
+
+    def _occupied(self):
+        counts = self._grid._counts
+        return np.sort(np.fromiter(counts, dtype=int, count=len(counts)))
+
+    def _free(self, cells, occupied=None):
+        """ Returns a mask of the cells that are not occupied. """
+        occupied = self._occupied() if occupied is None else occupied
+        if not len(occupied):
+            return np.ones(len(cells), dtype=bool)
+        idx = np.searchsorted(occupied, cells).clip(max=len(occupied) - 1)
+        return occupied[idx] != cells
+
+    def first(self, k):
+        """ Returns the flat indices of the first `k` empty cells. """
+        occupied = self._occupied()
+        cells = np.arange(min(self._n_cells, k + len(occupied)))
+        return cells[self._free(cells, occupied)][:k]
+
+    def sample(self, k, rng):
+        """ Returns the flat indices of `k` different empty cells,
+        chosen at random with the generator `rng`.
+        Candidates are drawn from all cells and rejected if they are
+        occupied, unless most cells are occupied. """
+        free = len(self)
+        if k > free:
+            raise AgentpyError("Cannot add more agents than empty positions.")
+        occupied = self._occupied()
+        if 2 * free < self._n_cells:  # Cells can be listed cheaply
+            cells = np.arange(self._n_cells)
+            return rng.choice(cells[self._free(cells, occupied)], k,
+                              replace=False)
+        chosen = np.zeros(0, dtype=int)
+        while len(chosen) < k:
+            n = int((k - len(chosen)) * self._n_cells / free * 1.1) + 8
+            cells = rng.integers(self._n_cells, size=n)
+            cells = cells[self._free(cells, occupied)]
+            chosen = np.concatenate([chosen, cells])
+            _, first = np.unique(chosen, return_index=True)
+            chosen = chosen[np.sort(first)]
+        return chosen[:k]
+
+
+class SparseGrid(ArrayGrid):
+    """ Grid for huge lattices that are mostly empty.
+    Like :class:`ArrayGrid`, it stores agent positions in arrays
+    and keeps the agents of occupied cells in a hash table,
+    so that memory scales with the number of agents.
+    Empty cells are not tracked, but derived from the occupied cells:
+    random empty positions are drawn by rejection sampling,
+    and neighbors are looked up by cell key, either for each cell
+    of the neighborhood or, if there are fewer occupied cells than
+    cells in a neighborhood, for each occupied cell within range.
+    Neither path scans the positions of all agents.
+    Attribute fields, :obj:`Grid.all`, and :func:`Grid.apply` still
+    require memory for each cell and should be avoided on huge lattices.
+
+    Arguments:
+        model (Model): The model instance.
+        shape (tuple of int): Size of the grid.
+        torus (bool, optional): Whether to connect borders (default False).
+        check_border (bool, optional):
+            Ensure that agents stay within border (default True).
+        **kwargs: Will be forwarded to :func:`Grid.setup`.
+
+    Attributes:
+        empty (Collection): Unoccupied positions, which can be iterated
+            over in row-major order and support membership tests.
+
+    Examples:
+
+        Place agents at random empty positions in a huge habitat::
+
+            grid = ap.SparseGrid(model, (10_000, 10_000))
+            grid.add_agents(agents, random=True, empty=True)
+    """
+
+    def __init__(self, model, shape, torus=False,
+                 check_border=True, **kwargs):
+
+        SpatialEnvironment.__init__(self, model)
+        self._init_storage(shape, torus, False, check_border)
+        self.empty = _DerivedEmptyCells(self)
+
+        self._set_var_ignore()
+        self.setup(**kwargs)
+
+    def neighbors(self, agent, distance=1, neighborhood='moore'):
+        """ Select neighbors of an agent within a given distance.
+        See :func:`Grid.neighbors`. The order of neighbors depends on
+        whether the cells of the neighborhood or the occupied cells
+        are scanned.
+
+        Returns:
+            AgentIter: Iterator over the selected neighbors.
+        """
+        offsets, _ = self._neighborhood(distance, neighborhood)
+        if not isinstance(neighborhood, str) \
+                or len(self._counts) >= len(offsets):
+            return super().neighbors(agent, distance, neighborhood)
+
+        # Scan the keys of the occupied cells
+        cells = np.fromiter(self._counts, dtype=int, count=len(self._counts))
+        shape = np.array(self.shape)
+        diff = np.abs(self._unflat(cells) - self._pos[self._rows[agent]])
+        if self._torus:
+            diff = np.minimum(diff, shape - diff)
+        if neighborhood == 'moore':
+            near = diff.max(axis=1) <= distance
+        else:
+            near = diff.sum(axis=1) <= distance
+        rows = []
+        for cell in cells[near].tolist():
+            rows.extend(self._cell_rows(cell))
+        agents = [self._agents[row] for row in rows
+                  if self._agents[row] is not agent]
+        return AgentIter(self.model, agents)
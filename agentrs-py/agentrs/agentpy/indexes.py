@@ -0,0 +1,267 @@
+"""
+Agentpy Indexes Module
+Content: Secondary indexes over agent attributes
+"""
+
+import weakref
+from bisect import bisect_left, bisect_right
+from itertools import count
+from math import inf
+
+from .tools import AgentpyError
+
+_MISSING = object()
+
+
+class IndexedAttribute:
+    """ Descriptor that informs the indexes of an attribute
+    whenever the attribute of an object is assigned or deleted.
+    Values are stored in the object's `__dict__`, or passed on to the
+    slot or :class:`Column` descriptor that the attribute had before. """
+
+    def __init__(self, key, inner=None, default=_MISSING):
+        self.key = key
+        self.inner = inner
+        self.default = default
+        self.indexes = weakref.WeakSet()
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        if self.inner is not None:
+            return self.inner.__get__(obj, objtype)
+        try:
+            return obj.__dict__[self.key]
+        except KeyError:
+            if self.default is _MISSING:
+                raise AttributeError(f"No attribute '{self.key}'.") from None
+            return self.default
+
+    def __set__(self, obj, value):
+        if self.inner is not None:
+            self.inner.__set__(obj, value)
+        else:
+            obj.__dict__[self.key] = value
+        for index in self.indexes:
+            index.update(obj, value)
+
+    def __delete__(self, obj):
+        if self.inner is not None:
+            self.inner.__delete__(obj)
+        else:
+            del obj.__dict__[self.key]
+        for index in self.indexes:
+            index.update(obj, _MISSING)
+
+
+def indexed_attribute(cls, key):
+    """ Returns the :class:`IndexedAttribute` of `key` for a class,
+    and installs it on the class if it does not exist yet.
+    Classes of the agentpy library itself are never modified,
+    as this would affect all models that use them. """
+    current = _class_attribute(cls, key)
+    if isinstance(current, IndexedAttribute):
+        return current
+    if cls.__module__.startswith(__package__ + '.'):
+        raise AgentpyError(f"Attribute '{key}' of {cls.__name__} cannot be "
+                           "indexed, as the class is part of agentpy. "
+                           "Use a subclass of it instead.")
+    if hasattr(current, '__set__'):
+        descriptor = IndexedAttribute(key, inner=current)
+    elif hasattr(current, '__get__'):
+        raise AgentpyError(f"Attribute '{key}' of {cls.__name__} "
+                           "is a method and cannot be indexed.")
+    else:
+        descriptor = IndexedAttribute(key, default=current)
+    descriptor.owner = cls
+    descriptor.original = cls.__dict__.get(key, _MISSING)
+    setattr(cls, key, descriptor)
+    return descriptor
+
+
+def release_indexed_attribute(descriptor):
+    """ Restores the original attribute of the class
+    that an :class:`IndexedAttribute` has been installed on,
+    if the attribute is not used by any index anymore. """
+    if any(True for _ in descriptor.indexes):
+        return
+    cls, key = descriptor.owner, descriptor.key
+    if cls.__dict__.get(key) is not descriptor:
+        return
+    if descriptor.original is _MISSING:
+        delattr(cls, key)
+    else:
+        setattr(cls, key, descriptor.original)
+
+
+def refresh_indexes(objs, key, cls):
+    """ Updates the indexes of an attribute after its values have been
+    written directly into storage, e.g. into a :class:`ColumnStore`,
+    for objects that are all instances of `cls`.
+    Returns right away if the attribute is not indexed. """
+    descriptor = _class_attribute(cls, key)
+    if not isinstance(descriptor, IndexedAttribute) or not descriptor.indexes:
+        return
+    for index in descriptor.indexes:
+        for obj in objs:
+            index.update(obj, getattr(obj, key))
+
+
+def _class_attribute(cls, key):
+    """ Returns the attribute of a class as defined in its namespace
+    or the namespace of its parents, without calling descriptors. """
+    for base in cls.__mro__:
+        if key in base.__dict__:
+            return base.__dict__[key]
+    return _MISSING
+
+
+class AttributeIndex:
+    """ Base class for indexes over the attribute of a group of objects. """
+
+    def __init__(self, key):
+        self.key = key
+        self.values = {}  # Object : Indexed value
+        self._classes = {}  # Class : IndexedAttribute
+
+    def __repr__(self):
+        return f"{type(self).__name__} of '{self.key}' " \
+               f"({len(self)} objects)"
+
+    def __len__(self):
+        return len(self.values)
+
+    def __contains__(self, obj):
+        return obj in self.values
+
+    def add(self, obj):
+        """ Adds an object to the index. """
+        cls = type(obj)
+        if cls not in self._classes:
+            descriptor = indexed_attribute(cls, self.key)
+            if self not in descriptor.indexes:
+                descriptor.indexes.add(self)
+                weakref.finalize(self, release_indexed_attribute, descriptor)
+            self._classes[cls] = descriptor
+        if obj not in self.values:
+            self._insert(obj, getattr(obj, self.key, _MISSING))
+
+    def discard(self, obj):
+        """ Removes an object from the index, if it is present. """
+        if obj in self.values:
+            self._delete(obj)
+
+    def update(self, obj, value):
+        """ Moves an object to a new value, if it is present. """
+        if obj in self.values:
+            self._delete(obj)
+            self._insert(obj, value)
+
+    def rebuild(self, objs):
+        """ Replaces the indexed objects with `objs`. """
+        self.clear()
+        for obj in objs:
+            self.add(obj)
+
+    def detach(self):
+        """ Removes all objects from the index and stops tracking their
+        attribute. Classes whose attribute is not used by any other index
+        get their original attribute back. """
+        self.clear()
+        for descriptor in set(self._classes.values()):
+            descriptor.indexes.discard(self)
+            release_indexed_attribute(descriptor)
+        self._classes.clear()
+
+
+class HashIndex(AttributeIndex):
+    """ Index that groups objects by the value of an attribute.
+    Values have to be hashable. Objects with the same value
+    are kept in the order in which they have been added.
+
+    Arguments:
+        key (str): Name of the indexed attribute.
+    """
+
+    def __init__(self, key):
+        super().__init__(key)
+        self.groups = {}  # Value : Objects (as keys of an ordered dict)
+
+    def _insert(self, obj, value):
+        self.values[obj] = value
+        if value is not _MISSING:
+            self.groups.setdefault(value, {})[obj] = None
+
+    def _delete(self, obj):
+        value = self.values.pop(obj)
+        if value is not _MISSING:
+            group = self.groups[value]
+            del group[obj]
+            if not group:
+                del self.groups[value]
+
+    def clear(self):
+        """ Removes all objects from the index. """
+        self.values.clear()
+        self.groups.clear()
+
+    def get(self, value):
+        """ Returns the objects whose attribute is equal to `value`. """
+        return self.groups.get(value, {}).keys()
+
+
+class SortedIndex(AttributeIndex):
+    """ Index that orders objects by the value of an attribute.
+    Values have to be comparable with each other; objects whose
+    value is missing or not a number (NaN) are not included in queries.
+    Objects with the same value are kept in the order
+    in which they have been assigned this value.
+
+    Arguments:
+        key (str): Name of the indexed attribute.
+    """
+
+    def __init__(self, key):
+        super().__init__(key)
+        self.keys = []  # Sorted pairs of value and insertion number
+        self.objs = []  # Objects in the same order as keys
+        self._counter = count()
+
+    def _insert(self, obj, value):
+        if value is _MISSING or value != value:  # Missing or NaN
+            self.values[obj] = None
+            return
+        entry = (value, next(self._counter))
+        i = bisect_right(self.keys, entry)
+        self.keys.insert(i, entry)
+        self.objs.insert(i, obj)
+        self.values[obj] = entry
+
+    def _delete(self, obj):
+        entry = self.values.pop(obj)
+        if entry is not None:
+            i = bisect_left(self.keys, entry)
+            del self.keys[i]
+            del self.objs[i]
+
+    def clear(self):
+        """ Removes all objects from the index. """
+        self.values.clear()
+        self.keys.clear()
+        self.objs.clear()
+
+    def get(self, value):
+        """ Returns the objects whose attribute is equal to `value`. """
+        return self.range(value, value)
+
+    def range(self, lower=None, upper=None):
+        """ Returns the objects whose attribute lies within
+        `lower` and `upper` (inclusive), ordered by value.
+        A bound of None leaves the range open on that side. """
+        start = 0 if lower is None else bisect_left(self.keys, (lower,))
+        stop = len(self.keys) if upper is None \
+            else bisect_right(self.keys, (upper, inf))
+        return self.objs[start:stop]
+
+
+index_types = {'hash': HashIndex, 'sorted': SortedIndex}
@@ -5,6 +5,8 @@ Content: Main class for agent-based models
 
 from collections.abc import Mapping
 from datetime import datetime
+from os import makedirs
+from pathlib import Path
 import random
 import sys
 from typing import Generic, TypeVar
@@ -12,11 +14,13 @@ from typing import Generic, TypeVar
 import numpy as np
 import pandas as pd
 
-from .datadict import DataDict
+from .columns import ColumnStore, column_dtypes
+from .datadict import DataDict, PartitionedFrame
 from .object import Object
+from .recorder import Recorder
 from .sample import Range, Values
 from .sequences import AgentList
-from .tools import AttrDict, InfoStr, make_list
+from .tools import AgentpyError, AttrDict, InfoStr, make_list
 
 TParameters = TypeVar('TParameters', bound=Mapping)
 
@@ -112,6 +116,7 @@ class Model(Object, Generic[TParameters]):
 
         # Initiate model with id 0
         self._id_counter = -1
+        self._columns = {}
         super().__init__(self)
 
         # Simulation attributes
@@ -126,6 +131,7 @@ class Model(Object, Generic[TParameters]):
 
         # Recording results
         self._logs = {}
+        self._recorder = Recorder()
         self.reporters = {}
         self.output = DataDict()
         self.output.info = {
@@ -137,6 +143,7 @@ class Model(Object, Generic[TParameters]):
         }
 
         # Private variables
+        self._stream = None
         self._steps = None
         self._partly_run = False
         self._setup_kwargs = kwargs
@@ -204,6 +211,21 @@ class Model(Object, Generic[TParameters]):
         self._id_counter += 1
         return self._id_counter
 
+    def _new_ids(self, n):
+        """ Reserves a contiguous range of `n` ids. """
+        start = self._id_counter + 1
+        self._id_counter += n
+        return range(start, start + n)
+
+
+    # Columnar storage ------------------------------------------------------ #
+
+    def _column_store(self, cls):
+        """ Returns the :class:`ColumnStore` of an object type. """
+        if cls not in self._columns:
+            self._columns[cls] = ColumnStore(column_dtypes(cls))
+        return self._columns[cls]
+
 
     # Recording ------------------------------------------------------------- #
 
@@ -338,7 +360,6 @@ class Model(Object, Generic[TParameters]):
     def sim_reset(self):
         """ Reset model to initial conditions. """
         # TODO: Remove attributes
-        self.record = super().record
         self.__init__(parameters=self.p,
                       _run_id=self._run_id,
                       **self._setup_kwargs)
@@ -350,7 +371,8 @@ class Model(Object, Generic[TParameters]):
         """Stops :meth:`Model.run` during an active simulation."""
         self.running = False
 
-    def run(self, steps=None, seed=None, display=True) -> DataDict:
+    def run(self, steps=None, seed=None, display=True,
+            stream=None, flush_every=100) -> DataDict:
         """
         Executes the simulation of the model.
 
@@ -375,15 +397,40 @@ class Model(Object, Generic[TParameters]):
                 For a partly-run simulation, this argument will be ignored.
             display (bool, optional):
                 Whether to display simulation progress (default True).
+            stream (str or Path, optional):
+                Directory to which recorded variables are streamed
+                during the simulation (default None).
+                If given, variables are written to Parquet partitions
+                with :func:`Model.flush_output` every `flush_every` steps,
+                so that memory usage does not grow with the number of steps.
+                The directory has to be empty or not exist yet,
+                unless a partly-run simulation continues to stream to it.
+                Requires `pyarrow` or `fastparquet`.
+            flush_every (int, optional):
+                Number of steps between flushes to `stream` (default 100).
 
         Returns:
             DataDict: Recorded variables and reporters.
 
         """
         dt0 = datetime.now()
+        if stream is not None:
+            path = Path(stream)
+            continued = self._stream is not None \
+                and self._stream['path'] == path
+            if not continued and path.exists() and any(path.iterdir()):
+                raise AgentpyError(
+                    f"Stream directory '{path}' is not empty. Partitions "
+                    "of earlier runs would be mixed with the new ones.")
+            parts = self._stream['parts'] if self._stream else {}
+            self._stream = {'path': path, 'every': flush_every,
+                            'parts': parts, 'last': self.t}
         self.sim_setup(steps, seed)
         while self.running:
             self.sim_step()
+            if self._stream is not None \
+                    and self.t - self._stream['last'] >= self._stream['every']:
+                self.flush_output()
             if display:
                 print(f"\rCompleted: {self.t} steps", end='')
         self.end()
@@ -402,40 +449,93 @@ class Model(Object, Generic[TParameters]):
 
     # Data management ------------------------------------------------------- #
 
-    def create_output(self) -> None:  # noqa: C901
+    def _variable_frames(self):
+        """ Returns a dataframe of recorded variables for each object type,
+        combining the logs of single objects with the columnar buffers
+        of :func:`AgentList.record`. """
+        frames = {}
+        for obj_type, log_subdict in self._logs.items():
+            # Aggregate logs per object type
+            # Log dict structure: {obj_type: obj_id: log}
+            log = {}
+            for obj_id, obj_log in log_subdict.items():
+                for k, v in obj_log.items():
+                    if k not in log:
+                        log[k] = []
+                    log[k].extend(v)
+                if 'obj_id' not in log:
+                    log['obj_id'] = []
+                log['obj_id'].extend([obj_id] * len(obj_log['t']))
+            df = pd.DataFrame(log) if log else None
+
+            table = self._recorder.tables.get(obj_type)
+            df_table = table.to_frame() if table is not None else None
+            if df is None:
+                df = df_table
+            elif df_table is not None:
+                index_keys = ['obj_id', 't']
+                df = df.set_index(index_keys).combine_first(
+                    df_table.set_index(index_keys)).reset_index()
+            if df is not None:
+                frames[obj_type] = df
+        return frames
+
+    def _index_columns(self):
+        """ Returns additional index columns based on the run id. """
+        columns = {}
+        if self._run_id is not None:
+            if self._run_id[0] is not None:
+                columns['sample_id'] = self._run_id[0]
+            if len(self._run_id) > 1 and self._run_id[1] is not None:
+                columns['iteration'] = self._run_id[1]
+        return columns
+
+    def _indexed_frames(self, columns):
+        """ Returns the recorded variables of each object type
+        as dataframes with their final index. """
+        frames = self._variable_frames()
+        for obj_type, df in frames.items():
+            if obj_type == self.type:
+                del df['obj_id']
+                index_keys = ['t']
+            else:
+                index_keys = ['obj_id', 't']
+            for k, v in columns.items():
+                df[k] = v
+            frames[obj_type] = df.set_index(list(columns.keys()) + index_keys)
+        return frames
+
+    def _clear_variables(self):
+        """ Removes all recorded values, but keeps the logs connected. """
+        for log_subdict in self._logs.values():
+            for log in log_subdict.values():
+                for v in log.values():
+                    v.clear()
+        self._recorder.clear()
+
+    def flush_output(self):
+        """ Writes the variables that have been recorded since the last flush
+        to a new Parquet partition per object type and removes them from
+        memory. Requires that :func:`Model.run` was called with `stream`.
+        Partitions are written to `{stream}/{obj_type}/part-{i}.parquet`.
+        """
+        path = self._stream['path']
+        frames = self._indexed_frames(self._index_columns())
+        for obj_type, df in frames.items():
+            parts = self._stream['parts'].setdefault(obj_type, [])
+            makedirs(path / obj_type, exist_ok=True)
+            file = path / obj_type / f'part-{len(parts):05d}.parquet'
+            df.to_parquet(file)
+            parts.append(file)
+        self._clear_variables()
+        self._stream['last'] = self.t
+
+    def create_output(self) -> None:
         """ Generates a :class:`DataDict` with dataframes of all recorded
         variables and reporters, which will be stored in :obj:`Model.output`.
+        If the simulation was streamed to disk, variables are represented
+        by a :class:`PartitionedFrame` for each object type.
         """
-        def output_from_obj_list(self, log_dict, columns):
-            # Aggregate logs per object type
-            # Log dict structure: {obj_type: obj_id: log}
-            obj_types = {}
-            for obj_type, log_subdict in log_dict.items():
-                if obj_type not in obj_types.keys():
-                    obj_types[obj_type] = {}
-
-                for obj_id, log in log_subdict.items():
-                    # Add object id/key to object log
-                    log['obj_id'] = [obj_id] * len(log['t'])
-
-                    # Add object log to aggregate log
-                    for k, v in log.items():
-                        if k not in obj_types[obj_type]:
-                            obj_types[obj_type][k] = []
-                        obj_types[obj_type][k].extend(v)
-
-            # Dictionary to DataFrame
-            for obj_type, log in obj_types.items():
-                if obj_type == self.type:
-                    del log['obj_id']
-                    index_keys = ['t']
-                else:
-                    index_keys = ['obj_id', 't']
-                df = pd.DataFrame(log)
-                for k, v in columns.items():
-                    df[k] = v
-                df = df.set_index(list(columns.keys()) + index_keys)
-                self.output['variables'][obj_type] = df
 
         # Step 1: Document parameters
         if self.p:
@@ -443,18 +543,17 @@ class Model(Object, Generic[TParameters]):
             self.output['parameters']['constants'] = self.p.copy()
 
         # Step 2: Define additional index columns
-        columns = {}
-        if self._run_id is not None:
-            if self._run_id[0] is not None:
-                columns['sample_id'] = self._run_id[0]
-            if len(self._run_id) > 1 and self._run_id[1] is not None:
-                columns['iteration'] = self._run_id[1]
+        columns = self._index_columns()
 
         # Step 3: Create variable output
-        if self._logs:
-            self.output['variables'] = DataDict()
-            output_from_obj_list(self, self._logs, columns)
-
+        if self._stream is not None:
+            self.flush_output()
+            frames = {k: PartitionedFrame(v)
+                      for k, v in self._stream['parts'].items()}
+        else:
+            frames = self._indexed_frames(columns)
+        if frames:
+            self.output['variables'] = DataDict(frames)
         # Step 4: Create reporters output
         if self.reporters:
             d = {k: [v] for k, v in self.reporters.items()}
@@ -5,17 +5,42 @@ Content: Base classes for agents and environment
 from typing import Generic, TypeVar
 
 from .agentpy_types import ModelProtocol
+from .columns import Column, column_dtypes
 from .tools import make_list
 
 TModel = TypeVar('TModel', bound=ModelProtocol)
 
 class Object(Generic[TModel]):
-    """ Base class for all objects of an agent-based models. """
+    """ Base class for all objects of an agent-based models.
+
+    Attributes that are declared in the class attribute `columns`,
+    as a dictionary of names and numpy data types,
+    are stored in the columnar arrays of the model
+    instead of the object itself (see :class:`AgentList`).
+    """
+
+    __slots__ = ()
+    columns: dict = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        for key in cls.__dict__.get('columns', {}):
+            setattr(cls, key, Column(key))
 
     def __init__(self, model: TModel):
+        self._init_object(model, model._new_id())
+
+        # Assign a slot in the columnar store of the object type
+        if column_dtypes(type(self)):
+            self._store = model._column_store(type(self))
+            self._slot = self._store.add(self)
+
+    def _init_object(self, model, obj_id):
+        """ Sets the attributes that every object has,
+        without calling :func:`Object.setup`. """
         self._var_ignore = []
 
-        self.id = model._new_id()  # Assign id to new object
+        self.id = obj_id
         self.type = type(self).__name__
         self.log = {}
 
@@ -40,9 +65,10 @@ class Object(Generic[TModel]):
 
     @property
     def vars(self):
-        return [k for k in self.__dict__.keys()
-                if k[0] != '_'
-                and k not in self._var_ignore]
+        return list(column_dtypes(type(self))) + [
+            k for k in self.__dict__.keys()
+            if k[0] != '_'
+            and k not in self._var_ignore]
 
     def record(self, var_keys, value=None):
         """ Records an object's variables at the current time-step.
@@ -77,7 +103,10 @@ class Object(Generic[TModel]):
                 a.record(a.vars)
         """
 
-        # Initial record call
+        # Recording after the initial call
+        if 't' in self.log:
+            self._record(var_keys, value)
+            return
 
         # Connect log to the model's dict of logs
         if self.type not in self.model._logs:
@@ -90,9 +119,6 @@ class Object(Generic[TModel]):
             v = getattr(self, var_key) if value is None else value
             self.log[var_key] = [v]
 
-        # Set default recording function from now on
-        self.record = self._record  # noqa
-
     def _record(self, var_keys, value=None):
 
         for var_key in make_list(var_keys):
@@ -101,7 +127,7 @@ class Object(Generic[TModel]):
             if var_key not in self.log:
                 self.log[var_key] = [None] * len(self.log['t'])
 
-            if self.model.t != self.log['t'][-1]:
+            if not self.log['t'] or self.model.t != self.log['t'][-1]:
 
                 # Create empty slot for new documented time step
                 for v in self.log.values():
@@ -0,0 +1,184 @@
+"""
+Agentpy Recorder Module
+Content: Columnar buffers for recorded variables
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def to_array(values, n):
+    """ Converts values into a one-dimensional array of length `n`.
+    Strings and nested sequences are stored as objects. """
+    array = np.asarray(values)
+    if array.ndim == 0:
+        return np.full(n, values, dtype=object) \
+            if array.dtype.kind in 'USO' else np.full(n, array)
+    if array.ndim != 1 or array.dtype.kind in 'USV':
+        array = np.empty(n, dtype=object)
+        for i, v in enumerate(values):
+            array[i] = v
+    return array
+
+
+class RecordTable:
+    """ Recorded variables of one object type.
+    Each variable is stored as a two-dimensional array
+    with one row per object and one column per recorded time-step,
+    together with a mask that marks which entries have been recorded.
+    Both dimensions grow by doubling their capacity.
+
+    Attributes:
+        obj_ids (numpy.ndarray): Object id of each row.
+        times (list of int): Time-step of each column.
+        data (dict of numpy.ndarray): Values of each variable.
+        mask (dict of numpy.ndarray): Recorded entries of each variable.
+    """
+
+    def __init__(self, rows=64, times=16):
+        self.obj_ids = np.empty(rows, dtype=int)
+        self.times = []
+        self.data = {}
+        self.mask = {}
+        self._n = 0  # Number of rows in use
+        self._sorted_ids = np.empty(0, dtype=int)  # For id lookup
+        self._sorted_rows = np.empty(0, dtype=int)
+        self._shape = (rows, times)
+        self._last_ids = None
+        self._last_rows = None
+
+    def __len__(self):
+        return self._n
+
+    def _grow(self, n_rows, n_times):
+        """ Increases the capacity to hold at least the given shape. """
+        rows, times = self._shape
+        if n_rows <= rows and n_times <= times:
+            return
+        if n_rows > rows:
+            rows = max(n_rows, 2 * rows)
+            obj_ids = np.empty(rows, dtype=int)
+            obj_ids[:len(self)] = self.obj_ids[:len(self)]
+            self.obj_ids = obj_ids
+        if n_times > times:
+            times = max(n_times, 2 * times)
+        for key, old in self.data.items():
+            self.data[key] = self._new_array(old.dtype, (rows, times))
+            self.data[key][:old.shape[0], :old.shape[1]] = old
+            mask = np.zeros((rows, times), dtype=bool)
+            mask[:old.shape[0], :old.shape[1]] = self.mask[key]
+            self.mask[key] = mask
+        self._shape = (rows, times)
+
+    @staticmethod
+    def _new_array(dtype, shape):
+        if dtype.kind == 'f':
+            return np.full(shape, np.nan, dtype=dtype)
+        return np.empty(shape, dtype=dtype)
+
+    def _get_rows(self, obj_ids):
+        """ Returns the row of each object, adding new rows if needed.
+        Ids are looked up in a sorted array, so that no Python loop
+        over the objects is needed. """
+        if self._last_ids is not None \
+                and np.array_equal(obj_ids, self._last_ids):
+            return self._last_rows
+        obj_ids = np.asarray(obj_ids, dtype=int)
+        sorted_ids = self._sorted_ids
+        pos = np.searchsorted(sorted_ids, obj_ids)
+        found = pos < len(sorted_ids)
+        found[found] = sorted_ids[pos[found]] == obj_ids[found]
+        if not found.all():
+
+            # New objects get rows in the order of their first appearance
+            new, first = np.unique(obj_ids[~found], return_index=True)
+            new = new[np.argsort(first)]
+            n = len(self)
+            self._grow(n + len(new), self._shape[1])
+            self.obj_ids[n:n + len(new)] = new
+            self._n = n + len(new)
+            ids = np.concatenate([sorted_ids, new])
+            rows = np.concatenate([self._sorted_rows,
+                                   np.arange(n, n + len(new))])
+            order = np.argsort(ids, kind='stable')
+            self._sorted_ids, self._sorted_rows = ids[order], rows[order]
+            pos = np.searchsorted(self._sorted_ids, obj_ids)
+        rows = self._sorted_rows[pos]
+        self._last_ids = obj_ids
+        self._last_rows = rows
+        return rows
+
+    def _get_column(self, t):
+        """ Returns the column of time-step `t`. """
+        if not self.times or self.times[-1] != t:
+            self._grow(self._shape[0], len(self.times) + 1)
+            self.times.append(t)
+        return len(self.times) - 1
+
+    def record(self, obj_ids, t, key, values):
+        """ Writes the values of a variable for multiple objects. """
+        rows = self._get_rows(obj_ids)
+        col = self._get_column(t)
+        values = to_array(values, len(rows))
+        if key not in self.data:
+            dtype = values.dtype if values.dtype.kind in 'biuf' \
+                else np.dtype(object)
+            self.data[key] = self._new_array(dtype, self._shape)
+            self.mask[key] = np.zeros(self._shape, dtype=bool)
+        else:
+            dtype = np.result_type(self.data[key].dtype, values.dtype)
+            if dtype.kind not in 'biuf':
+                dtype = np.dtype(object)
+            if dtype != self.data[key].dtype:
+                self.data[key] = self.data[key].astype(dtype)
+        self.data[key][rows, col] = values
+        self.mask[key][rows, col] = True
+
+    def clear(self):
+        """ Removes all recorded values, but keeps the rows of objects. """
+        self.times = []
+        for key, array in self.data.items():
+            self.data[key] = self._new_array(array.dtype, self._shape)
+            self.mask[key][:] = False
+
+    def to_frame(self):
+        """ Returns a :class:`pandas.DataFrame` of the recorded values,
+        with one row for each object and time-step with a record. """
+        n_rows, n_times = len(self), len(self.times)
+        if not self.data or n_times == 0:
+            return None
+        recorded = np.zeros((n_rows, n_times), dtype=bool)
+        for mask in self.mask.values():
+            recorded |= mask[:n_rows, :n_times]
+        rows, cols = np.nonzero(recorded)
+        log = {'obj_id': self.obj_ids[rows],
+               't': np.asarray(self.times)[cols]}
+        for key, array in self.data.items():
+            values = array[rows, cols]
+            missing = ~self.mask[key][rows, cols]
+            if missing.any():
+                if values.dtype.kind in 'biu':
+                    values = values.astype(float)
+                values[missing] = np.nan if values.dtype.kind == 'f' else None
+            log[key] = values
+        return pd.DataFrame(log)
+
+
+class Recorder:
+    """ Columnar buffers for the variables that are recorded
+    through :func:`AgentList.record`, with one :class:`RecordTable`
+    for each object type. """
+
+    def __init__(self):
+        self.tables = {}
+
+    def record(self, obj_type, obj_ids, t, key, values):
+        """ Writes the values of a variable for multiple objects. """
+        if obj_type not in self.tables:
+            self.tables[obj_type] = RecordTable()
+        self.tables[obj_type].record(obj_ids, t, key, values)
+
+    def clear(self):
+        """ Removes all recorded values. """
+        for table in self.tables.values():
+            table.clear()
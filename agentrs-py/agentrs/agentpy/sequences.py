@@ -4,10 +4,17 @@ Content: Lists for objects, environments, and agents
 """
 
 from collections.abc import MutableSequence, Sequence
+from functools import partial, update_wrapper
+from types import FunctionType
+
+import numpy as np
 
 import agentrs.agentpy as ap
 
-from .tools import AgentpyError
+from .columns import ColumnSelection, column_dtypes
+from .indexes import index_types, refresh_indexes
+from .recorder import to_array
+from .tools import AgentpyError, make_list
 
 
 class AgentSequence:
@@ -29,6 +36,134 @@ class AgentSequence:
     def _set(self, key, value):
         object.__setattr__(self, key, value)
 
+    def _set_all(self, name, value):
+        """ Assigns an attribute to each object. Values of type
+        :class:`AttrIter` or :class:`AttrExpr`, and arrays with more than
+        one dimension and one row per object, assign a different value
+        to each object. Other values, including one-dimensional arrays,
+        are assigned to all objects. The columnar attributes of an
+        :class:`AgentList` are an exception, see :class:`AgentList`. """
+        if isinstance(value, AttrExpr):
+            value = value.to_array()
+            if value.ndim == 1:
+                value = AttrIter(value.tolist())
+        if isinstance(value, np.ndarray) and value.ndim > 1 \
+                and len(value) == len(self):  # type: ignore
+            value = AttrIter(list(value))
+        if isinstance(value, AttrIter):
+            # Apply each value to each agent
+            for obj, v in zip(self, value, strict=True):  # type: ignore
+                setattr(obj, name, v)
+        else:
+            # Apply single value to all agents
+            for obj in self:  # type: ignore
+                setattr(obj, name, value)
+
+    def call(self, name, *args, **kwargs):
+        """ Calls a method of each object, like `agents.name(...)`,
+        but without collecting the return values.
+        The method is looked up once per class of objects,
+        and methods that are decorated with :func:`batched`
+        are called once with all objects of the group.
+
+        Arguments:
+            name (str): Name of the method.
+            *args: Arguments that are passed to each call.
+            **kwargs: Keyword arguments that are passed to each call.
+        """
+        _dispatch(self, name, args, kwargs, collect=False)
+
+    # Indexes ------------------------------------------------------------- #
+
+    def add_index(self, key, kind='hash'):
+        """ Adds an index over an attribute of the sequence's objects,
+        which allows :func:`AgentSequence.where` to look up objects
+        without scanning the whole sequence.
+        The index is updated automatically when objects are added to or
+        removed from the sequence, and when the attribute of an object
+        is assigned, e.g. through `agent.state = 'infected'`.
+        To do so, the attribute of the objects' class is replaced until
+        the index is removed, which is why objects have to be
+        instances of a custom class rather than e.g. :class:`Agent`.
+
+        Arguments:
+            key (str): Name of the attribute.
+            kind (str, optional): Type of the index.
+                If 'hash' (default), objects are grouped by value,
+                which allows to select objects with a specific value.
+                If 'sorted', objects are ordered by value,
+                which additionally allows to select a range of values.
+
+        Examples:
+
+            Select all infected agents::
+
+                agents.add_index('state')
+                infected = agents.where(state='infected')
+
+            Select all agents with an age between 18 and 65::
+
+                agents.add_index('age', kind='sorted')
+                adults = agents.where(age=(18, 65))
+        """
+        if kind not in index_types:
+            raise AgentpyError(f"Index kind '{kind}' is not supported. "
+                               f"Choose from {list(index_types)}.")
+        index = index_types[kind](key)
+        index.rebuild(self)  # type: ignore
+        if key in self._indexes:
+            self._indexes[key].detach()
+        self._indexes[key] = index
+
+    def remove_index(self, key):
+        """ Removes the index over an attribute. """
+        self._indexes.pop(key).detach()
+
+    def where(self, **conditions):
+        """ Returns an :class:`AgentList` with the objects whose
+        attributes meet all conditions. Each attribute has to be
+        indexed with :func:`AgentSequence.add_index`.
+        The time of this lookup depends on the number of selected objects,
+        not on the length of the sequence.
+
+        Arguments:
+            **conditions: Selected value of each attribute.
+                For sorted indexes, a tuple `(lower, upper)` selects
+                all values within this range (inclusive).
+                A bound of None leaves the range open on that side.
+        """
+        results = []
+        for key, value in conditions.items():
+            if key not in self._indexes:
+                raise AgentpyError(f"Attribute '{key}' has no index. "
+                                   "Use add_index() to create one.")
+            index = self._indexes[key]
+            if isinstance(value, tuple) and hasattr(index, 'range'):
+                results.append(index.range(*value))
+            else:
+                results.append(index.get(value))
+        if not results:
+            return AgentList(self.model, self)  # type: ignore
+        results.sort(key=len)
+        others = [set(r) if isinstance(r, list) else r for r in results[1:]]
+        selection = [obj for obj in results[0]
+                     if all(obj in other for other in others)]
+        return AgentList(self.model, selection)  # type: ignore
+
+    def _index_add(self, objs):
+        for index in self._indexes.values():
+            for obj in objs:
+                index.add(obj)
+
+    def _index_discard(self, objs):
+        for index in self._indexes.values():
+            for obj in objs:
+                index.discard(obj)
+
+    def _index_rebuild(self):
+        for index in self._indexes.values():
+            index.rebuild(self)
+
     @staticmethod
     def _obj_gen(model, n, cls, *args, **kwargs):
         """ Generate objects for sequence. """
@@ -41,23 +176,248 @@ class AgentSequence:
                 "Sequences no longer accept extra arguments without a keyword."
                 f" Please assign a keyword to the following arguments: {args}")
 
+        # AttrIter values get broadcasted among agents
+        broadcast = {k for k, arg in kwargs.items()
+                     if isinstance(arg, AttrIter)}
+        if not broadcast:
+            for _ in range(n):
+                yield cls(model, **kwargs)
+            return
+
+        i_kwargs = dict(kwargs)
         for i in range(n):
-            # AttrIter values get broadcasted among agents
-            i_kwargs = {k: arg[i] if isinstance(arg, AttrIter) else arg
-                        for k, arg in kwargs.items()}
+            for k in broadcast:
+                i_kwargs[k] = kwargs[k][i]
             yield cls(model, **i_kwargs)
 
+    @staticmethod
+    def _obj_bulk(model, cls, columns):
+        """ Generate objects for sequence from columns of values. """
+
+        if cls is None:
+            cls = ap.Agent
+
+        def is_sequence(v):
+            return hasattr(v, '__len__') and not isinstance(v, str)
+
+        lengths = {len(v) for v in columns.values() if is_sequence(v)}
+        if len(lengths) != 1:
+            raise AgentpyError(
+                "Columns must include at least one sequence, "
+                "and all sequences must have the same length.")
+        n = lengths.pop()
+
+        # Create bare objects with a contiguous range of ids
+        objs = [cls.__new__(cls) for _ in range(n)]
+        for obj, obj_id in zip(objs, model._new_ids(n)):
+            obj._init_object(model, obj_id)
+
+        # Columnar attributes are written to the store as a whole
+        dtypes = column_dtypes(cls)
+        if dtypes:
+            store = model._column_store(cls)
+            slots = store.extend(objs)
+            for obj, slot in zip(objs, slots.tolist()):
+                obj._store = store
+                obj._slot = slot
+            if n and slots[-1] - slots[0] == n - 1:
+                slots = slice(slots[0], slots[0] + n)  # Write into a view
+            for k in [k for k in columns if k in dtypes]:
+                store.data[k][slots] = columns.pop(k)
+
+        # Other attributes are assigned per object
+        for k, values in columns.items():
+            if not is_sequence(values):
+                for obj in objs:
+                    setattr(obj, k, values)
+            else:
+                if isinstance(values, np.ndarray):
+                    values = values.tolist()
+                for obj, v in zip(objs, values):
+                    setattr(obj, k, v)
+
+        return objs
+
 
 # Attribute List ------------------------------------------------------------ #
 
-class AttrIter(AgentSequence, Sequence):
+class _ArrayOperators:
+    """ Operators and reductions for lazy arrays of agent attributes.
+    Operators and NumPy ufuncs do not compute their result right away,
+    but return an :class:`AttrExpr`. Subclasses implement `to_array`. """
+
+    def to_array(self):
+        raise NotImplementedError
+
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+        if method == '__call__' and ufunc.nout == 1 and not kwargs:
+            return AttrExpr(ufunc, *inputs)
+        inputs = [np.asarray(x) if isinstance(x, _ArrayOperators) else x
+                  for x in inputs]
+        return getattr(ufunc, method)(*inputs, **kwargs)
+
+    # Boolean operators --------------------------------------------------- #
+
+    def __eq__(self, other):
+        return AttrExpr(np.equal, self, other)
+
+    def __ne__(self, other):
+        return AttrExpr(np.not_equal, self, other)
+
+    def __lt__(self, other):
+        return AttrExpr(np.less, self, other)
+
+    def __le__(self, other):
+        return AttrExpr(np.less_equal, self, other)
+
+    def __gt__(self, other):
+        return AttrExpr(np.greater, self, other)
+
+    def __ge__(self, other):
+        return AttrExpr(np.greater_equal, self, other)
+
+    def __and__(self, other):
+        return AttrExpr(np.bitwise_and, self, other)
+
+    def __or__(self, other):
+        return AttrExpr(np.bitwise_or, self, other)
+
+    def __xor__(self, other):
+        return AttrExpr(np.bitwise_xor, self, other)
+
+    def __rand__(self, other):
+        return AttrExpr(np.bitwise_and, other, self)
+
+    def __ror__(self, other):
+        return AttrExpr(np.bitwise_or, other, self)
+
+    def __rxor__(self, other):
+        return AttrExpr(np.bitwise_xor, other, self)
+
+    def __invert__(self):
+        return AttrExpr(np.invert, self)
+
+    __hash__ = None  # type: ignore
+
+    # Arithmetic operators ------------------------------------------------ #
+
+    def __add__(self, v):
+        return AttrExpr(np.add, self, v)
+
+    def __sub__(self, v):
+        return AttrExpr(np.subtract, self, v)
+
+    def __mul__(self, v):
+        return AttrExpr(np.multiply, self, v)
+
+    def __truediv__(self, v):
+        return AttrExpr(np.true_divide, self, v)
+
+    def __floordiv__(self, v):
+        return AttrExpr(np.floor_divide, self, v)
+
+    def __mod__(self, v):
+        return AttrExpr(np.remainder, self, v)
+
+    def __pow__(self, v):
+        return AttrExpr(np.power, self, v)
+
+    def __radd__(self, v):
+        return AttrExpr(np.add, v, self)
+
+    def __rsub__(self, v):
+        return AttrExpr(np.subtract, v, self)
+
+    def __rmul__(self, v):
+        return AttrExpr(np.multiply, v, self)
+
+    def __rtruediv__(self, v):
+        return AttrExpr(np.true_divide, v, self)
+
+    def __rfloordiv__(self, v):
+        return AttrExpr(np.floor_divide, v, self)
+
+    def __rmod__(self, v):
+        return AttrExpr(np.remainder, v, self)
+
+    def __rpow__(self, v):
+        return AttrExpr(np.power, v, self)
+
+    def __neg__(self):
+        return AttrExpr(np.negative, self)
+
+    def __abs__(self):
+        return AttrExpr(np.absolute, self)
+
+    def __iadd__(self, v):
+        return self + v
+
+    def __isub__(self, v):
+        return self - v
+
+    def __imul__(self, v):
+        return self * v
+
+    def __itruediv__(self, v):
+        return self / v
+
+    # Reductions ---------------------------------------------------------- #
+
+    def sum(self):
+        """ Returns the sum of all values. """
+        return self.to_array().sum()
+
+    def mean(self):
+        """ Returns the arithmetic mean of all values. """
+        return self.to_array().mean()
+
+    def histogram(self, bins=10, range=None):
+        """ Returns the histogram of all values.
+        See :func:`numpy.histogram`.
+
+        Arguments:
+            bins (int or sequence, optional):
+                Number of equal-width bins (default 10),
+                or a sequence with the edges of each bin.
+            range (tuple, optional): Lower and upper range of the bins.
+
+        Returns:
+            tuple of numpy.ndarray: Number of values in each bin,
+            and the edges of the bins.
+        """
+        return np.histogram(self.to_array(), bins=bins, range=range)
+
+    def count_if(self, condition):
+        """ Returns the number of values that meet a condition.
+
+        Arguments:
+            condition (callable or object):
+                Either a function that takes the array of values
+                and returns a boolean mask, e.g. `lambda x: x > 5`,
+                or a value to which each value is compared.
+        """
+        values = self.to_array()
+        mask = condition(values) if callable(condition) \
+            else values == condition
+        return int(np.count_nonzero(mask))
+
+
+class AttrIter(_ArrayOperators, AgentSequence, Sequence):
     """ Iterator over an attribute of objects in a sequence.
     Length, items access, and representation work like with a normal list.
     Calls are forwarded to each entry and return a list of return values.
-    Boolean operators are applied to each entry and return a list of bools.
-    Arithmetic operators are applied to each entry and return a new list.
-    If applied to another `AttrList`, the first entry of the first list
-    will be matched with the first entry of the second list, and so on.
+
+    Whenever the values are needed for an operation,
+    they are gathered into a :class:`numpy.ndarray`,
+    so that results always reflect the current attributes of the objects.
+    Arithmetic and boolean operators are applied to each entry
+    and return an :class:`AttrExpr`, which behaves like an array
+    and is only computed once its values are used.
+    Boolean operators return a mask that can be passed to
+    :func:`AgentList.select`.
+    If applied to another `AttrIter` or an array,
+    the first entry of the first list will be matched with
+    the first entry of the second list, and so on.
     Else, the same value will be applied to each entry of the list.
     See :class:`AgentList` for examples.
     """
@@ -99,65 +459,224 @@ class AttrIter(AgentSequence, Sequence):
             self.source[key] = value
 
     def __call__(self, *args, **kwargs):
+        if self.attr:
+            return AttrIter(_dispatch(
+                self.source, self.attr, args, kwargs, collect=True))
         return AttrIter([func_obj(*args, **kwargs) for func_obj in self]) # type: ignore
 
-    def __eq__(self, other):
-        return [obj == other for obj in self]
+    def to_array(self):
+        """ Returns the current values as a :class:`numpy.ndarray`. """
+        return to_array(list(self), len(self))
 
-    def __ne__(self, other):
-        return [obj != other for obj in self]
+    def __array__(self, dtype=None, copy=None):
+        return _as_array(self.to_array(), dtype, copy)
 
-    def __lt__(self, other):
-        return [obj < other for obj in self]
 
-    def __le__(self, other):
-        return [obj <= other for obj in self]
+def _as_array(array, dtype=None, copy=None):
+    """ Implements the `__array__` protocol for a computed array. """
+    if dtype is not None:
+        return array.astype(dtype, copy=bool(copy))
+    return array.copy() if copy else array
 
-    def __gt__(self, other):
-        return [obj > other for obj in self]
 
-    def __ge__(self, other):
-        return [obj >= other for obj in self]
+class AttrExpr(_ArrayOperators):
+    """ Deferred computation on the attributes of a sequence,
+    as returned by operators on :class:`AttrIter`.
+    Expressions can be combined with further operators and NumPy ufuncs.
+    The whole expression is computed once its values are first used,
+    e.g. when it is assigned to an agent sequence, iterated over, indexed,
+    or reduced. Intermediate results are written into reused buffers,
+    so that an expression like `agents.x * 0.9 + agents.y / 2`
+    only allocates the arrays that are needed at the same time.
+    When assigned to a columnar attribute, the result is written
+    directly into the columnar store.
+    Other attributes and methods are looked up
+    on the resulting :class:`numpy.ndarray`.
 
-    def __add__(self, v):
-        if isinstance(v, AttrIter):
-            return AttrIter([x + y for x, y in zip(self, v, strict=True)])
-        else:
-            return AttrIter([x + v for x in self])
+    Arguments:
+        ufunc (numpy.ufunc): Function that computes the expression.
+        *operands: Arguments of the function.
+    """
 
-    def __sub__(self, v):
-        if isinstance(v, AttrIter):
-            return AttrIter([x - y for x, y in zip(self, v, strict=True)])
-        else:
-            return AttrIter([x - v for x in self])
+    def __init__(self, ufunc, *operands):
+        self.ufunc = ufunc
+        self.operands = operands
+        self._array = None
 
-    def __mul__(self, v):
-        if isinstance(v, AttrIter):
-            return AttrIter([x * y for x, y in zip(self, v, strict=True)])
-        else:
-            return AttrIter([x * v for x in self])
+    def __repr__(self):
+        return repr(list(self))
 
-    def __truediv__(self, v):
-        if isinstance(v, AttrIter):
-            return AttrIter([x / y for x, y in zip(self, v, strict=True)])
-        else:
-            return AttrIter([x / v for x in self])
+    def __getattr__(self, name):
+        if name[0] == '_':
+            raise AttributeError(name)
+        return getattr(self.to_array(), name)
 
-    def __iadd__(self, v):
-        return self + v
+    def __bool__(self):
+        raise ValueError("The truth value of an AttrExpr is ambiguous. "
+                         "Use a.any() or a.all()")
 
-    def __isub__(self, v):
-        return self - v
+    def __iter__(self):
+        return iter(self.to_array().tolist())
 
-    def __imul__(self, v):
-        return self * v
+    def __len__(self):
+        return len(self.to_array())
 
-    def __itruediv__(self, v):
-        return self / v
+    def __getitem__(self, key):
+        return self.to_array()[key]
+
+    def __setitem__(self, key, value):
+        self.to_array()[key] = value
+
+    def __array__(self, dtype=None, copy=None):
+        return _as_array(self.to_array(), dtype, copy)
+
+    def to_array(self):
+        """ Computes the expression once and returns the result
+        as a :class:`numpy.ndarray`. """
+        if self._array is None:
+            self._array = self._evaluate()
+        return self._array
+
+    def evaluate(self, out):
+        """ Computes the expression and writes the result into `out`,
+        without allocating an array for the final result if possible. """
+        if self._array is not None:
+            out[...] = self._array
+        elif self._evaluate(out) is not out:
+            out[...] = self._array
+
+    def _evaluate(self, out=None):
+        args, temps = [], []
+        for operand in self.operands:
+            if isinstance(operand, AttrExpr) and operand._array is None:
+                value = operand._evaluate()
+                temps.append(value)  # Owned by this evaluation
+            elif isinstance(operand, _ArrayOperators):
+                value = operand.to_array()
+            elif isinstance(operand, (list, tuple)):
+                value = np.asarray(operand)
+            else:
+                value = operand
+            args.append(value)
+
+        # Determine the result type from empty inputs
+        probe = self.ufunc(*[a[:0] if isinstance(a, np.ndarray) and a.ndim
+                             else a for a in args])
+        shape = np.broadcast_shapes(*[np.shape(a) for a in args])
+        if out is not None:
+            if out.shape == shape \
+                    and np.can_cast(probe.dtype, out.dtype, 'same_kind'):
+                return self.ufunc(*args, out=out)
+        else:
+            for temp in temps:
+                if temp.dtype == probe.dtype and temp.shape == shape:
+                    return self.ufunc(*args, out=temp)
+        result = self.ufunc(*args)
+        if out is not None:
+            self._array = result
+        return result
 
 
 # Object Containers --------------------------------------------------------- #
 
+# Method dispatch ----------------------------------------------------------- #
+
+class batched:
+    """ Decorator for agent methods that are implemented for a whole group
+    of agents at once. When the method is called through an agent sequence,
+    e.g. with `agents.step()` or `agents.call('step')`,
+    it is called once with an :class:`AgentList` of all agents
+    in the sequence that share this method,
+    after the methods of all other agents have been called.
+    When it is called on a single agent,
+    it receives an :class:`AgentList` with only this agent.
+    The method can return None or a sequence with one value per agent.
+
+    Examples:
+
+        Move all walkers at once::
+
+            class Walker(ap.Agent):
+                columns = {'x': float}
+
+                @ap.batched
+                def step(agents, dx):
+                    agents.x += dx
+
+            walkers.step(1)
+    """
+
+    def __init__(self, func):
+        self.func = func
+        update_wrapper(self, func)
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        return partial(self._call_one, obj)
+
+    def __call__(self, agents, *args, **kwargs):
+        return self.func(agents, *args, **kwargs)
+
+    def _call_one(self, obj, *args, **kwargs):
+        results = self.func(AgentList(obj.model, [obj]), *args, **kwargs)
+        return None if results is None else results[0]
+
+
+def _method_of(cls, name):
+    """ Returns the function or batched method `name` of a class,
+    or None if the method has to be looked up on each object. """
+    for base in cls.__mro__:
+        if name in base.__dict__:
+            method = base.__dict__[name]
+            if isinstance(method, (FunctionType, batched)):
+                return method
+            return None
+    return None
+
+
+def _dispatch(objs, name, args, kwargs, collect):
+    """ Calls the method `name` of each object, with one lookup
+    of the method per class, and returns a list of the return values
+    if `collect` is True. Batched methods are called for each group
+    after all other methods. Methods that are assigned to an object
+    itself are called normally. """
+    methods = {}  # Class : (Method, Whether objects have a __dict__)
+    groups = {}  # Batched method : (Positions, Objects)
+    results = []
+    for obj in objs:
+        cls = type(obj)
+        if cls not in methods:
+            methods[cls] = (_method_of(cls, name), cls.__dictoffset__ != 0)
+        method, has_dict = methods[cls]
+        if method is None or has_dict and name in obj.__dict__:
+            result = getattr(obj, name)(*args, **kwargs)
+        elif method.__class__ is batched:
+            positions, group = groups.setdefault(method, ([], []))
+            positions.append(len(results))
+            group.append(obj)
+            result = None
+        else:
+            result = method(obj, *args, **kwargs)
+        if collect:
+            results.append(result)
+    for method, (positions, group) in groups.items():
+        values = method.func(AgentList(group[0].model, group), *args, **kwargs)
+        if collect and values is not None:
+            for i, value in zip(positions, values, strict=True):
+                results[i] = value
+    return results if collect else None
+
+
+def _select(objs, selection):
+    """ Returns the objects at the positions where `selection` is True. """
+    mask = np.asarray(selection, dtype=bool)
+    if mask.shape != (len(objs),):
+        raise ValueError(f"Selection of shape {mask.shape} does not match "
+                         f"the number of objects ({len(objs)}).")
+    return [objs[i] for i in np.flatnonzero(mask).tolist()]
+
+
 def _random(model, gen, obj_list, n=1, replace=False):
     """ Creates a random sample of agents.
 
@@ -225,9 +744,13 @@ class AgentList(AgentSequence, list):
             >>> agents.y
             AttrList of 'y': [1, 2, 3]
 
-        Arithmetic operators can be used in a similar way.
-        If an :class:`AttrList` is passed, different values are used for
-        each agent. Otherwise, the same value is used for all agents::
+        Arithmetic operators can be used in a similar way,
+        and return a :class:`numpy.ndarray` with one value per agent.
+        If an :class:`AttrList`, the result of such an operator, or an array
+        with more than one dimension and one row per agent is passed,
+        different values are used for each agent. Otherwise, including for
+        one-dimensional arrays, the same value is used for all agents,
+        except for columnar attributes (see below)::
 
             >>> agents.x = agents.x + agents.y
             >>> agents.x
@@ -243,14 +766,41 @@ class AgentList(AgentSequence, list):
             >>> agents.x
             AttrList of 'x': [4, 6, 10]
 
-        Boolean operators can be used to select a subset of agents::
+        Boolean operators return a mask that can be used
+        to select a subset of agents::
 
-            >>> subset = agents(agents.x > 5)
+            >>> subset = agents.select(agents.x > 5)
             >>> subset
             AgentList [2 agents]
 
             >>> subset.x
-            AttrList of attribute 'x': [6, 8]
+            AttrList of attribute 'x': [6, 10]
+
+        Population statistics can be calculated with reductions::
+
+            >>> agents.x.sum()
+            20
+            >>> agents.x.count_if(lambda x: x > 5)
+            2
+
+        Agent types can declare numeric attributes as `columns`,
+        which are then stored in contiguous arrays of the model.
+        If all agents in the list share such a type,
+        the attribute is returned as a :class:`numpy.ndarray`.
+        This array is a view of the stored values if the agents occupy
+        consecutive slots, as is the case for agents created together.
+        Otherwise, it is a copy that writes assigned items back
+        to the agents, so that both cases can be used in the same way.
+        As columns hold one number per agent, a one-dimensional array with
+        one value per agent is assigned element-wise to a columnar
+        attribute, unlike to other attributes::
+
+            >>> class Walker(ap.Agent):
+            ...     columns = {'x': float, 'y': float}
+            >>> agents = ap.AgentList(model, 3, Walker)
+            >>> agents.x = agents.x + agents.y
+            >>> agents.x
+            array([0., 0., 0.])
     """
 
     def __init__(self, model, objs=(), cls=None, *args, **kwargs):
@@ -259,31 +809,199 @@ class AgentList(AgentSequence, list):
         super().__init__(objs)
         super().__setattr__('model', model)
         super().__setattr__('ndim', 1)
+        super().__setattr__('_cache', {})
+        super().__setattr__('_indexes', {})
+
+    def __getattr__(self, name):
+        if name[0] != '_':
+            column = self._column(name)
+            if column is not None:
+                store, index = column
+                if isinstance(index, slice):
+                    return store.data[name][index]
+                return ColumnSelection(store.data[name], index)
+        return super().__getattr__(name)
 
     def __setattr__(self, name, value):
-        if isinstance(value, AttrIter):
-            # Apply each value to each agent
-            for obj, v in zip(self, value, strict=True):
-                setattr(obj, name, v)
+        column = self._column(name)
+        if column is not None:
+            # Write all values at once into the columnar store
+            store, index = column
+            if isinstance(value, AttrExpr) and isinstance(index, slice):
+                value.evaluate(out=store.data[name][index])
+            else:
+                store.data[name][index] = np.asarray(value)
+            refresh_indexes(self, name, type(self[0]))
         else:
-            # Apply single value to all agents
-            for obj in self:
-                setattr(obj, name, value)
+            self._set_all(name, value)
 
     def __add__(self, other):
         agents = AgentList(self.model, self)
         agents.extend(other)
         return agents
 
+    @classmethod
+    def from_arrays(cls, model, agent_cls=None, **columns):
+        """ Creates a new list of agents from columns of attribute values.
+        Ids are reserved in one call, attributes declared in the `columns`
+        of the agent type are written into the columnar store at once,
+        and neither :func:`Agent.__init__` nor :func:`Agent.setup`
+        are called. This makes it much faster than
+        :class:`AgentList` for large populations.
+
+        Arguments:
+            model (Model): The model instance.
+            agent_cls (type, optional): Class of the new agents
+                (default :class:`Agent`).
+            **columns: Attribute values of the new agents.
+                Sequences assign one value to each agent and
+                must all have the same length, which defines the
+                number of agents. Single values are assigned to all agents.
+
+        Examples:
+
+            Create 1000 agents with random positions::
+
+                agents = ap.AgentList.from_arrays(
+                    model, MyAgent,
+                    x=model.nprandom.random(1000),
+                    y=model.nprandom.random(1000),
+                    state='susceptible')
+        """
+        objs = cls._obj_bulk(model, agent_cls, columns)
+        return cls(model, objs)
+
+    @classmethod
+    def from_frame(cls, model, df, agent_cls=None):
+        """ Creates a new list of agents with one agent per row
+        of a :class:`pandas.DataFrame` and one attribute per column.
+        See :func:`AgentList.from_arrays`.
+
+        Arguments:
+            model (Model): The model instance.
+            df (pandas.DataFrame): Attribute values of the new agents.
+            agent_cls (type, optional): Class of the new agents
+                (default :class:`Agent`).
+        """
+        columns = {str(k): df[k].to_numpy() for k in df.columns}
+        return cls.from_arrays(model, agent_cls, **columns)
+
+    def _column(self, name):
+        """ Returns the store and slot index of a columnar attribute,
+        or None if the attribute is not stored in columns. """
+        if 'slots' not in self._cache:
+            self._cache['slots'] = self._find_slots()
+        slots = self._cache['slots']
+        if slots is False or name not in slots[0].data:
+            return None
+        return slots
+
+    def _find_slots(self):
+        """ Looks up the slots of the agents in their shared store. """
+        if not self:
+            return False
+        store = getattr(self[0], '_store', None)
+        if store is None:
+            return False
+        slots = np.empty(len(self), dtype=int)
+        for i, obj in enumerate(self):
+            if getattr(obj, '_store', None) is not store:
+                return False
+            slots[i] = obj._slot
+        # Consecutive slots can be accessed through a view
+        if slots[-1] - slots[0] == len(slots) - 1 \
+                and np.all(np.diff(slots) == 1):
+            return store, slice(slots[0], slots[-1] + 1)
+        return store, slots
+
+    def _type_groups(self):
+        """ Returns the ids and list positions of each object type. """
+        if 'groups' not in self._cache:
+            positions = {}
+            for i, obj in enumerate(self):
+                positions.setdefault(obj.type, []).append(i)
+            ids = np.fromiter((obj.id for obj in self), dtype=int,
+                              count=len(self))
+            groups = {}
+            for obj_type, pos in positions.items():
+                if len(pos) == len(self):
+                    groups[obj_type] = (ids, None)
+                else:
+                    pos = np.array(pos)
+                    groups[obj_type] = (ids[pos], pos)
+            self._cache['groups'] = groups
+        return self._cache['groups']
+
+    def _group_slots(self):
+        """ Returns the columnar store and slots of the objects of each
+        type, or None for types whose objects do not share a store. """
+        if 'group_slots' not in self._cache:
+            group_slots = {}
+            for obj_type, (ids, pos) in self._type_groups().items():
+                if pos is None:  # Reuse the slots of the whole sequence
+                    if 'slots' not in self._cache:
+                        self._cache['slots'] = self._find_slots()
+                    group_slots[obj_type] = self._cache['slots'] or None
+                    continue
+                objs = [self[i] for i in pos]
+                store = getattr(objs[0], '_store', None)
+                if store is None or any(getattr(obj, '_store', None)
+                                        is not store for obj in objs):
+                    group_slots[obj_type] = None
+                else:
+                    slots = np.fromiter((obj._slot for obj in objs),
+                                        dtype=int, count=len(objs))
+                    group_slots[obj_type] = (store, slots)
+            self._cache['group_slots'] = group_slots
+        return self._cache['group_slots']
+
+    def record(self, var_keys, value=None):
+        """ Records a variable of all agents at the current time-step.
+        In contrast to :func:`Object.record`, the values are written
+        into the columnar buffers of the model in one call per object type,
+        and will not be available in the `log` of each agent.
+
+        Arguments:
+            var_keys (str or list of str):
+                Names of the variables to be recorded.
+            value (optional): Value to be recorded.
+                The same value will be used for all `var_keys`.
+                If none is given, the values of agent attributes
+                with the same name as each var_key will be used.
+        """
+        model = self.model
+        groups = self._type_groups()
+        for obj_type in groups:
+            model._logs.setdefault(obj_type, {})  # Keep order of types
+        for var_key in make_list(var_keys):
+            for obj_type, (ids, pos) in groups.items():
+                if value is not None:
+                    values = value
+                else:
+                    values = self._group_values(obj_type, pos, var_key)
+                model._recorder.record(
+                    obj_type, ids, model.t, var_key, values)
+
+    def _group_values(self, obj_type, pos, var_key):
+        """ Returns the attribute values of the objects of one type.
+        Columnar attributes are read from the store in one operation. """
+        column = self._group_slots()[obj_type]
+        if column is not None and var_key in column[0].data:
+            store, slots = column
+            return store.data[var_key][slots]
+        objs = self if pos is None else [self[i] for i in pos]
+        return to_array([getattr(obj, var_key) for obj in objs], len(objs))
+
     def select(self, selection):
         """ Returns a new :class:`AgentList` based on `selection`.
 
         Arguments:
-            selection (list of bool): List with same length as the agent list.
-                Positions that return True will be selected.
+            selection (array or list of bool):
+                Boolean mask with same length as the agent list,
+                e.g. as returned by `agents.x > 5`.
+                Positions that are True will be selected.
         """
-        selected_list = [a for a, s in zip(self, selection, strict=True) if s]
-        return AgentList(self.model, selected_list)
+        return AgentList(self.model, _select(self, selection))
 
     def random(self, n=1, replace=False):
         """ Creates a random sample of agents.
@@ -308,13 +1026,93 @@ class AgentList(AgentSequence, list):
             reverse (bool, optional): Reverse sorting (default False).
         """
         super().sort(key=lambda x: x[var_key], reverse=reverse)
+        self._cache.clear()
         return self
 
     def shuffle(self):
         """ Shuffles the list in-place, and returns self. """
-        self.model.random.shuffle(self) # type: ignore
+        objs = list(self)
+        self.model.random.shuffle(objs) # type: ignore
+        list.__setitem__(self, slice(None), objs)
+        self._cache.clear()
         return self
 
+    # List methods reset cached lookups and update indexes ---------------- #
+
+    def append(self, obj):
+        self._cache.clear()
+        super().append(obj)
+        if self._indexes:
+            self._index_add((obj,))
+
+    def extend(self, objs):
+        self._cache.clear()
+        if self._indexes:
+            objs = list(objs)
+        super().extend(objs)
+        if self._indexes:
+            self._index_add(objs)
+
+    def __iadd__(self, objs):
+        self.extend(objs)
+        return self
+
+    def insert(self, i, obj):
+        self._cache.clear()
+        super().insert(i, obj)
+        if self._indexes:
+            self._index_add((obj,))
+
+    def remove(self, obj):
+        self._cache.clear()
+        super().remove(obj)
+        if self._indexes and obj not in self:
+            self._index_discard((obj,))
+
+    def pop(self, i=-1):
+        self._cache.clear()
+        obj = super().pop(i)
+        if self._indexes and obj not in self:
+            self._index_discard((obj,))
+        return obj
+
+    def clear(self):
+        self._cache.clear()
+        super().clear()
+        for index in self._indexes.values():
+            index.clear()
+
+    def reverse(self):
+        self._cache.clear()
+        super().reverse()
+
+    def __setitem__(self, key, value):
+        self._cache.clear()
+        if self._indexes and isinstance(key, int):
+            old = self[key]
+            super().__setitem__(key, value)
+            if old not in self:
+                self._index_discard((old,))
+            self._index_add((value,))
+            return
+        super().__setitem__(key, value)
+        if self._indexes:
+            self._index_rebuild()
+
+    def __delitem__(self, key):
+        self._cache.clear()
+        super().__delitem__(key)
+        if self._indexes:
+            self._index_rebuild()
+
+    def __imul__(self, n):
+        self._cache.clear()
+        super().__imul__(n)
+        if self._indexes:
+            self._index_rebuild()
+        return self
+
+
 class AgentSet(AgentSequence, set):
     """ Unordered collection of agentpy objects.
 
@@ -339,6 +1137,269 @@ class AgentSet(AgentSequence, set):
         super().__init__(objs)
         super().__setattr__('model', model)
         super().__setattr__('ndim', 1)
+        super().__setattr__('_indexes', {})
+
+    # Set methods update indexes ------------------------------------------ #
+
+    def add(self, obj):
+        super().add(obj)
+        if self._indexes:
+            self._index_add((obj,))
+
+    def update(self, *others):
+        if self._indexes:
+            others = [list(objs) for objs in others]
+        super().update(*others)
+        for objs in others if self._indexes else ():
+            self._index_add(objs)
+
+    def __ior__(self, objs):
+        self.update(objs)
+        return self
+
+    def remove(self, obj):
+        super().remove(obj)
+        if self._indexes:
+            self._index_discard((obj,))
+
+    def discard(self, obj):
+        super().discard(obj)
+        if self._indexes:
+            self._index_discard((obj,))
+
+    def pop(self):
+        obj = super().pop()
+        if self._indexes:
+            self._index_discard((obj,))
+        return obj
+
+    def clear(self):
+        super().clear()
+        for index in self._indexes.values():
+            index.clear()
+
+    def difference_update(self, *others):
+        super().difference_update(*others)
+        if self._indexes:
+            self._index_rebuild()
+
+    def intersection_update(self, *others):
+        super().intersection_update(*others)
+        if self._indexes:
+            self._index_rebuild()
+
+    def symmetric_difference_update(self, other):
+        super().symmetric_difference_update(other)
+        if self._indexes:
+            self._index_rebuild()
+
+    def __isub__(self, other):
+        self.difference_update(other)
+        return self
+
+    def __iand__(self, other):
+        self.intersection_update(other)
+        return self
+
+    def __ixor__(self, other):
+        self.symmetric_difference_update(other)
+        return self
+
+
+class AgentDList(AgentSequence, Sequence):
+    """ Ordered collection of agentpy objects with fast removal.
+    This container behaves similar to :class:`AgentList` in most aspects,
+    but comes with additional features for object removal and iteration.
+    The key differences to :class:`AgentList` are the following:
+
+    - Objects are removed in constant time, by moving the last object
+      into the position of the removed one.
+      The order of objects is therefore not kept.
+    - Checking whether an object is part of the list takes constant time.
+    - No duplicates are allowed.
+    - Objects can be added and removed while the list is being iterated over,
+      e.g. from within the `step` of each agent.
+      Removed objects will not be visited, and added objects will
+      only be visited in the next iteration. Objects that are removed
+      during iteration are compacted once the iteration has finished.
+
+    Arguments:
+        model (Model): The model instance.
+        objs (int or Sequence, optional):
+            An integer number of new objects to be created,
+            or a sequence of existing objects (default empty).
+        cls (type, optional): Class for the creation of new objects.
+        **kwargs:
+            Keyword arguments are forwarded
+            to the constructor of the new objects.
+            See :class:`AgentList` for details.
+
+    Examples:
+
+        Remove agents while iterating over them::
+
+            >>> agents = ap.AgentDList(model, 5)
+            >>> for agent in agents:
+            ...     if agent.id % 2:
+            ...         agents.remove(agent)
+            >>> agents.id
+            [4, 2]
+    """
+
+    def __init__(self, model, objs=(), cls=None, *args, **kwargs):
+        if isinstance(objs, int):
+            objs = self._obj_gen(model, objs, cls, *args, **kwargs)
+        self._set('model', model)
+        self._set('ndim', 1)
+        self._set('items', [])
+        self._set('item_to_position', {})
+        self._set('_indexes', {})
+        self._set('_iterating', 0)  # Depth of active iterations
+        self._set('_removed', [])  # Positions to be compacted
+        for obj in objs:
+            self.append(obj)
+
+    def __setattr__(self, name, value):
+        self._set_all(name, value)
+
+    def __iter__(self):
+        return iter(AgentDListIter(self.model, self))
+
+    def __len__(self):
+        return len(self.item_to_position)
+
+    def __contains__(self, obj):
+        return obj in self.item_to_position
+
+    def __getitem__(self, key):
+        if self._removed:
+            return list(self)[key]
+        return self.items[key]
+
+    def __add__(self, other):
+        agents = AgentDList(self.model, self)
+        agents.extend(other)
+        return agents
+
+    def __iadd__(self, other):
+        self.extend(other)
+        return self
+
+    # Add and remove objects ---------------------------------------------- #
+
+    def append(self, obj):
+        """ Adds an object to the end of the list,
+        if it is not already part of it. """
+        if obj in self.item_to_position:
+            return
+        self.item_to_position[obj] = len(self.items)
+        self.items.append(obj)
+        if self._indexes:
+            self._index_add((obj,))
+
+    def extend(self, objs):
+        """ Adds multiple objects to the end of the list. """
+        for obj in objs:
+            self.append(obj)
+
+    def remove(self, obj):
+        """ Removes an object from the list in constant time.
+        During iteration, the position of the object is only marked
+        as removed, and filled once the iteration has finished. """
+        position = self.item_to_position.pop(obj)
+        if self._iterating:
+            self._removed.append(position)
+        else:
+            last = self.items.pop()
+            if position != len(self.items):
+                self.items[position] = last
+                self.item_to_position[last] = position
+        if self._indexes:
+            self._index_discard((obj,))
+
+    def discard(self, obj):
+        """ Removes an object from the list, if it is present. """
+        if obj in self.item_to_position:
+            self.remove(obj)
+
+    def pop(self, index=-1):
+        """ Removes and returns the object at a position. """
+        obj = self[index]
+        self.remove(obj)
+        return obj
+
+    def clear(self):
+        """ Removes all objects from the list. """
+        if self._iterating:
+            self._removed.extend(self.item_to_position.values())
+        else:
+            self.items.clear()
+        self.item_to_position.clear()
+        for index in self._indexes.values():
+            index.clear()
+
+    def compact(self):
+        """ Fills the positions of objects that have been removed
+        during iteration. This is done automatically at the end of
+        each iteration, and takes time proportional to the number
+        of removed objects. """
+        if self._iterating:
+            raise AgentpyError(
+                "AgentDList cannot be compacted during iteration.")
+        items, positions = self.items, self.item_to_position
+        # Fill gaps from the back, so that the last item is always kept
+        for position in sorted(self._removed, reverse=True):
+            last = items.pop()
+            if position != len(items):
+                items[position] = last
+                positions[last] = position
+        self._removed.clear()
+
+    # Methods ------------------------------------------------------------- #
+
+    def select(self, selection):
+        """ Returns a new :class:`AgentList` based on `selection`.
+
+        Arguments:
+            selection (array or list of bool):
+                Boolean mask with same length as the agent list,
+                e.g. as returned by `agents.x > 5`.
+                Positions that are True will be selected.
+        """
+        return AgentList(self.model, _select(list(self), selection))
+
+    def random(self, n=1, replace=False):
+        """ Creates a random sample of agents.
+        See :func:`AgentList.random`. """
+        objs = list(self) if self._removed else self.items
+        return _random(self.model, self.model.random, objs, n, replace)
+
+    def sort(self, var_key, reverse=False):
+        """ Sorts the list in-place, and returns self.
+        See :func:`AgentList.sort`. """
+        self._reorder(sorted(self, key=lambda x: x[var_key],
+                             reverse=reverse))
+        return self
+
+    def shuffle(self):
+        """ Shuffles the list in-place, and returns self. """
+        objs = list(self)
+        self.model.random.shuffle(objs)  # type: ignore
+        self._reorder(objs)
+        return self
+
+    def _reorder(self, objs):
+        if self._iterating:
+            raise AgentpyError(
+                "AgentDList cannot be reordered during iteration.")
+        self.items[:] = objs
+        self._removed.clear()
+        for position, obj in enumerate(objs):
+            self.item_to_position[obj] = position
+
+    def to_list(self):
+        """Returns an :class:`AgentList` of the objects. """
+        return AgentList(self.model, self)
 
 
 class AgentIter(AgentSequence):
@@ -359,15 +1420,47 @@ class AgentIter(AgentSequence):
         return len(self._source)
 
     def __setattr__(self, name, value):
-        if isinstance(value, AttrIter):
-            # Apply each value to each agent
-            for obj, v in zip(self, value, strict=True):
-                setattr(obj, name, v)
-        else:
-            # Apply single value to all agents
-            for obj in self:
-                setattr(obj, name, value)
+        self._set_all(name, value)
 
     def to_list(self):
         """Returns an :class:`AgentList` of the iterator. """
         return AgentList(self._model, self)
+
+
+class AgentDListIter(AgentIter):
+    """ Iterator over an :class:`AgentDList`.
+    Objects that are removed from the list during iteration are skipped,
+    and objects that are added during iteration are not visited.
+
+    Arguments:
+        model (Model): The model instance.
+        source (AgentDList): The list to iterate over.
+        shuffle (bool, optional):
+            Visit the objects in random order (default False).
+    """
+
+    def __init__(self, model, source, shuffle=False):
+        super().__init__(model, source)
+        object.__setattr__(self, '_shuffle', shuffle)
+
+    def __iter__(self):
+        source = self._source
+        items, positions = source.items, source.item_to_position
+        order = range(len(items))
+        if self._shuffle:
+            order = list(order)
+            self._model.random.shuffle(order)
+        source._set('_iterating', source._iterating + 1)
+        try:
+            for i in order:
+                obj = items[i]
+                # Skip objects that have been removed since
+                if positions.get(obj) == i:
+                    yield obj
+        finally:
+            source._set('_iterating', source._iterating - 1)
+            if not source._iterating and source._removed:
+                source.compact()
+
+    def __len__(self):
+        return len(self._source)
@@ -7,15 +7,240 @@ Content: Class for continuous spatial environments
 # TODO Custom iterator for neighbors() & select() for performance
 
 import itertools
+import math
+import operator
 import numpy as np
 import random as rd
+from numpy.lib.mixins import NDArrayOperatorsMixin
 import collections.abc as abc
 from scipy import spatial
-from .environment import SpatialEnvironment
-from .tools import make_list, make_matrix
+from .environment import SpatialEnvironment, _PositionsView
+from .tools import make_list, make_matrix, AgentpyError
 from .sequences import AgentList, AgentIter
 
 
+def _min_image(diff, shape):
+    """ Returns the absolute differences between positions,
+    taking the shorter way around each dimension of a torus. """
+    diff = np.abs(diff)
+    return np.minimum(diff, shape - diff)
+
+
+def _counting_sort(keys, n_keys):
+    """ Returns the indices that sort integer keys from 0 to `n_keys - 1`
+    in linear time. Keys are sorted by 16 bits at a time,
+    for which NumPy uses a stable radix sort. """
+    order = None
+    for shift in range(0, max(int(n_keys - 1).bit_length(), 1), 16):
+        digits = (keys if order is None else keys[order]) >> shift
+        digits = (digits & 0xFFFF).astype(np.uint16)
+        step = np.argsort(digits, kind='stable')
+        order = step if order is None else order[step]
+    return order
+
+
+class _Position(NDArrayOperatorsMixin):
+    """ Position of an agent in a :class:`Space`, as returned by
+    :obj:`Space.positions`. It behaves like an array of coordinates and
+    always reads the current row of the agent, which changes when agents
+    are added to or removed from the space. Assigning coordinates,
+    also through in-place operators, moves the agent. """
+
+    __slots__ = ('_space', '_agent')
+
+    def __init__(self, space, agent):
+        self._space = space
+        self._agent = agent
+
+    @property
+    def _row(self):
+        return self._space._pos[self._space._rows[self._agent]]
+
+    def __repr__(self):
+        return repr(self._row)
+
+    def __array__(self, dtype=None, copy=None):
+        row = self._row
+        if dtype is not None:
+            return row.astype(dtype)
+        return row.copy() if copy else row
+
+    def __getattr__(self, name):
+        if name[0] == '_':
+            raise AttributeError(name)
+        return getattr(self._row, name)
+
+    def __len__(self):
+        return len(self._row)
+
+    def __iter__(self):
+        return iter(self._row.copy())
+
+    def __getitem__(self, key):
+        return self._row[key]
+
+    def __setitem__(self, key, value):
+        pos = self._row.copy()
+        pos[key] = value
+        self._space.move_to(self._agent, pos)
+
+    def __array_ufunc__(self, ufunc, method, *inputs, out=None, **kwargs):
+        inputs = tuple(x._row if isinstance(x, _Position) else x
+                       for x in inputs)
+        if out is None:
+            return getattr(ufunc, method)(*inputs, **kwargs)
+        kwargs['out'] = tuple(x._row.copy() if isinstance(x, _Position)
+                              else x for x in out)
+        getattr(ufunc, method)(*inputs, **kwargs)
+        for x, result in zip(out, kwargs['out']):
+            if isinstance(x, _Position):
+                x._space.move_to(x._agent, result)
+        return out[0] if len(out) == 1 else out
+
+
+class _CellList:
+    """ Uniform grid of buckets that hold the rows of a :class:`Space`.
+    Each dimension is divided into cells that are at least `cell_size` wide,
+    so that agents within this distance are in the same or adjacent cells.
+    The cell of each row is updated whenever agents move,
+    and the rows of each cell are sorted into compressed sparse rows
+    at the first query after an agent has changed its cell,
+    with a radix sort that takes linear time.
+
+    Arguments:
+        space (Space): The space whose positions are indexed.
+        cell_size (float): Minimum width of a cell.
+    """
+
+    def __init__(self, space, cell_size):
+        if cell_size <= 0:
+            raise AgentpyError("Cell size must be positive.")
+        self.space = space
+        shape = np.array(space.shape, dtype=float)
+        self.n = np.maximum((shape // cell_size).astype(int), 1)
+        self.width = shape / self.n
+        self._strides = [int(np.prod(self.n[i+1:]))
+                         for i in range(len(self.n))]
+        self.cells = np.empty(len(space._pos), dtype=int)  # Cell of each row
+        self._buckets = None  # Sorted rows and start of each cell
+
+    def _cells_of(self, positions):
+        idx = (positions // self.width).astype(int)
+        np.clip(idx, 0, self.n - 1, out=idx)  # Positions on the upper border
+        return np.ravel_multi_index(tuple(idx.T), self.n)
+
+    def add(self, start, stop):
+        """ Adds the rows from `start` to `stop`. """
+        if stop > len(self.cells):
+            cells = np.empty(len(self.space._pos), dtype=int)
+            cells[:start] = self.cells[:start]
+            self.cells = cells
+        self.cells[start:stop] = self._cells_of(self.space._pos[start:stop])
+        self._buckets = None
+
+    def remove(self, row, last):
+        """ Removes a row and moves the row `last` into its place. """
+        self.cells[row] = self.cells[last]
+        self._buckets = None
+
+    def move(self, rows):
+        """ Updates the cells of rows whose position has changed. """
+        new = self._cells_of(self.space._pos[rows])
+        if self._buckets is not None and np.any(new != self.cells[rows]):
+            self._buckets = None
+        self.cells[rows] = new
+
+    def buckets(self):
+        """ Returns the rows sorted by cell, and the position of the
+        first row of each cell in this order, as an array and a list. """
+        if self._buckets is None:
+            cells = self.cells[:len(self.space._agents)]
+            n_cells = int(np.prod(self.n))
+            order = _counting_sort(cells, n_cells)
+            indptr = np.zeros(n_cells + 1, dtype=int)
+            np.cumsum(np.bincount(cells, minlength=len(indptr) - 1),
+                      out=indptr[1:])
+            self._buckets = order, indptr, indptr.tolist()
+        return self._buckets
+
+    def _ranges(self, center, radius):
+        """ Returns the cell indices of each dimension that overlap
+        with the box of width `2 * radius` around `center`. """
+        ranges = []
+        for x, width, n in zip(center, self.width.tolist(), self.n.tolist()):
+            lo = math.floor((x - radius) / width)
+            hi = math.floor((x + radius) / width)
+            if self.space._torus:
+                ranges.append(range(n) if hi - lo + 1 >= n
+                              else [i % n for i in range(lo, hi + 1)])
+            else:
+                ranges.append(range(max(lo, 0), min(hi, n - 1) + 1))
+        return ranges
+
+    def query(self, center, radius):
+        """ Returns the rows within `radius` of `center`,
+        in ascending order. """
+        center = np.asarray(center, dtype=float)
+        order, _, indptr = self.buckets()
+        strides = self._strides
+        chunks = []
+        for idx in itertools.product(*self._ranges(center.tolist(), radius)):
+            cell = sum(map(operator.mul, idx, strides))
+            start, stop = indptr[cell], indptr[cell + 1]
+            if start != stop:
+                chunks.append(order[start:stop])
+        if not chunks:
+            return np.zeros(0, dtype=int)
+        rows = np.sort(np.concatenate(chunks))
+        diff = self.space._pos[rows] - center
+        if self.space._torus:
+            diff = _min_image(diff, np.array(self.space.shape))
+        return rows[np.einsum('ij,ij->i', diff, diff) <= radius ** 2]
+
+    def pairs(self, radius):
+        """ Returns all pairs of rows within `radius` of each other
+        as an array with one row per pair, where the first row
+        is smaller than the second. """
+        space = self.space
+        n = len(space._agents)
+        order, indptr, _ = self.buckets()
+        idx = np.stack(np.unravel_index(self.cells[:n], self.n), axis=-1)
+
+        # Offsets of the cells that can contain neighbors
+        reach = np.ceil(radius / self.width).astype(int)
+        ranges = []
+        for k, n_cells in zip(reach.tolist(), self.n.tolist()):
+            if space._torus and 2 * k + 1 >= n_cells:
+                ranges.append(range(n_cells))
+            else:
+                ranges.append(range(-k, k + 1))
+
+        shape = np.array(space.shape)
+        found = []
+        for offset in itertools.product(*ranges):
+            around = idx + offset
+            if space._torus:
+                around %= self.n
+                valid = np.ones(n, dtype=bool)
+            else:
+                valid = np.all((around >= 0) & (around < self.n), axis=1)
+                around[~valid] = 0
+            around = np.ravel_multi_index(tuple(around.T), self.n)
+            counts = np.where(valid, indptr[around + 1] - indptr[around], 0)
+            owner = np.repeat(np.arange(n), counts)
+            offsets = np.arange(len(owner)) - np.repeat(
+                np.cumsum(counts) - counts, counts)
+            other = order[indptr[around][owner] + offsets]
+            keep = owner < other
+            owner, other = owner[keep], other[keep]
+            diff = space._pos[owner] - space._pos[other]
+            if space._torus:
+                diff = _min_image(diff, shape)
+            near = np.einsum('ij,ij->i', diff, diff) <= radius ** 2
+            found.append(np.stack([owner[near], other[near]], axis=1))
+        return np.concatenate(found)
+
+
 class Space(SpatialEnvironment):
     """ Environment that contains agents with a continuous spatial topology.
     To add new space environments to a model, use :func:`Model.add_space`.
@@ -35,13 +260,27 @@ class Space(SpatialEnvironment):
             If True, the space will be toroidal, meaning that agents who
             move over a border will re-appear on the opposite side.
             If False, they will remain at the edge of the border.
+        index (str, optional): Spatial index for neighbor lookup.
+            If 'kdtree', a :class:`scipy.spatial.cKDTree` is built
+            at the first query after agents have moved.
+            If 'cells', agents are sorted into a uniform grid of cells
+            that is updated whenever agents move. This avoids rebuilding
+            a tree in every step if all agents move between
+            short-ranged queries of single agents, while the tree tends
+            to be faster for :func:`Space.neighbors_all`.
+            If 'auto' (default), cells are used if `cell_size` is given.
+        cell_size (float, optional): Minimum width of the cells,
+            ideally the largest distance of neighbor queries.
         **kwargs: Will be forwarded to :func:`Space.setup`.
 
     Attributes:
         agents (AgentIter):
             Iterator over all agents in the space.
-        positions (dict of Agent):
-            Dictionary linking each agent instance to its position.
+        positions (Mapping of Agent):
+            Read-only mapping from each agent to its position.
+            Positions behave like arrays and stay up to date when agents
+            move, so they can be stored as an agent attribute.
+            Assigning their coordinates moves the agent.
         shape (tuple of float):
             Length of each spatial dimension.
         ndim (int):
@@ -50,44 +289,69 @@ class Space(SpatialEnvironment):
             KDTree of agent positions for neighbor lookup.
             Will be recalculated if agents have moved.
             If there are no agents, tree is None.
+            The i-th point of the tree belongs to the i-th agent
+            in :obj:`Space.agents`. The tree is built directly
+            from the array of positions, which it may share.
     """
 
-    def __init__(self, model, shape, torus=False, **kwargs):
+    def __init__(self, model, shape, torus=False, index='auto',
+                 cell_size=None, **kwargs):
 
         super().__init__(model)
 
         self._torus = torus
         self._cKDTree = None
-        self._sorted_agents = None
-        self._sorted_agent_points = None
+        self._verlet = None  # Cutoff, positions, and pairs of Verlet list
 
-        self.positions = {}
         self.shape = tuple(shape)
         self.ndim = len(self.shape)
+        self._agents = []  # Agent of each row
+        self._rows = {}  # Agent : Row
+        self._pos = np.empty((16, self.ndim))  # Position of each row
+
+        if index == 'auto':
+            index = 'kdtree' if cell_size is None else 'cells'
+        if index == 'cells':
+            if cell_size is None:
+                raise AgentpyError("Index 'cells' requires a cell_size.")
+            self._cells = _CellList(self, cell_size)
+        elif index == 'kdtree':
+            self._cells = None
+        else:
+            raise AgentpyError(f"Index '{index}' is not supported. "
+                               "Choose 'kdtree', 'cells', or 'auto'.")
 
         self._set_var_ignore()
         self.setup(**kwargs)
 
     @property
     def agents(self):
-        return AgentIter(self.model, self.positions.keys())
+        return AgentIter(self.model, self._agents)
+
+    @property
+    def positions(self):
+        return _PositionsView(self)
+
+    def _position(self, agent):
+        return _Position(self, agent)
 
     @property
     def kdtree(self):
         # Create new KDTree if necessary
-        if self._cKDTree is None and len(self.agents) > 0:
-            self._sorted_agents = []
-            self._sorted_agent_points = []
-            for a in self.agents:
-                self._sorted_agents.append(a)
-                self._sorted_agent_points.append(self.positions[a])
+        if self._cKDTree is None and self._agents:
+            points = self._pos[:len(self._agents)]
             if self._torus:
-                self._cKDTree = spatial.cKDTree(self._sorted_agent_points,
-                                                boxsize=self.shape)
+                self._cKDTree = spatial.cKDTree(points, boxsize=self.shape)
             else:
-                self._cKDTree = spatial.cKDTree(self._sorted_agent_points)
+                self._cKDTree = spatial.cKDTree(points)
         return self._cKDTree  # Return existing or new KDTree
 
+    def _rows_of(self, agents):
+        """ Returns an array with the row of each agent. """
+        rows = self._rows
+        return np.fromiter((rows[a] for a in agents), dtype=int,
+                           count=len(agents))
+
     # Add and remove agents ------------------------------------------------- #
 
     def add_agents(self, agents, positions=None, random=False):
@@ -107,47 +371,64 @@ class Space(SpatialEnvironment):
         """
 
         self._cKDTree = None  # Reset KDTree
-        if not positions:
-            n_agents = len(agents)
+        self._verlet = None  # Rows have changed
+        agents = list(agents)
+        n_agents = len(agents)
+        if positions is None or not len(positions):
             if random:
                 positions = [[self.model.random.random() * d_max
                               for d_max in self.shape]
                              for _ in range(n_agents)]
             else:
-                positions = [np.zeros(self.ndim) for _ in range(n_agents)]
-
-        for agent, pos in zip(agents, positions):
-
-            pos = pos if isinstance(pos, np.ndarray) else np.array(pos)
-            self.positions[agent] = pos  # Add pos to agent_dict
+                positions = np.zeros((n_agents, self.ndim))
+        positions = np.asarray(positions, dtype=float)
+        positions = positions.reshape(-1, self.ndim)[:n_agents]
+
+        # Grow array of positions if necessary
+        n = len(self._agents)
+        if n + n_agents > len(self._pos):
+            pos = np.empty((max(n + n_agents, 2 * len(self._pos)), self.ndim))
+            pos[:n] = self._pos[:n]
+            self._pos = pos
+
+        self._pos[n:n+n_agents] = positions
+        for row, agent in enumerate(agents, n):
+            self._agents.append(agent)
+            self._rows[agent] = row
+        if self._cells is not None:
+            self._cells.add(n, n + n_agents)
 
     def remove_agents(self, agents):
         """ Removes agents from the space. """
         self._cKDTree = None  # Reset KDTree
+        self._verlet = None  # Rows have changed
         for agent in make_list(agents):
-            del self.positions[agent]  # Remove agent from env
+            row = self._rows.pop(agent)
+            last = self._agents.pop()  # Move last row into the free row
+            if self._cells is not None:
+                self._cells.remove(row, len(self._agents))
+            if last is not agent:
+                self._agents[row] = last
+                self._rows[last] = row
+                self._pos[row] = self._pos[len(self._agents)]
 
     # Move and select agents ------------------------------------------------ #
 
     @staticmethod
-    def _border_behavior(position, shape, torus):
-        # Border behavior
+    def _border_behavior(positions, shape, torus):
+        """ Applies the border behavior to an array of positions in-place,
+        with coordinates along the last axis. """
 
         # Connected - Jump to other side
         if torus:
-            for i in range(len(position)):
-                while position[i] > shape[i]:
-                    position[i] -= shape[i]
-                while position[i] < 0:
-                    position[i] += shape[i]
+            np.remainder(positions, shape, out=positions)
+            positions[positions == shape] = 0  # Rounded small negatives
 
         # Not connected - Stop at border
         else:
-            for i in range(len(position)):
-                if position[i] > shape[i]:
-                    position[i] = shape[i]
-                elif position[i] < 0:
-                    position[i] = 0
+            np.clip(positions, 0, shape, out=positions)
+
+        return positions
 
     def move_to(self, agent, pos):
         """ Moves agent to new position.
@@ -158,8 +439,11 @@ class Space(SpatialEnvironment):
         """
 
         self._cKDTree = None  # Reset KDTree
-        self._border_behavior(pos, self.shape, self._torus)
-        self.positions[agent][...] = pos  # In-place
+        row = self._rows[agent]
+        self._pos[row] = pos  # In-place
+        self._border_behavior(self._pos[row], self.shape, self._torus)
+        if self._cells is not None:
+            self._cells.move([row])
 
     def move_by(self, agent, path):
         """ Moves agent to new position, relative to current position.
@@ -168,8 +452,55 @@ class Space(SpatialEnvironment):
             agent (Agent): Instance of the agent.
             path (array_like): Relative change of position.
         """
-        pos = [p + c for p, c in zip(self.positions[agent], path)]
-        self.move_to(agent, pos)
+        self.move_to(agent, self._pos[self._rows[agent]] + path)
+
+    def move_agents(self, agents, positions):
+        """ Moves multiple agents to new positions at once.
+        Border behavior is applied to all positions in one operation.
+
+        Arguments:
+            agents (Sequence of Agent): Agents to be moved.
+            positions (array of float):
+                New position of each agent, with one row per agent.
+        """
+        self._move_agents(agents, positions, relative=False)
+
+    def move_agents_by(self, agents, paths):
+        """ Moves multiple agents relative to their current positions.
+        See :func:`Space.move_agents`.
+
+        Arguments:
+            agents (Sequence of Agent): Agents to be moved.
+            paths (array of float): Relative change of position,
+                either one row per agent or a single row for all agents.
+
+        Examples:
+
+            Move all agents of a space according to their velocity::
+
+                space.move_agents_by(space.agents, velocities * dt)
+        """
+        self._move_agents(agents, paths, relative=True)
+
+    def _move_agents(self, agents, values, relative):
+        self._cKDTree = None  # Reset KDTree
+        agents = list(agents)
+        n = len(self._agents)
+        if len(agents) == n and all(map(operator.is_, agents, self._agents)):
+            rows = slice(0, n)  # Move all rows in-place
+        else:
+            rows = self._rows_of(agents)
+        if relative:
+            self._pos[rows] += values
+        else:
+            self._pos[rows] = values
+        if isinstance(rows, slice):
+            self._border_behavior(self._pos[rows], self.shape, self._torus)
+        else:
+            self._pos[rows] = self._border_behavior(
+                self._pos[rows], self.shape, self._torus)
+        if self._cells is not None:
+            self._cells.move(rows)
 
     def neighbors(self, agent, distance):
         """ Select agent neighbors within a given distance.
@@ -184,13 +515,109 @@ class Space(SpatialEnvironment):
             AgentIter: Iterator over the selected neighbors.
         """
 
-        list_ids = self.kdtree.query_ball_point(
-            self.positions[agent], distance)
+        list_ids = self._query(self._pos[self._rows[agent]], distance)
 
-        agents = [self._sorted_agents[list_id] for list_id in list_ids]
-        agents.remove(agent)  # Remove original agent
+        agents = [self._agents[list_id] for list_id in list_ids]
+        agents = [a for a in agents if a is not agent]  # Remove original
         return AgentIter(self.model, agents)
 
+    def _query(self, center, radius):
+        """ Returns the rows of the agents within `radius` of `center`. """
+        if self._cells is not None:
+            return self._cells.query(center, radius).tolist()
+        return self.kdtree.query_ball_point(center, radius)
+
+    def _distances(self, rows, others):
+        """ Returns the distances between the positions of two arrays
+        of rows, taking into account wether space is toroidal. """
+        diff = self._pos[rows] - self._pos[others]
+        if self._torus:
+            diff = _min_image(diff, np.array(self.shape))
+        return np.sqrt(np.einsum('ij,ij->i', diff, diff))
+
+    def _pairs(self, distance):
+        """ Returns all pairs of rows within `distance` of each other. """
+        if self._cells is not None:
+            return self._cells.pairs(distance)
+        return self.kdtree.query_pairs(distance, output_type='ndarray')
+
+    def _verlet_pairs(self, distance, skin):
+        """ Returns all pairs of rows within `distance` of each other,
+        selected from a list of pairs within `distance + skin` that is
+        only rebuilt once agents might have moved into its range. """
+        n = len(self._agents)
+        if self._verlet is not None:
+            cutoff, pos, pairs = self._verlet
+            diff = self._pos[:n] - pos
+            if self._torus:
+                diff = _min_image(diff, np.array(self.shape))
+            moved = np.sqrt(np.einsum('ij,ij->i', diff, diff).max())
+            if cutoff - distance < 2 * moved:
+                self._verlet = None
+        if self._verlet is None:
+            pairs = self._pairs(distance + skin)
+            self._verlet = (distance + skin, self._pos[:n].copy(), pairs)
+        pairs = self._verlet[2]
+        near = self._distances(pairs[:, 0], pairs[:, 1]) <= distance
+        return pairs[near]
+
+    def neighbors_all(self, distance, return_distance=False, skin=None):
+        """ Selects the neighbors of all agents within a given distance,
+        through a single query of the spatial index.
+
+        Arguments:
+            distance (float):
+                Radius around each agent in which to search for neighbors.
+            return_distance (bool, optional):
+                Whether to also return the distance to each neighbor
+                (default False).
+            skin (float, optional): If given, a Verlet list of all pairs
+                within `distance + skin` is kept between calls, and only
+                its pairs are checked for the current distance. The list is
+                rebuilt once an agent has moved more than `skin / 2`
+                since it was built, or if agents have been added or removed.
+                This is faster for short-ranged interactions where agents
+                move only a little in each step.
+
+        Returns:
+            tuple: An :class:`AgentList` of all agents in the space,
+            and two integer arrays `indptr` and `indices` in compressed
+            sparse row format: the neighbors of the i-th agent are the
+            agents at the positions `indices[indptr[i]:indptr[i+1]]`,
+            in ascending order. If `return_distance` is True,
+            a float array of the corresponding distances is added.
+
+        Examples:
+
+            Calculate the mean heading of each agent's neighbors::
+
+                agents, indptr, indices = space.neighbors_all(5)
+                owners = np.repeat(np.arange(len(agents)), np.diff(indptr))
+                counts = np.maximum(np.diff(indptr), 1)
+                mean = np.bincount(owners, weights=headings[indices],
+                                   minlength=len(agents)) / counts
+        """
+        n = len(self._agents)
+        agents = AgentList(self.model, self._agents)
+        if n == 0:
+            indptr, indices = np.zeros(1, dtype=int), np.zeros(0, dtype=int)
+            return (agents, indptr, indices, np.zeros(0)) \
+                if return_distance else (agents, indptr, indices)
+
+        if skin is not None:
+            pairs = self._verlet_pairs(distance, skin)
+        else:
+            pairs = self._pairs(distance)
+        rows = np.concatenate([pairs[:, 0], pairs[:, 1]])
+        indices = np.concatenate([pairs[:, 1], pairs[:, 0]])
+        order = np.lexsort((indices, rows))
+        rows, indices = rows[order], indices[order]
+        indptr = np.zeros(n + 1, dtype=int)
+        np.cumsum(np.bincount(rows, minlength=n), out=indptr[1:])
+        if return_distance:
+            return agents, indptr, indices, self._distances(rows, indices)
+        return agents, indptr, indices
+
     def select(self, center, radius):
         """ Select agents within a given area.
 
@@ -201,9 +628,159 @@ class Space(SpatialEnvironment):
         Returns:
             AgentIter: Iterator over the selected agents.
         """
-        if self.kdtree:
-            list_ids = self.kdtree.query_ball_point(center, radius)
-            agents = [self._sorted_agents[list_id] for list_id in list_ids]
+        if self._agents:
+            list_ids = self._query(center, radius)
+            agents = [self._agents[list_id] for list_id in list_ids]
             return AgentIter(self.model, agents)
         else:
             return AgentIter(self.model)
+
+    def nearest(self, target, k=1):
+        """ Select the agents that are closest to an agent or point.
+        Takes into account wether space is toroidal.
+
+        Arguments:
+            target (Agent or array_like):
+                Instance of an agent, which is itself excluded,
+                or coordinates of a point.
+            k (int, optional): Number of agents to select (default 1).
+
+        Returns:
+            AgentIter: Iterator over the selected agents,
+            ordered by their distance to the target.
+        """
+        if isinstance(target, abc.Hashable) and target in self._rows:
+            point, exclude = self._pos[self._rows[target]], 1
+        else:
+            point, exclude = np.asarray(target, dtype=float), 0
+        n = len(self._agents)
+        if min(n - exclude, k) <= 0:
+            return AgentIter(self.model)
+        _, rows = self.kdtree.query(point, k=min(n, k + exclude))
+        agents = [self._agents[row] for row in np.atleast_1d(rows).tolist()]
+        if exclude:
+            agents = [a for a in agents if a is not target][:k]
+        return AgentIter(self.model, agents)
+
+    def nearest_all(self, k=1, points=None, return_distance=False):
+        """ Select the closest agents of all agents or of many points,
+        through a single query of the KDTree.
+
+        Arguments:
+            k (int, optional): Number of agents to select (default 1).
+            points (array_like, optional): Coordinates of the points
+                to search from, with one row per point. If none are given,
+                the closest other agents of each agent are selected.
+            return_distance (bool, optional):
+                Whether to also return the distance to each selected agent
+                (default False).
+
+        Returns:
+            tuple: An :class:`AgentList` of all agents in the space,
+            and an integer array with one row per agent or point, whose
+            j-th column holds the position of the j-th closest agent in
+            this list, or -1 if there are fewer than `k` agents.
+            If `return_distance` is True, a float array of
+            the corresponding distances is added, with `numpy.inf`
+            for missing agents.
+
+        Examples:
+
+            Find the closest food source of each ant::
+
+                points = [space.positions[ant] for ant in ants]
+                foods, nearest = food_space.nearest_all(points=points)
+                closest = [foods[i] for i in nearest[:, 0]]
+        """
+        agents = AgentList(self.model, self._agents)
+        n = len(self._agents)
+        own = points is None
+        points = self._pos[:n] if own \
+            else np.asarray(points, dtype=float).reshape(-1, self.ndim)
+        m = len(points)
+        if n == 0 or k <= 0:
+            rows = np.full((m, max(k, 0)), -1, dtype=int)
+            dist = np.full(rows.shape, np.inf)
+        else:
+            dist, rows = self.kdtree.query(
+                points, k=[*range(1, k + 1 + own)])
+            if own:  # Drop each agent itself, or else the farthest agent
+                is_self = rows == np.arange(n)[:, None]
+                is_self[~is_self.any(axis=1), -1] = True
+                keep = np.argsort(is_self, axis=1, kind='stable')[:, :k]
+                rows = np.take_along_axis(rows, keep, axis=1)
+                dist = np.take_along_axis(dist, keep, axis=1)
+            rows[rows == n] = -1  # Missing agents
+        if return_distance:
+            return agents, rows, dist
+        return agents, rows
+
+    def _box_query(self, lower, upper):
+        """ Returns the centers and half-widths of boxes. On a torus,
+        a box with a lower bound above its upper bound
+        wraps around the border. """
+        lower = np.asarray(lower, dtype=float).reshape(-1, self.ndim)
+        upper = np.asarray(upper, dtype=float).reshape(-1, self.ndim)
+        if self._torus:
+            shape = np.array(self.shape)
+            half = ((upper - lower) % shape) / 2
+            half = np.where(upper - lower >= shape, shape / 2, half)  # All
+            center = (lower + half) % shape
+        else:
+            half = (upper - lower) / 2
+            center = lower + half
+        return center, half
+
+    def _in_box(self, rows, center, half):
+        diff = np.abs(self._pos[rows] - center)
+        if self._torus:
+            diff = np.minimum(diff, np.array(self.shape) - diff)
+        return np.all(diff <= half, axis=-1)
+
+    def select_box(self, lower, upper):
+        """ Select agents within a box, including its border.
+
+        Arguments:
+            lower (array_like): Lower bound of the box in each dimension.
+            upper (array_like): Upper bound of the box in each dimension.
+                On a torus, an upper bound below the lower bound
+                creates a box that wraps around the border.
+
+        Returns:
+            AgentIter: Iterator over the selected agents.
+        """
+        _, indptr, indices = self.select_boxes([lower], [upper])
+        return AgentIter(self.model, [self._agents[i] for i in indices])
+
+    def select_boxes(self, lower, upper):
+        """ Select the agents within many boxes at once,
+        through a single query of the KDTree. See :func:`Space.select_box`.
+
+        Arguments:
+            lower (array_like): Lower bounds, with one row per box.
+            upper (array_like): Upper bounds, with one row per box.
+
+        Returns:
+            tuple: An :class:`AgentList` of all agents in the space,
+            and two integer arrays `indptr` and `indices` in compressed
+            sparse row format: the agents in the i-th box are the
+            agents at the positions `indices[indptr[i]:indptr[i+1]]`,
+            in ascending order.
+        """
+        agents = AgentList(self.model, self._agents)
+        center, half = self._box_query(lower, upper)
+        if not self._agents or not len(center):
+            return agents, np.zeros(len(center) + 1, dtype=int), \
+                np.zeros(0, dtype=int)
+        candidates = self.kdtree.query_ball_point(
+            center, half.max(axis=1), p=np.inf, return_sorted=True)
+        counts = np.fromiter(map(len, candidates), dtype=int,
+                             count=len(candidates))
+        rows = np.fromiter(itertools.chain.from_iterable(candidates),
+                           dtype=int, count=counts.sum())
+        boxes = np.repeat(np.arange(len(center)), counts)
+        inside = self._in_box(rows, center[boxes], half[boxes])
+        indptr = np.zeros(len(center) + 1, dtype=int)
+        np.cumsum(np.bincount(boxes[inside], minlength=len(center)),
+                  out=indptr[1:])
+        return agents, indptr, rows[inside]
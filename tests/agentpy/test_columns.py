@@ -0,0 +1,137 @@
+import numpy as np
+import pytest
+
+import agentrs.agentpy as ap
+
+
+class Walker(ap.Agent):
+    columns = {'x': float, 'y': float}
+
+    def setup(self):
+        self.x = self.id
+        self.y = 1
+
+
+class Runner(Walker):
+    columns = {'speed': int}
+
+
+def test_column_attributes():
+    model = ap.Model()
+    agent = Walker(model)
+    assert agent.x == 1
+    agent.x = 2.5
+    assert agent.x == 2.5
+    assert type(agent.x) is float and repr(agent.x) == '2.5'
+    assert agent['y'] == 1
+    assert agent.vars[:2] == ['x', 'y']
+    assert 'x' not in agent.__dict__
+
+    runner = Runner(model)
+    runner.speed = 3
+    assert runner.speed == 3
+    assert runner.x == 2
+    assert model._columns[Runner].dtypes['speed'] == np.dtype(int)
+
+
+def test_inherited_columns():
+    class Plain(Walker):
+        columns = {}
+
+    class CompactWalker(ap.CompactAgent):
+        columns = {'x': float}
+
+    class CompactPlain(CompactWalker):
+        columns = {}
+
+    model = ap.Model()
+    agent = Plain(model)
+    assert agent.x == agent.id
+    agent.x = 5
+    assert model._columns[Plain].data['x'][agent._slot] == 5
+    compact = CompactPlain(model)
+    compact.x = 2
+    assert compact.x == 2 and agent.vars[:2] == ['x', 'y']
+
+
+def test_column_views():
+    model = ap.Model()
+    agents = ap.AgentList(model, 3, Walker)
+    store = model._columns[Walker]
+
+    assert isinstance(agents.x, np.ndarray)
+    assert np.shares_memory(agents.x, store.data['x'])
+    assert agents.x.tolist() == [1, 2, 3]
+
+    agents.x = agents.x + agents.y
+    assert agents.x.tolist() == [2, 3, 4]
+    assert agents[0].x == 2
+
+    agents.x *= 2
+    assert [a.x for a in agents] == [4, 6, 8]
+
+    agents.y = ap.AttrIter([1, 2, 3])
+    assert agents.y.tolist() == [1, 2, 3]
+
+
+def test_column_copies():
+    model = ap.Model()
+    agents = ap.AgentList(model, 4, Walker)
+    agents.reverse()
+    assert agents.x.tolist() == [4, 3, 2, 1]
+    assert not np.shares_memory(agents.x, model._columns[Walker].data['x'])
+    agents.x = np.array([0, 1, 2, 3])
+    assert [a.x for a in agents] == [0, 1, 2, 3]
+
+    # One-dimensional arrays are only split for columnar attributes
+    agents.w = np.array([0, 1, 2, 3])
+    assert agents[1].w.tolist() == [0, 1, 2, 3]
+    with pytest.raises(ValueError):
+        agents.x = np.array([0, 1])
+
+    # Assigned items are written back to the agents
+    agents.x[2] = 10
+    assert agents[2].x == 10
+    x = agents.x
+    x[x > 5] = 7
+    x += 1
+    assert [a.x for a in agents] == [1, 2, 8, 4]
+    assert repr(agents.x * 2) == 'array([ 2.,  4., 16.,  8.])'
+    assert type(agents.x.sum()) is np.float64
+
+    # Mixed types fall back to attribute iteration
+    agents.append(ap.Agent(model))
+    assert isinstance(agents.id, ap.AttrIter)
+
+
+def test_column_growth():
+    model = ap.Model()
+    agents = ap.AgentList(model, 100, Walker)
+    agents += ap.AgentList(model, 100, Walker)
+    assert len(model._columns[Walker]) == 200
+    assert agents.x.tolist() == list(range(1, 201))
+
+
+class Particle(ap.CompactAgent):
+    fields = {'alive': True}
+    columns = {'x': float}
+
+
+@pytest.mark.parametrize('cls', [Walker, Particle])
+def test_column_slot_reuse(cls):
+    model = ap.Model()
+    agents = ap.AgentList(model, 50, cls)
+    store = model._columns[cls]
+    for step in range(100):
+        del agents[:10]
+        agents += ap.AgentList(model, 5, cls)
+        agents += ap.AgentList.from_arrays(model, cls, x=np.full(5, step))
+    assert len(store) == 50
+    assert store.size <= 60
+    assert len(store.data['x']) <= 128
+
+    # Released slots are reused without mixing up agents
+    assert len({a._slot for a in agents}) == 50
+    assert store.agents[agents[-1]._slot] is agents[-1]
+    assert agents.x.tolist()[-5:] == [99] * 5
+    assert agents[-6].x == (agents[-6].id if cls is Walker else 0)
@@ -1,6 +1,10 @@
 import multiprocessing as mp
 
+import pandas as pd
+import pytest
+
 import agentrs.agentpy as ap
+from agentrs.agentpy.tools import AgentpyError
 
 
 class MyModel(ap.Model):
@@ -76,3 +80,24 @@ def test_random():
     l2 = list(results.reporters['x'])
 
     assert l1 == l2
+
+
+def test_stream(tmp_path):
+    pytest.importorskip('pyarrow')
+    sample = [{'steps': 1, 'report_seed': False}] * 2
+    exp = ap.Experiment(MyModel, sample, iterations=2, record=True)
+    results = exp.run(display=False, stream=tmp_path)
+    expected = ap.Experiment(MyModel, sample, iterations=2, record=True).run()
+
+    assert isinstance(results.variables.MyModel, ap.PartitionedFrame)
+    assert len(results.variables.MyModel.paths) == 4
+    assert (tmp_path / 'run_1_1').exists()
+    assert results.variables.MyModel.load().equals(
+        expected.variables.MyModel)
+
+    # Later runs without a stream keep their output in memory
+    results = exp.run(display=False)
+    assert isinstance(results.variables.MyModel, pd.DataFrame)
+    assert len(list(tmp_path.iterdir())) == 4
+    with pytest.raises(AgentpyError):
+        exp.run(display=False, stream=tmp_path)
@@ -263,3 +263,491 @@ def test_record_positions():
     results = model.run(0, display=False)
 
     assert np.all(results.variables.Agent.values == [[0, 0], [0, 1], [1, 0]])
+
+
+def test_array_grid():
+    model = ap.Model()
+    agents = ap.AgentList(model, 5)
+    grid = ap.ArrayGrid(model, (2, 2), track_empty=True)
+    grid.add_agents(agents[:3])
+    assert grid.apply(len).tolist() == [[1, 1], [1, 0]]
+    assert grid.positions[agents[2]] == (1, 0)
+    assert list(grid.empty) == [(1, 1)]
+    assert grid.attr_grid('id').tolist()[0] == [1, 2]
+    assert len(grid.agents) == 3
+    assert len(grid.agents[0:1, :]) == 2
+
+    grid.move_to(agents[0], (1, 1))
+    assert list(grid.empty) == [(0, 0)]
+    assert grid._head is None  # Links are only built when needed
+    assert set(grid.neighbors(agents[1])) == {agents[0], agents[2]}
+    grid.move_by(agents[0], (-1, -1))
+    assert set(grid.neighbors(agents[0])) == {agents[1], agents[2]}
+    grid.add_agents(agents[3:], [(0, 1), (0, 1)])
+    assert grid.apply(len).tolist() == [[1, 3], [1, 0]]
+
+    grid.remove_agents([agents[0], agents[3]])
+    assert list(grid.empty) == [(1, 1), (0, 0)]
+    assert dict(grid.positions) == {
+        agents[4]: (0, 1), agents[1]: (0, 1), agents[2]: (1, 0)}
+    assert set(grid.neighbors(agents[2])) == {agents[1], agents[4]}
+    grid.move_to(agents[4], (1, 1))
+    assert list(grid.neighbors(agents[1]).id) in ([5, 3], [3, 5])
+
+    grid.add_field('f', 5)
+    assert grid.f.tolist() == [[5, 5], [5, 5]]
+    assert grid.grid.f is grid.f
+    grid.del_field('f')
+    with pytest.raises(AttributeError):
+        grid.grid.f
+
+
+def test_array_grid_torus():
+    model = ap.Model()
+    agents = ap.AgentList(model, 5)
+    grid = ap.ArrayGrid(model, (4, 4), torus=True)
+    grid.add_agents(agents, [[0, 0], [1, 3], [2, 0], [3, 2], [3, 3]])
+    assert sorted(grid.neighbors(agents[0]).id) == [2, 5]
+    assert len(grid.neighbors(agents[0], distance=3)) == 4
+    grid.move_by(agents[0], [-1, -1])
+    assert grid.positions[agents[0]] == (3, 3)
+    assert grid.attr_grid('id')[3, 3] in (1, 5)
+
+
+@pytest.mark.parametrize('grid_cls', [ap.Grid, ap.ArrayGrid])
+@pytest.mark.parametrize('torus', [False, True])
+def test_neighbors_all(grid_cls, torus):
+    model = ap.Model()
+    model.sim_setup(seed=3)
+    agents = ap.AgentList(model, 30)
+    grid = grid_cls(model, (5, 4), torus=torus)
+    grid.add_agents(agents, random=True)
+    for distance, neighborhood in [(1, 'moore'), (1, 'von_neumann'),
+                                   (2, 'moore'), (3, 'von_neumann'),
+                                   (1, [[0, 1], [1, 0]])]:
+        all_agents, indptr, indices = grid.neighbors_all(
+            distance, neighborhood)
+        assert len(indptr) == len(all_agents) + 1
+        for i, agent in enumerate(all_agents):
+            expected = grid.neighbors(agent, distance, neighborhood)
+            found = [all_agents[j] for j in indices[indptr[i]:indptr[i+1]]]
+            assert sorted(a.id for a in found) == sorted(expected.id)
+
+
+def test_neighborhoods():
+    model, grid, agents = make_grid(5, 25)
+    a = agents[12]
+    assert len(grid.neighbors(a, neighborhood='von_neumann')) == 4
+    assert len(grid.neighbors(a, 2, neighborhood='von_neumann')) == 12
+    assert list(grid.neighbors(a, neighborhood=[[0, 1], [-1, 0]]).id) == [14, 8]
+    neighbors = grid.neighbors(a)
+    assert list(neighbors) == list(neighbors)  # Can be reused
+    with pytest.raises(AgentpyError):
+        grid.neighbors(a, neighborhood='hex')
+
+
+@pytest.mark.parametrize('grid_cls', [ap.Grid, ap.ArrayGrid])
+def test_move_agents(grid_cls):
+    model = ap.Model()
+    agents = ap.AgentList(model, 4)
+    grid = grid_cls(model, (3, 3), track_empty=True)
+    grid.add_agents(agents, [(0, 0), (0, 1), (1, 1), (2, 2)])
+    grid.neighbors(agents[0])  # Build cell lookups before moving
+
+    moved = grid.move_agents(agents, [(0, 0), (-1, 2), (1, 5), (2, 1)])
+    assert moved.tolist() == [False, True, True, True]
+    assert [grid.positions[a] for a in agents] == \
+        [(0, 0), (0, 2), (1, 2), (2, 1)]
+    assert sorted(grid.empty) == [(0, 1), (1, 0), (1, 1), (2, 0), (2, 2)]
+    assert set(grid.neighbors(agents[1])) == {agents[2]}
+    assert all(isinstance(x, int) for pos in grid.empty for x in pos)
+
+    grid.move_agents_by(agents, (1, 0))
+    assert [grid.positions[a] for a in agents] == \
+        [(1, 0), (1, 2), (2, 2), (2, 1)]
+    assert grid.apply(len).tolist() == [[0, 0, 0], [1, 0, 1], [0, 1, 1]]
+    assert sorted(grid.empty) == [(0, 0), (0, 1), (0, 2), (1, 1), (2, 0)]
+
+
+@pytest.mark.parametrize('grid_cls', [ap.Grid, ap.ArrayGrid])
+def test_move_agents_torus_and_capacity(grid_cls):
+    model = ap.Model()
+    agents = ap.AgentList(model, 3)
+    grid = grid_cls(model, (4,), torus=True)
+    grid.add_agents(agents, [(0,), (1,), (2,)])
+    grid.move_agents_by(agents, [[-1], [4], [6]])
+    assert [grid.positions[a] for a in agents] == [(3,), (1,), (0,)]
+
+    # Agent 2 stays and blocks agent 3, which then blocks agent 1
+    moved = grid.move_agents_by(agents, [[1], [0], [1]], capacity=1)
+    assert moved.tolist() == [False, False, False]
+    moved = grid.move_agents(agents, [(1,), (0,), (3,)], capacity=1)
+    assert moved.tolist() == [True, True, True]
+    moved = grid.move_agents(agents, [(2,), (2,), (2,)], capacity=2)
+    assert moved.tolist() == [True, True, False]
+    assert grid.apply(len).tolist() == [0, 0, 2, 1]
+
+    with pytest.raises(AgentpyError):
+        grid.move_agents(agents, [(3,), (3,), (3,)], capacity=1,
+                         on_collision='error')
+    assert grid.apply(len).tolist() == [0, 0, 2, 1]
+
+
+@pytest.mark.parametrize('grid_cls', [ap.Grid, ap.ArrayGrid])
+def test_attr_grid_reduce(grid_cls):
+    model = ap.Model()
+    agents = ap.AgentList(model, 4)
+    agents.x = ap.AttrIter([1, 2, 3, 4])
+    grid = grid_cls(model, (2, 2))
+    grid.add_agents(agents, [(0, 0), (0, 0), (0, 1), (1, 1)])
+
+    assert grid.attr_grid('x', reduce='count').tolist() == [[2, 1], [0, 1]]
+    assert grid.attr_grid('x', reduce='sum').tolist() == [[3, 3], [0, 4]]
+    assert grid.attr_grid('x', reduce='max').tolist()[0] == [2, 3]
+    assert grid.attr_grid('x', reduce='min').tolist()[0] == [1, 3]
+    mean = grid.attr_grid('x', reduce='mean')
+    assert mean.tolist()[0] == [1.5, 3]
+    assert np.isnan(mean[1, 0]) and mean[1, 1] == 4
+    assert np.isnan(grid.attr_grid('x', reduce='max')[1, 0])
+    assert grid.attr_grid('x').tolist()[1][1] == 4
+    with pytest.raises(AgentpyError):
+        grid.attr_grid('x', reduce='median')
+
+    # Empty positions are filled with zero for integer types
+    ints = grid.attr_grid('x', otypes='int')
+    assert ints.dtype == int and ints.tolist()[1] == [0, 4]
+    assert grid.attr_grid('x', otypes='int', reduce='max').tolist() == \
+        [[2, 3], [0, 4]]
+    assert grid.attr_grid('x', otypes='int', reduce='mean').tolist() == \
+        [[1, 3], [0, 4]]
+    assert grid.attr_grid('x', otypes='int', fill=-1).tolist()[1] == [-1, 4]
+    assert grid.attr_grid('x', reduce='min', fill=0).tolist()[1] == [0, 4]
+
+
+def test_field_storage(tmp_path):
+    model = ap.Model()
+    grid = ap.Grid(model, (2, 3))
+    grid.add_field('f', np.arange(6), dtype=float)
+    assert grid.f.shape == (2, 3)
+    assert grid.f.dtype == float
+    assert grid.grid['f'] is grid.f
+    assert isinstance(grid.grid.agents[0, 0], ap.AgentSet)
+
+    # Fields can be stored on disk
+    filename = str(tmp_path / 'f.npy')
+    grid.add_field('m', 1, dtype='int8', filename=filename)
+    assert isinstance(grid.m, np.memmap)
+    grid.m[1, 2] = 5
+    grid.m.flush()
+    grid.del_field('m')
+    grid.add_field('m', filename=filename)
+    assert grid.m.tolist() == [[1, 1, 1], [1, 1, 5]]
+
+    other = ap.ArrayGrid(model, (3, 3))
+    with pytest.raises(AgentpyError):
+        other.add_field('m', filename=filename)
+
+
+@pytest.mark.parametrize('torus', [False, True])
+def test_diffuse_and_decay(torus):
+    model = ap.Model()
+    grid = ap.Grid(model, (4, 5), torus=torus)
+    grid.add_field('p', 0, dtype=float)
+    grid.p[0, 0] = 8
+    grid.diffuse('p', 0.5)
+    assert np.isclose(grid.p.sum(), 8)
+    assert grid.p[0, 1] == 0.5
+    assert grid.p[1, 1] == 0.5
+    assert bool(grid.p[-1, -1] == 0.5) is torus
+    assert grid.p[0, 0] == (4 if torus else 8 - 0.5 * 3)
+    grid.diffuse('p', 0.5, neighborhood='von_neumann')
+    assert np.isclose(grid.p.sum(), 8)
+    grid.decay('p', 0.25)
+    assert np.isclose(grid.p.sum(), 6)
+
+
+def test_convolve_and_gradient():
+    model = ap.Model()
+    grid = ap.Grid(model, (3, 3))
+    grid.add_field('f', np.arange(9), dtype=float)
+    kernel = np.zeros((3, 3))
+    kernel[1, 1] = 2
+    assert grid.convolve('f', kernel).tolist() == (grid.f * 2).tolist()
+    grid.convolve('f', kernel, out='f')
+    assert grid.f[2, 2] == 16
+    dy, dx = grid.gradient('f')
+    assert dy.tolist() == [[6] * 3] * 3
+    assert dx.tolist() == [[2] * 3] * 3
+
+    torus = ap.Grid(model, (3,), torus=True)
+    torus.add_field('f', [0, 1, 2], dtype=float)
+    assert torus.gradient('f')[0].tolist() == [-0.5, 1, -0.5]
+
+
+def test_argmax_neighbor():
+    model = ap.Model()
+    agents = ap.AgentList(model, 2)
+    grid = ap.Grid(model, (3, 3))
+    grid.add_agents(agents, [(0, 0), (2, 2)])
+    grid.add_field('f', 0, dtype=float)
+    grid.f[1, 1] = 1
+    grid.f[2, 2] = 2
+    assert grid.argmax_neighbor('f', agents).tolist() == [[1, 1], [2, 2]]
+    grid.move_agents(agents, grid.argmax_neighbor('f', agents))
+    assert grid.positions[agents[0]] == (1, 1)
+
+
+@pytest.mark.parametrize('grid_cls', [ap.Grid, ap.ArrayGrid])
+def test_cellular_automaton(grid_cls):
+    model = ap.Model()
+    grid = grid_cls(model, (5, 5), torus=True)
+    grid.add_field('alive', 0, dtype='int8')
+    grid.alive[2, 1:4] = 1  # Blinker
+    grid.add_rule('alive', lambda alive, n:
+                  (n == 3) | (alive == 1) & (n == 2), state=1)
+    grid.apply_rules()
+    assert grid.alive[1:4, 2].tolist() == [1, 1, 1]
+    assert grid.alive.sum() == 3
+    grid.apply_rules(steps=2)
+    assert grid.alive[1:4, 2].tolist() == [1, 1, 1]
+    assert grid.state_counts('alive').tolist() == [22, 3]
+
+    # Rules of different fields are applied synchronously
+    grid.add_field('copy', 0, dtype='int8')
+    grid.add_rule('copy', lambda copy, n: grid.alive)
+    grid.add_rule('alive', lambda alive, n: np.zeros_like(alive))
+    grid.remove_rule('alive')
+    grid.add_rule('alive', lambda alive, n: np.zeros_like(alive))
+    grid.apply_rules()
+    assert grid.alive.sum() == 0
+    assert grid.copy.sum() == 3
+
+    grid.record_states('copy', n_states=3, label='c')
+    assert grid.log['c0'] == [22] and grid.log['c2'] == [0]
+    with pytest.raises(AgentpyError):
+        grid.add_rule('missing', lambda v, n: v)
+    with pytest.raises(AgentpyError):
+        grid.add_rule('copy', lambda v, n: v, neighborhood=np.ones(3, int))
+    grid.add_field('f', 0.5)
+    with pytest.raises(AgentpyError):
+        grid.state_counts('f')
+
+
+def test_bounded_automaton():
+    model = ap.Model()
+    grid = ap.Grid(model, (3, 3))
+    grid.add_field('s', 1, dtype=int)
+    grid.add_rule('s', lambda s, n: n, neighborhood='von_neumann')
+    grid.apply_rules()
+    assert grid.s.tolist() == [[2, 3, 2], [3, 4, 3], [2, 3, 2]]
+
+
+def test_sparse_grid():
+    model = ap.Model()
+    model.sim_setup(seed=1)
+    agents = ap.AgentList(model, 100)
+    grid = ap.SparseGrid(model, (10_000, 10_000))
+    grid.add_agents(agents, random=True, empty=True)
+    assert grid._all is None
+    assert len(set(grid.positions.values())) == 100
+    assert len(grid.empty) == 10 ** 8 - 100
+    pos = grid.positions[agents[0]]
+    assert pos not in grid.empty
+    assert (10 ** 4, 0) not in grid.empty
+
+    # Neighbors are found by scanning occupied or neighboring cells
+    grid.move_to(agents[1], (pos[0], pos[1] + 1))
+    assert agents[1] in list(grid.neighbors(agents[0], distance=5))
+    assert agents[1] in list(grid.neighbors(agents[0]))
+    grid.remove_agents(agents[1])
+    assert len(grid.empty) == 10 ** 8 - 99
+    assert agents[1] not in list(grid.neighbors(agents[0], distance=5))
+
+
+@pytest.mark.parametrize('torus', [False, True])
+def test_sparse_grid_neighbors(torus):
+    model = ap.Model()
+    agents = ap.AgentList(model, 6)
+    positions = [(0, 0), (0, 4), (1, 1), (2, 2), (4, 4), (0, 2)]
+    grid = ap.SparseGrid(model, (5, 5), torus=torus)
+    grid.add_agents(agents, positions)
+    dense = ap.Grid(model, (5, 5), torus=torus)
+    dense.add_agents(agents, positions)
+    for agent in agents:
+        for distance in (1, 2):
+            for neighborhood in ('moore', 'von_neumann'):
+                expected = dense.neighbors(agent, distance, neighborhood)
+                found = grid.neighbors(agent, distance, neighborhood)
+                assert set(found) == set(expected)
+
+
+def test_sparse_grid_neighbors_by_cell(monkeypatch):
+    model = ap.Model()
+    agents = ap.AgentList(model, 1000)
+    grid = ap.SparseGrid(model, (10_000, 10_000))
+    grid.add_agents(agents, [(5, 5)] * 500 + [(5, 9)] * 499 + [(9000, 0)])
+    visited = []
+    cell_rows = grid._cell_rows
+    monkeypatch.setattr(grid, '_cell_rows',
+                        lambda cell: visited.append(cell) or cell_rows(cell))
+
+    # Few occupied cells: only those within range are looked up
+    assert len(list(grid.neighbors(agents[0], distance=5))) == 998
+    assert sorted(visited) == [50005, 50009]
+    visited.clear()
+
+    # Small neighborhoods: only occupied neighboring cells are looked up
+    grid.add_agents(ap.AgentList(model, 20), [(100, i) for i in range(20)])
+    assert len(list(grid.neighbors(agents[0]))) == 499
+    assert visited == [50005]
+
+
+def test_sparse_grid_empty():
+    model = ap.Model()
+    model.sim_setup(seed=2)
+    grid = ap.SparseGrid(model, (3, 3))
+    grid.add_agents(ap.AgentList(model, 2), [(0, 0), (0, 2)])
+    assert list(grid.empty)[:3] == [(0, 1), (1, 0), (1, 1)]
+    grid.add_agents(ap.AgentList(model, 2), empty=True)
+    assert grid.positions[grid._agents[2]] == (0, 1)
+    assert len(grid.empty) == 5
+
+    # Dense grids fall back to choosing from all empty cells
+    agents = ap.AgentList(model, 5)
+    grid.add_agents(agents, random=True, empty=True)
+    assert len(grid.empty) == 0
+    assert len(set(grid.positions.values())) == 9
+    with pytest.raises(AgentpyError):
+        grid.add_agents(ap.AgentList(model, 1), empty=True)
+    grid.add_agents(ap.AgentList(model, 1), random=True)
+    assert len(grid.positions) == 10
+
+
+@pytest.mark.parametrize('grid_cls', [ap.Grid, ap.ArrayGrid])
+def test_empty_tracking(grid_cls):
+    model = ap.Model()
+    model.sim_setup(seed=3)
+    agents = ap.AgentList(model, 3)
+    grid = grid_cls(model, (3, 3), track_empty=True)
+    grid.add_agents(agents, [(0, 0), (0, 0), (2, 2)])
+    assert grid.occupancy.tolist() == [[2, 0, 0], [0, 0, 0], [0, 0, 1]]
+    assert grid.empty.mask.sum() == 7
+    assert not grid.empty.mask[0, 0]
+    assert grid.empty[0] == (2, 1) and grid.empty[-1] == (2, 0)
+    assert (3, 0) not in grid.empty
+
+    # A cell stays occupied while it holds an agent
+    grid.remove_agents(agents[0])
+    assert (0, 0) not in grid.empty
+    grid.move_agents(agents[1:], [(1, 1), (0, 0)])
+    assert grid.occupancy.tolist() == [[1, 0, 0], [0, 1, 0], [0, 0, 0]]
+    assert sorted(grid.empty) == sorted(
+        set(grid.all) - {(0, 0), (1, 1)})
+    with pytest.raises(ValueError):
+        grid.occupancy[0, 0] = 5
+
+    # Random empty cells are drawn without repetition
+    new = ap.AgentList(model, 7)
+    grid.add_agents(new, random=True, empty=True)
+    assert len(grid.empty) == 0
+    assert grid.occupancy.max() == 1
+
+
+@pytest.mark.parametrize('grid_cls', [ap.Grid, ap.ArrayGrid])
+def test_empty_tracking_move_onto_own_cell(grid_cls):
+    model = ap.Model()
+    agent = ap.Agent(model)
+
+    # Clipped move back onto the agent's own cell
+    grid = grid_cls(model, (3, 3), track_empty=True)
+    grid.add_agents([agent], [(0, 0)])
+    grid.move_to(agent, (-1, 0))
+    assert grid.positions[agent] == (0, 0)
+    assert len(grid.empty) == 8
+    assert (0, 0) not in grid.empty
+
+    # Wrapped move back onto the agent's own cell
+    grid = grid_cls(model, (3, 3), track_empty=True, torus=True)
+    grid.add_agents([agent], [(1, 1)])
+    grid.move_by(agent, (3, -3))
+    assert grid.positions[agent] == (1, 1)
+    assert len(grid.empty) == 8
+
+    # Random moves keep the empty cells consistent with the occupancy
+    model = ap.Model()
+    model.sim_setup(seed=2)
+    agents = ap.AgentList(model, 5)
+    grid = grid_cls(model, (2, 7), track_empty=True, torus=True)
+    grid.add_agents(agents, random=True)
+    for _ in range(200):
+        agent = model.random.choice(agents)
+        path = (model.random.randint(-3, 3), model.random.randint(-8, 8))
+        grid.move_by(agent, path)
+        assert sorted(grid.empty) == sorted(
+            p for p in grid.all if not grid.occupancy[p])
+
+
+def test_empty_cells_sequence():
+    model = ap.Model()
+    grid = ap.Grid(model, (2, 2), track_empty=True)
+    empty = grid.empty
+    empty.remove((0, 0))
+    assert list(empty) == [(1, 1), (0, 1), (1, 0)]
+    empty.replace((0, 1), (0, 0))
+    assert empty[:2] == [(1, 1), (0, 0)]
+    empty.append((0, 1))
+    empty.append((0, 1))
+    assert len(empty) == 4
+    with pytest.raises(KeyError):
+        empty.remove((5, 5))
+    with pytest.raises(IndexError):
+        empty[4]
+    assert grid.occupancy.sum() == 0
+
+
+def test_distance_field():
+    model = ap.Model()
+    grid = ap.Grid(model, (3, 4))
+    grid.add_field('wall', False)
+    grid.wall[0:2, 1] = True
+    field = grid.distance_field([(0, 0)], obstacles='wall',
+                                neighborhood='von_neumann')
+    assert field.distance.tolist() == [[0, -1, 6, 7],
+                                       [1, -1, 5, 6],
+                                       [2, 3, 4, 5]]
+    assert field.step((0, 3)) == (0, 2)
+    assert field.step((0, 2)) == (1, 2)
+    assert field.step((2, 1)) == (2, 0)
+    assert field.step((0, 0)) == (0, 0)
+    assert grid.distance_field([(0, 0)], 'wall', 'von_neumann') is field
+
+    # Fields are calculated again if obstacles change
+    grid.wall[1, 1] = False
+    field = grid.distance_field([(0, 0)], 'wall', 'von_neumann')
+    assert field.distance[0, 2] == 4
+    moore = grid.distance_field([(0, 0)], 'wall')
+    assert moore.distance.tolist() == [[0, -1, 2, 3],
+                                       [1, 1, 2, 3],
+                                       [2, 2, 2, 3]]
+
+
+@pytest.mark.parametrize('grid_cls', [ap.Grid, ap.ArrayGrid])
+def test_distance_field_navigation(grid_cls):
+    model = ap.Model()
+    agents = ap.AgentList(model, 2)
+    grid = grid_cls(model, (1, 6), torus=True)
+    grid.add_agents(agents, [(0, 1), (0, 4)])
+    grid.add_field('exit', [0, 0, 0, 0, 0, 1], dtype=int)
+    field = grid.distance_field('exit')
+    assert field.distance.tolist() == [[1, 2, 3, 2, 1, 0]]
+    assert field.steps(agents).tolist() == [[0, 0], [0, 5]]
+    for _ in range(3):
+        grid.move_agents(agents, field.steps(agents))
+    assert set(grid.positions.values()) == {(0, 5)}
+
+    unreachable = grid.distance_field(grid.exit == 1,
+                                      obstacles=[(0, 0), (0, 4)])
+    assert unreachable.distance.tolist() == [[-1, -1, -1, -1, -1, 0]]
+    assert unreachable.step((0, 2)) == (0, 2)
+    with pytest.raises(AgentpyError):
+        grid.distance_field(np.ones((2, 2), dtype=bool))
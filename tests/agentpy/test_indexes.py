@@ -0,0 +1,135 @@
+import pytest
+
+import agentrs.agentpy as ap
+from agentrs.agentpy.tools import AgentpyError
+
+
+class Person(ap.Agent):
+    def setup(self):
+        self.state = 'S'
+        self.age = self.id * 10
+
+
+class Walker(ap.Agent):
+    columns = {'x': float}
+
+
+class Cell(ap.CompactAgent):
+    fields = {'state': 0}
+
+
+def test_hash_index():
+    model = ap.Model()
+    agents = ap.AgentList(model, 5, Person)
+    agents.add_index('state')
+    assert list(agents.where(state='S')) == list(agents)
+
+    agents[1].state = 'I'
+    agents[3]['state'] = 'I'
+    assert list(agents.where(state='I')) == [agents[1], agents[3]]
+    assert len(agents.where(state='S')) == 3
+    assert len(agents.where(state='R')) == 0
+
+    new = Person(model)
+    new.state = 'I'
+    agents.append(new)
+    assert list(agents.where(state='I').id) == [2, 4, 6]
+    agents.remove(agents[1])
+    agents.pop()
+    assert list(agents.where(state='I').id) == [4]
+    del agents[0]
+    assert list(agents.where(state='S').id) == [3, 5]
+
+    # Agents outside of the sequence are not indexed
+    outside = Person(model)
+    outside.state = 'I'
+    assert list(agents.where(state='I').id) == [4]
+
+    with pytest.raises(AgentpyError):
+        agents.where(age=10)
+    with pytest.raises(AgentpyError):
+        agents.add_index('state', kind='tree')
+
+
+def test_sorted_index():
+    model = ap.Model()
+    agents = ap.AgentList(model, 5, Person)
+    agents.add_index('age', kind='sorted')
+    agents.add_index('state')
+    assert list(agents.where(age=(20, 40)).id) == [2, 3, 4]
+    assert list(agents.where(age=(None, 20)).id) == [1, 2]
+    assert list(agents.where(age=(35, None)).id) == [4, 5]
+    assert list(agents.where(age=30).id) == [3]
+
+    agents[0].age = 100
+    agents[4].state = 'I'
+    assert list(agents.where(age=(35, None)).id) == [4, 5, 1]
+    assert list(agents.where(age=(35, None), state='I').id) == [5]
+
+    agents.shuffle()
+    agents.clear()
+    assert len(agents.where(age=(None, None))) == 0
+
+
+def test_index_agentset():
+    model = ap.Model()
+    agents = ap.AgentSet(model, 3, Person)
+    agents.add_index('state')
+    for agent in list(agents)[:2]:
+        agent.state = 'I'
+    assert len(agents.where(state='I')) == 2
+    agents.pop()
+    agents -= ap.AgentList(model, list(agents)[:1])
+    agents.add(Person(model))
+    assert len(agents) == 2
+    assert len(agents.where(state='I')) + len(agents.where(state='S')) == 2
+
+
+def test_index_columns_and_slots():
+    model = ap.Model()
+    walkers = ap.AgentList.from_arrays(model, Walker, x=[3., 1., 2.])
+    walkers.add_index('x', kind='sorted')
+    walkers.x = walkers.x * 2
+    assert list(walkers.where(x=(None, 4)).id) == [2, 3]
+    walkers[0].x = 0.5
+    assert list(walkers.where(x=(None, 4)).id) == [1, 2, 3]
+    assert walkers[0].x == model._columns[Walker].data['x'][0]
+
+    cells = ap.AgentList(model, 3, Cell)
+    cells.add_index('state')
+    cells[2].state = 1
+    assert list(cells.where(state=1).id) == [cells[2].id]
+    assert len(cells.where(state=0)) == 2
+
+
+def test_index_class_attributes():
+    model = ap.Model()
+    agents = ap.AgentList(model, 2, Person)
+    agents.add_index('state')
+    assert 'state' in Person.__dict__
+    agents.add_index('state', kind='sorted')
+    agents.remove_index('state')
+    assert 'state' not in Person.__dict__
+    assert agents[0].state == 'S'
+
+    # Indexes that are dropped with their sequence are released as well
+    other = ap.AgentList(model, 2, Person)
+    other.add_index('age', kind='sorted')
+    assert 'age' in Person.__dict__
+    del other
+    assert 'age' not in Person.__dict__
+
+    # Slots and columns are restored, too
+    cells = ap.AgentList(model, 2, Cell)
+    slot = Cell.__dict__['state']
+    cells.add_index('state')
+    cells.remove_index('state')
+    assert Cell.__dict__['state'] is slot
+
+    # Classes of agentpy itself are not modified
+    plain = ap.AgentList(model, 2)
+    with pytest.raises(AgentpyError):
+        plain.add_index('state')
+    assert 'state' not in ap.Agent.__dict__
+    with pytest.raises(KeyError):
+        plain.remove_index('state')
@@ -1,8 +1,10 @@
 import random
 
 import numpy as np
+import pytest
 
 import agentrs.agentpy as ap
+from agentrs.agentpy.tools import AgentpyError
 
 
 def test_run():
@@ -176,3 +178,38 @@ def test_report_seed():
     model = ap.Model({'report_seed': 0})
     results = model.run(steps=0, display=False)
     assert not ('reporters' in results and 'seed' in results.reporters)
+
+
+def test_stream_output(tmp_path):
+    pytest.importorskip('pyarrow')
+
+    class MyModel(ap.Model):
+        def setup(self):
+            self.agents = ap.AgentList(self, 2)
+            self.agents.x = 0
+
+        def step(self):
+            self.agents.x = self.t
+
+        def update(self):
+            self.agents.record('x')
+            self.agents[0].record('y', self.t)
+            self.record('t2', self.t * 2)
+
+    expected = MyModel({'steps': 5}).run(display=False)
+    model = MyModel({'steps': 5})
+    results = model.run(display=False, stream=tmp_path, flush_every=2)
+
+    assert isinstance(results.variables.Agent, ap.PartitionedFrame)
+    assert len(results.variables.Agent.paths) == 3
+    assert (tmp_path / 'Agent' / 'part-00000.parquet').exists()
+    assert results.variables.Agent.load().equals(expected.variables.Agent)
+    assert results.variables.MyModel.load().equals(
+        expected.variables.MyModel)
+    assert model.agents[0].log['t'] == []
+    assert results.arrange_variables().equals(expected.arrange_variables())
+
+    # Directories with partitions of earlier runs are not reused
+    with pytest.raises(AgentpyError):
+        MyModel({'steps': 1}).run(display=False, stream=tmp_path)
+    assert len(list((tmp_path / 'Agent').iterdir())) == 3
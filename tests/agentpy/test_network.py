@@ -21,7 +21,7 @@ def test_add_agents():
 
     # Test structure
     assert list(agents.pos) == list(agents.node)
-    assert env.nodes == env.graph.nodes()
+    assert list(env.nodes) == list(env.graph.nodes())
     assert list(env.graph.edges) == [tuple(agents.pos)]
     assert list(env.neighbors(agents[0]).id) == [3]
 
@@ -44,3 +44,69 @@ def test_record_all():
     assert len(list(model.log.keys())) == 3
     assert model.log['var1'] == [1]
     assert model.log['var2'] == [2]
+
+
+class Person(ap.CompactAgent):
+    fields = {'age': 0, 'state': 'S'}
+
+    def setup(self, age=0):
+        self.age = age
+
+    def infect(self):
+        self.state = 'I'
+        self.record('state')
+
+
+class Walker(Person):
+    fields = {'speed': 1.0}
+    columns = {'x': float}
+
+
+def test_compact_agent():
+    model = ap.Model()
+    person = Person(model, age=3)
+    assert not hasattr(person, '__dict__')
+    assert person.age == 3
+    assert person.state == 'S'
+    assert person.type == 'Person'
+    assert person.p is model.p
+    assert person.vars == ['age', 'state']
+    assert person.__repr__() == "Person (Obj 1)"
+    person['age'] = 4
+    assert person['age'] == 4
+    with pytest.raises(AttributeError):
+        person.other = 1
+
+    walker = Walker(model)
+    walker.x = 2
+    assert not hasattr(walker, '__dict__')
+    assert walker.x == 2
+    assert walker.speed == 1.0
+    assert walker.vars == ['x', 'age', 'state', 'speed']
+
+
+def test_compact_agent_record():
+    class MyModel(ap.Model):
+        def setup(self):
+            self.agents = ap.AgentList(self, 2, Person)
+
+        def step(self):
+            self.agents[0].infect()
+            self.agents.record('age')
+
+    results = MyModel({'steps': 2}).run(display=False)
+    assert results.variables.Person['state'].dropna().tolist() == ['I', 'I']
+    assert len(results.variables.Person) == 4
+
+    agents = ap.AgentList.from_arrays(model := ap.Model(), Person, age=[1, 2])
+    assert list(agents.age) == [1, 2]
+    assert list(agents.state) == ['S', 'S']
+    assert agents[0].model is model
+
+
+def test_record_after_reset():
+    model = ap.Model()
+    model.record('x', 1)
+    model.sim_reset()
+    model.record('x', 2)
+    assert model.log == {'t': [0], 'x': [2]}
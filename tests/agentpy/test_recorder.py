@@ -0,0 +1,100 @@
+import numpy as np
+
+import agentrs.agentpy as ap
+from agentrs.agentpy.columns import Column
+from agentrs.agentpy.recorder import RecordTable
+
+
+class Walker(ap.Agent):
+    columns = {'x': float}
+
+    def setup(self):
+        self.x = self.id
+
+
+def test_record_table():
+    table = RecordTable(rows=1, times=1)
+    table.record(np.array([1, 2]), 0, 'x', [1, 2])
+    table.record(np.array([1, 2]), 1, 'x', 3)
+    table.record(np.array([3]), 1, 'x', [4.5])
+    table.record(np.array([1]), 1, 'y', ['a'])
+
+    df = table.to_frame()
+    assert df['obj_id'].tolist() == [1, 1, 2, 2, 3]
+    assert df['t'].tolist() == [0, 1, 0, 1, 1]
+    assert df['x'].tolist() == [1, 3, 2, 3, 4.5]
+    assert df['y'].isna().tolist() == [True, False, True, True, True]
+    assert df['y'][1] == 'a'
+
+    table.clear()
+    assert table.to_frame() is None
+    assert len(table) == 3
+
+
+def test_agentlist_record():
+
+    class MyAgent(ap.Agent):
+        def setup(self):
+            self.x = 0
+
+    class MyModel(ap.Model):
+        def setup(self):
+            self.agents = ap.AgentList(self, 2, MyAgent)
+            self.others = ap.AgentList(self, 1, Walker)
+            self.all = self.agents + self.others
+
+        def step(self):
+            self.agents.x = self.agents.x + ap.AttrIter([1, 2])
+
+        def update(self):
+            self.all.record('x')
+            self.agents.record('y', 'y')
+
+    results = MyModel({'steps': 2}).run(display=False)
+    df = results.variables.MyAgent
+    assert df.index.names == ['obj_id', 't']
+    assert df['x'].tolist() == [0, 1, 2, 0, 2, 4]
+    assert df['y'].tolist() == ['y'] * 6
+    assert results.variables.Walker['x'].tolist() == [3., 3., 3.]
+
+
+def test_mixed_record():
+    """ Per-agent and list records are combined in the output. """
+    model = ap.Model()
+    agents = ap.AgentList(model, 2, Walker)
+    agents.record('x')
+    agents[0].record('z', 1)
+    assert agents[0].log == {'t': [0], 'z': [1]}
+    model.run(0, display=False)
+    df = model.output.variables.Walker
+    assert df['x'].tolist() == [1, 2]
+    assert df['z'].tolist()[0] == 1
+    assert np.isnan(df['z'].tolist()[1])
+
+
+def test_record_columns_by_type(monkeypatch):
+    """ Columns are read from the store of each type without getattr. """
+
+    class Runner(ap.Agent):
+        columns = {'x': float}
+
+    model = ap.Model()
+    agents = ap.AgentList(model, 2, Walker) + ap.AgentList(model, 2, Runner)
+    agents += ap.AgentList.from_arrays(model, Walker, x=[7., 8.])
+    agents.reverse()
+    agents[1].x = 9
+    agents[2].x = 4
+    monkeypatch.setattr(Column, '__get__', None)
+    agents.record('x')
+    monkeypatch.undo()
+
+    # New ids get rows in the order in which they are first recorded
+    table = RecordTable(rows=1, times=1)
+    table.record(np.array([5, 3]), 0, 'x', [1, 2])
+    table.record(np.array([4, 3, 9, 5]), 1, 'x', [3, 4, 5, 6])
+    assert table.obj_ids[:len(table)].tolist() == [5, 3, 4, 9]
+
+    model.run(0, display=False)
+    variables = model.output.variables
+    assert variables.Walker['x'].tolist() == [8, 9, 2, 1]
+    assert variables.Runner['x'].tolist() == [4, 0]
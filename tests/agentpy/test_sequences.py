@@ -95,10 +95,10 @@ def test_attr_list():
 
     model = ap.Model()
     l3 = ap.AgentList(model, 2)
-    assert l3.id == [1, 2]
+    assert list(l3.id) == [1, 2]
     assert l3.id.__repr__() == "[1, 2]"
-    assert l3.p.update({1: 1}) == [None, None]
-    assert l3.p == [{1: 1}, {1: 1}]
+    assert list(l3.p.update({1: 1})) == [None, None]
+    assert list(l3.p) == [{1: 1}, {1: 1}]
 
     # Attribute list with attribute key
     # sets/gets attr like a normal list
@@ -117,12 +117,12 @@ def test_select():
     selection4 = model.agents.id > 2
     selection5 = model.agents.id <= 2
     selection6 = model.agents.id >= 2
-    assert selection1 == [False, True, False]
-    assert selection2 == [True, False, True]
-    assert selection3 == [True, False, False]
-    assert selection4 == [False, False, True]
-    assert selection5 == [True, True, False]
-    assert selection6 == [False, True, True]
+    assert selection1.tolist() == [False, True, False]
+    assert selection2.tolist() == [True, False, True]
+    assert selection3.tolist() == [True, False, False]
+    assert selection4.tolist() == [False, False, True]
+    assert selection5.tolist() == [True, True, False]
+    assert selection6.tolist() == [False, True, True]
     assert list(model.agents.select(selection1).id) == [2]
 
 
@@ -193,6 +193,133 @@ def test_arithmetics():
     assert list(agents.x)[0] == pytest.approx(0.5)
 
 
+def test_attr_arrays():
+    """ Attributes are gathered into arrays for operators and reductions. """
+    model = ap.Model()
+    agents = ap.AgentList(model, 4)
+    agents.x = ap.AttrIter([1, 2, 3, 4])
+    agents.state = ap.AttrIter(['S', 'I', 'I', 'R'])
+
+    x = agents.x
+    assert (x * 2).tolist() == [2, 4, 6, 8]
+    assert (10 - x).tolist() == [9, 8, 7, 6]
+    assert x.sum() == 10
+    assert x.mean() == 2.5
+    assert x.count_if(lambda v: v > 2) == 2
+    counts, edges = x.histogram(bins=2)
+    assert counts.tolist() == [2, 2]
+    assert edges.tolist() == [1, 2.5, 4]
+
+    # Values are gathered again after an agent has changed
+    agents[0].x = 100
+    assert x.sum() == 109
+    assert x.to_array().tolist() == [100, 2, 3, 4]
+    agents[0].x = 1
+
+    mask = agents.state == 'I'
+    assert mask.dtype == bool
+    assert agents.state.count_if('I') == 2
+    assert list(agents.select(mask).id) == [2, 3]
+    assert list(agents.select(mask & (agents.x > 2)).id) == [3]
+    with pytest.raises(ValueError):
+        agents.select([True])
+
+    # Expressions and arrays with one row per agent are assigned row-wise
+    agents.y = agents.x - 1
+    assert list(agents.y) == [0, 1, 2, 3]
+    assert type(agents[0].y) is int
+    agents.z = np.arange(8).reshape(4, 2)
+    assert agents[3].z.tolist() == [6, 7]
+
+    # One-dimensional arrays are assigned to each agent as a whole
+    agents.pos = np.array([5, 6, 7, 8])
+    assert agents[0].pos.tolist() == [5, 6, 7, 8]
+    agents.z = np.arange(3)
+    assert agents[0].z.tolist() == [0, 1, 2]
+
+
+def test_attr_expressions():
+    """ Operators are combined into a single deferred expression. """
+    model = ap.Model()
+    agents = ap.AgentList(model, 3)
+    agents.x = ap.AttrIter([1., 2., 3.])
+    agents.y = ap.AttrIter([2., 4., 6.])
+
+    expr = agents.x * 0.5 + agents.y / 2
+    assert isinstance(expr, ap.AttrExpr)
+    assert expr._array is None
+    agents.x = expr
+    assert list(agents.x) == [1.5, 3, 4.5]
+    assert expr._array is not None
+
+    # Intermediate results are not kept
+    expr = (agents.x + 1) * 2 - agents.y
+    assert expr.tolist() == [3, 4, 5]
+    assert expr.operands[0]._array is None
+    assert len(expr) == 3 and expr[1] == 4
+    assert list(np.sqrt(agents.y * 2)) == [2, np.sqrt(8), np.sqrt(12)]
+    assert list(agents.select(~(agents.x > 2) | (agents.y > 5)).id) == [1, 3]
+    with pytest.raises(ValueError):
+        bool(agents.x > 2)
+
+    # Lists are treated like arrays, and reflected operators are supported
+    assert list(agents.x + [1, 2, 3]) == [2.5, 5, 7.5]
+    assert list([1, 2, 3] * agents.y) == [2, 8, 18]
+    agents.n = ap.AttrIter([1, 2, 3])
+    assert list(2 ** agents.n) == [2, 4, 8]
+    assert list(7 // agents.n) == [7, 3, 2]
+    assert list(7 % agents.n) == [0, 1, 1]
+    m1, m2 = agents.n > 1, agents.n < 3
+    assert list(m1 ^ m2) == [True, False, True]
+    assert list(True & m1) == [False, True, True]
+    assert list(False | m2) == [True, True, False]
+    assert list(np.array([True, False, False]) ^ m1) == [True, True, True]
+
+    # Results are written directly into columnar storage
+    class Walker(ap.Agent):
+        columns = {'x': float}
+    walkers = ap.AgentList.from_arrays(model, Walker, x=[1., 2.])
+    walkers.y = ap.AttrIter([3., 4.])
+    view = walkers.x
+    walkers.x = walkers.y * 2 + 1
+    assert view.tolist() == [7, 9]
+
+
+def test_method_dispatch():
+
+    class Counter(ap.Agent):
+        def setup(self):
+            self.n = 0
+
+        def act(self, k=1):
+            self.n += k
+            return self.n
+
+    class Walker(ap.Agent):
+        columns = {'x': float}
+
+        @ap.batched
+        def act(agents, k=1):
+            agents.model.groups.append(len(agents))
+            agents.x += k
+            return agents.x.tolist()
+
+    model = ap.Model()
+    model.groups = []
+    agents = ap.AgentList(model, 2, Counter)
+    agents += ap.AgentList(model, 2, Walker)
+    agents.append(Counter(model))
+    agents[1].act = lambda k=1: 'own'
+
+    assert list(agents.act(k=2)) == [2, 'own', 2., 2., 2]
+    assert model.groups == [2]
+    assert agents.call('act') is None
+    assert [agents[i].n for i in (0, 4)] == [3, 3]
+    assert [agents[i].x for i in (2, 3)] == [3., 3.]
+    assert agents[2].act(1) == 4.
+    assert model.groups == [2, 2, 1]
+
+
 def test_remove():
     model = ap.Model()
     agents = ap.AgentList(model, 3, ap.Agent)
@@ -205,3 +332,98 @@ def test_remove():
     assert set(agents.id) == {1, 2, 3}
     agents.remove(next(iter(agents)))
     assert len(agents.id) == 2
+
+
+def test_from_arrays():
+    class Walker(ap.Agent):
+        columns = {'x': float}
+
+        def setup(self):
+            raise AssertionError("Setup should not be called")
+
+    model = ap.Model()
+    ap.Agent(model)
+    agents = ap.AgentList.from_arrays(
+        model, Walker, x=np.arange(3), y=[4, 5, 6], state='S')
+    assert list(agents.id) == [2, 3, 4]
+    assert model._id_counter == 4
+    assert agents.x.tolist() == [0, 1, 2]
+    assert list(agents.y) == [4, 5, 6]
+    assert type(agents[0].y) is int
+    assert list(agents.state) == ['S', 'S', 'S']
+    assert agents[1].type == 'Walker'
+    assert agents[1].p is model.p
+
+    agents = ap.AgentList.from_arrays(model, y=ap.AttrIter([1, 2]))
+    assert list(agents.y) == [1, 2]
+    assert type(agents[0]) is ap.Agent
+
+    with pytest.raises(AgentpyError):
+        ap.AgentList.from_arrays(model, x=1)
+    with pytest.raises(AgentpyError):
+        ap.AgentList.from_arrays(model, x=[1], y=[1, 2])
+
+
+def test_from_frame():
+    pd = pytest.importorskip('pandas')
+    model = ap.Model()
+    df = pd.DataFrame({'a': [1, 2], 'b': ['x', 'y']})
+    agents = ap.AgentList.from_frame(model, df)
+    assert list(agents.a) == [1, 2]
+    assert list(agents.b) == ['x', 'y']
+
+
+def test_agent_dlist():
+    model = ap.Model()
+    agents = ap.AgentDList(model, 5)
+    assert repr(agents) == "AgentDList (5 objects)"
+    assert list(agents.id) == [1, 2, 3, 4, 5]
+    assert agents[1] in agents
+
+    # Removal moves the last agent into the free position
+    agents.remove(agents[1])
+    assert list(agents.id) == [1, 5, 3, 4]
+    agents.append(agents[0])  # No duplicates
+    assert len(agents) == 4
+
+    agents.x = ap.AttrIter([1, 2, 3, 4])
+    assert list(agents.select(agents.x > 2).id) == [3, 4]
+    assert len(agents.random(2)) == 2
+    assert list(agents.sort('x', reverse=True).id) == [4, 3, 5, 1]
+    assert isinstance(agents + agents, ap.AgentDList)
+
+
+def test_agent_dlist_iteration():
+
+    class Mortal(ap.Agent):
+        def step(self):
+            if self.id % 2:
+                self.model.agents.remove(self)
+            if self.id == 2:
+                self.model.agents.append(Mortal(self.model))
+
+    model = ap.Model()
+    model.agents = ap.AgentDList(model, 6, Mortal)
+    third = model.agents[2]
+    visited = []
+    for agent in model.agents:
+        visited.append(agent.id)
+        agent.step()
+        if agent.id == 2:
+            model.agents.remove(third)  # Not visited
+        assert len(model.agents._removed) > 0
+    assert visited == [1, 2, 4, 5, 6]
+    assert list(model.agents.id) == [7, 2, 6, 4]
+    assert model.agents._removed == []
+    assert model.agents.item_to_position[model.agents[3]] == 3
+
+    # Nested iteration compacts after the outer loop
+    for a in model.agents:
+        for b in model.agents:
+            if b is not a and b in model.agents:
+                model.agents.remove(b)
+    assert len(model.agents) == 1
+    assert len(model.agents.items) == 1
+
+    shuffled = ap.AgentDListIter(model, ap.AgentDList(model, 10), shuffle=True)
+    assert sorted(a.id for a in shuffled) == list(range(8, 18))
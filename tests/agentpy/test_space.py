@@ -2,6 +2,8 @@ import pytest
 import agentrs.agentpy as ap
 import numpy as np
 import scipy
+from agentrs.agentpy.space import _counting_sort
+from agentrs.agentpy.tools import AgentpyError
 
 
 def make_space(s, n=0, torus=False):
@@ -93,3 +95,235 @@ def test_positions():
     # Movement over border
     space.move_by(a2, (-3, 1.1))
     assert list(space.positions[a2]) == [1, 1]
+
+
+def test_position_matrix():
+    model = ap.Model()
+    agents = ap.AgentList(model, 20)
+    space = ap.Space(model, (10, 10))
+    space.add_agents(agents, np.arange(40).reshape(20, 2) % 10)
+    assert space.positions[agents[3]].tolist() == [6, 7]
+    assert np.shares_memory(space.kdtree.data, space._pos)  # No copy
+
+    # Removed agents are replaced by the last row
+    space.remove_agents(agents[3])
+    assert space.positions[agents[-1]].tolist() == [8, 9]
+    assert list(space.agents)[3] is agents[-1]
+    assert len(space.positions) == 19
+    assert agents[3] not in space.positions
+    assert len(space.select((6, 7), 0.1)) == 3
+    assert agents[-1] in list(space.select((8, 9), 0.1))
+
+
+def test_stored_positions():
+    model = ap.Model()
+    agents = ap.AgentList(model, 3)
+    space = ap.Space(model, (10, 10))
+    space.add_agents(agents, [(1, 1), (2, 2), (3, 3)])
+    for agent in agents:
+        agent.pos = space.positions[agent]
+
+    # Stored positions stay correct after rows are reallocated or swapped
+    space.add_agents(ap.AgentList(model, 30), random=True)
+    space.remove_agents(agents[0])
+    space.move_by(agents[2], (1, 0))
+    assert agents[1].pos.tolist() == [2, 2]
+    assert agents[2].pos.tolist() == [4, 3]
+    assert np.linalg.norm(agents[2].pos - agents[1].pos) == np.sqrt(5)
+    assert np.array([a.pos for a in agents[1:]]).shape == (2, 2)
+
+    # Assigned coordinates move the agent
+    agents[1].pos += (1, 20)
+    agents[2].pos[0] = -1
+    assert space.positions[agents[1]].tolist() == [3, 10]
+    assert space.positions[agents[2]].tolist() == [0, 3]
+    assert agents[1] in space.select((3, 10), 0.1)
+
+
+@pytest.mark.parametrize('torus', [False, True])
+def test_move_agents(torus):
+    model = ap.Model()
+    agents = ap.AgentList(model, 3)
+    space = ap.Space(model, (2, 2), torus=torus)
+    space.add_agents(agents, [(0, 0), (1, 1), (1.5, 0.5)])
+    space.move_agents_by(space.agents, (1, -1))
+    expected = [[1, 0], [2, 0], [2, 0]] if not torus \
+        else [[1, 1], [0, 0], [0.5, 1.5]]
+    assert [space.positions[a].tolist() for a in agents] == expected
+
+    space.move_agents(agents[1:], [(0.5, 0.5), (3, -1e-20)])
+    assert space.positions[agents[1]].tolist() == [0.5, 0.5]
+    assert space.positions[agents[2]].tolist() == \
+        ([1, 0] if torus else [2, 0])
+    assert len(space.neighbors(agents[1], 1)) == (2 if torus else 1)
+
+
+@pytest.mark.parametrize('torus', [False, True])
+def test_neighbors_all(torus):
+    model = ap.Model()
+    model.sim_setup(seed=4)
+    agents = ap.AgentList(model, 30)
+    space = ap.Space(model, (10, 10), torus=torus)
+    space.add_agents(agents, random=True)
+    space.add_agents(ap.AgentList(model, 2), [(0.5, 0.5), (0.5, 0.5)])
+    all_agents, indptr, indices, dist = space.neighbors_all(
+        3, return_distance=True)
+    assert list(all_agents) == list(space.agents)
+    for i, agent in enumerate(all_agents):
+        found = [all_agents[j] for j in indices[indptr[i]:indptr[i+1]]]
+        assert set(found) == set(space.neighbors(agent, 3))
+        assert agent not in found
+    assert np.all(dist <= 3)
+    assert 0 in dist  # Agents at the same position
+    assert np.all(np.diff(indices[indptr[0]:indptr[1]]) > 0)
+
+    empty = ap.Space(model, (1, 1))
+    _, indptr, indices = empty.neighbors_all(1)
+    assert indptr.tolist() == [0] and len(indices) == 0
+
+
+@pytest.mark.parametrize('torus', [False, True])
+def test_cell_index(torus):
+    model = ap.Model()
+    model.sim_setup(seed=5)
+    agents = ap.AgentList(model, 60)
+    space = ap.Space(model, (10, 8), torus=torus, cell_size=1.5)
+    reference = ap.Space(model, (10, 8), torus=torus, index='kdtree')
+    assert space._cells is not None and reference._cells is None
+    positions = model.nprandom.random((60, 2)) * (10, 8)
+    for s in (space, reference):
+        s.add_agents(agents, positions)
+        s.move_to(agents[0], (10, 8))
+        s.remove_agents(agents[1])
+
+    for step in range(3):
+        paths = model.nprandom.normal(size=(59, 2))
+        for s in (space, reference):
+            s.move_agents_by(s.agents, paths)
+            s.move_by(agents[2], (0.3, 0.3))
+        for agent in list(agents)[::7]:
+            for d in (0.5, 1.5, 4):
+                assert set(space.neighbors(agent, d)) == \
+                    set(reference.neighbors(agent, d))
+        assert list(space.select((5, 4), 2)) == sorted(
+            reference.select((5, 4), 2), key=lambda a: space._rows[a])
+        for d in (1, 3, 20):
+            result = space.neighbors_all(d, return_distance=True)
+            expected = reference.neighbors_all(d, return_distance=True)
+            for x, y in zip(result[1:], expected[1:]):
+                assert np.allclose(x, y)
+
+
+@pytest.mark.parametrize('n_keys', [1, 300, 2 ** 16, 2 ** 20])
+def test_counting_sort(n_keys):
+    keys = np.random.default_rng(1).integers(0, n_keys, 500)
+    order = _counting_sort(keys, n_keys)
+    assert order.tolist() == np.argsort(keys, kind='stable').tolist()
+
+
+def test_index_options():
+    model = ap.Model()
+    with pytest.raises(AgentpyError):
+        ap.Space(model, (1, 1), index='cells')
+    with pytest.raises(AgentpyError):
+        ap.Space(model, (1, 1), index='octree')
+    with pytest.raises(AgentpyError):
+        ap.Space(model, (1, 1), cell_size=0)
+    space = ap.Space(model, (10, 10), cell_size=20)
+    assert space._cells.n.tolist() == [1, 1]
+    agents = ap.AgentList(model, 3)
+    space.add_agents(agents, [(0, 0), (0, 1), (5, 5)])
+    assert list(space.neighbors(agents[0], 1)) == [agents[1]]
+
+
+@pytest.mark.parametrize('kwargs', [{}, {'cell_size': 2}, {'torus': True}])
+def test_verlet_lists(kwargs):
+    model = ap.Model()
+    model.sim_setup(seed=6)
+    agents = ap.AgentList(model, 80)
+    space = ap.Space(model, (10, 10), **kwargs)
+    space.add_agents(agents, model.nprandom.random((80, 2)) * 10)
+    space.neighbors_all(1, skin=0.5)
+    built = space._verlet
+
+    for step in range(6):
+        space.move_agents_by(agents, model.nprandom.normal(
+            scale=0.02, size=(80, 2)))
+        result = space.neighbors_all(1, return_distance=True, skin=0.5)
+        expected = space.neighbors_all(1, return_distance=True)
+        for x, y in zip(result[1:], expected[1:]):
+            assert np.allclose(x, y)
+    assert space._verlet is built  # List has been reused
+
+    space.move_by(agents[0], (0.3, 0))
+    space.neighbors_all(1, skin=0.5)
+    assert space._verlet is not built  # Agent moved more than skin / 2
+    built = space._verlet
+    space.neighbors_all(0.5, skin=0.5)
+    assert space._verlet is built  # Shorter distances can reuse the list
+    space.remove_agents(agents[1])
+    assert space._verlet is None
+    _, indptr, indices = space.neighbors_all(0, skin=0.5)
+    assert indptr[-1] == len(indices) == 0
+
+
+@pytest.mark.parametrize('torus', [False, True])
+def test_nearest(torus):
+    model = ap.Model()
+    agents = ap.AgentList(model, 4)
+    space = ap.Space(model, (10, 10), torus=torus)
+    space.add_agents(agents, [(1, 1), (2, 1), (9, 1), (5, 5)])
+    assert list(space.nearest(agents[0])) == [agents[1]]
+    nearest = list(space.nearest(agents[0], k=2))
+    assert nearest == ([agents[1], agents[2]] if torus
+                       else [agents[1], agents[3]])
+    assert list(space.nearest((5, 4), k=1)) == [agents[3]]
+    assert len(space.nearest(np.array([0, 0]), k=10)) == 4
+    assert len(space.nearest(agents[0], k=10)) == 3
+
+    all_agents, rows, dist = space.nearest_all(k=2, return_distance=True)
+    assert rows[:, 0].tolist() == [1, 0, 0 if torus else 3, 1]
+    assert dist[0, 0] == 1
+    assert np.all(np.diff(dist, axis=1) >= 0)
+    _, rows = space.nearest_all(k=4)
+    assert rows[:, -1].tolist() == [-1] * 4
+    _, rows = space.nearest_all(points=[(2, 2), (9, 9)])
+    assert rows.tolist() == [[1], [2 if torus else 3]]
+
+
+def test_nearest_coincident():
+    model = ap.Model()
+    agents = ap.AgentList(model, 3)
+    space = ap.Space(model, (1, 1))
+    space.add_agents(agents)  # All at the origin
+    _, rows = space.nearest_all(k=2)
+    assert [sorted(r) for r in rows.tolist()] == [[1, 2], [0, 2], [0, 1]]
+    assert len(ap.Space(model, (1, 1)).nearest((0, 0))) == 0
+
+
+@pytest.mark.parametrize('torus', [False, True])
+def test_select_box(torus):
+    model = ap.Model()
+    model.sim_setup(seed=7)
+    agents = ap.AgentList(model, 100)
+    space = ap.Space(model, (10, 10), torus=torus)
+    space.add_agents(agents, model.nprandom.random((100, 2)) * 10)
+    pos = space._pos[:100]
+
+    lower = np.array([(2, 3), (0, 0), (8, 1)])
+    upper = np.array([(4, 7), (10, 10), (9, 1.5)])
+    all_agents, indptr, indices = space.select_boxes(lower, upper)
+    for i in range(3):
+        inside = np.all((pos >= lower[i]) & (pos <= upper[i]), axis=1)
+        assert indices[indptr[i]:indptr[i+1]].tolist() == \
+            np.flatnonzero(inside).tolist()
+    assert set(space.select_box((2, 3), (4, 7))) == \
+        {all_agents[i] for i in indices[indptr[0]:indptr[1]]}
+
+    if torus:  # Box that wraps around the border
+        selected = space.select_box((9, 9), (1, 1))
+        inside = np.all((pos >= 9) | (pos <= 1), axis=1)
+        assert set(selected) == {agents[i] for i in np.flatnonzero(inside)}
+    _, indptr, indices = ap.Space(model, (1, 1)).select_boxes(
+        [(0, 0)], [(1, 1)])
+    assert indptr.tolist() == [0, 0]